@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'campsbaygallery.settings')
 
 application = get_asgi_application()
+
+# Parse the templates now rather than in the first requests (see gallery/warmup.py)
+from gallery.warmup import warm_on_boot  # noqa: E402
+
+warm_on_boot()
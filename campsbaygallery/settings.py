@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -42,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.humanize',
     'gallery',
     'django_countries',
 
@@ -57,7 +61,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gallery.middleware.StaticAssetMiddleware',
+    'gallery.middleware.MediaMiddleware',
+    'gallery.middleware.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Outside the session, CSRF and messages middleware so that it sees the
+    # cookies they set when deciding whether a response may be shared.
+    'gallery.middleware.CacheControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,9 +75,9 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
-    'gallery.middleware.CacheControlMiddleware',
     'gallery.middleware.SessionCleanupMiddleware',
     'gallery.middleware.CSRFProtectionMiddleware',
+    'gallery.middleware.ProfilingMiddleware',
 ]
 
 # Custom User Model
@@ -111,7 +121,9 @@ SOCIALACCOUNT_PROVIDERS = {
 }
 
 # Email Settings (for development - console)
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Sent through gallery.instrumentation, which times each send and hands it to
+# GALLERY_INSTRUMENTATION['EMAIL_BACKEND'] (SMTP)
+EMAIL_BACKEND = 'gallery.instrumentation.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -126,14 +138,51 @@ EMAIL_TIMEOUT = 10
 SITE_ID = 2
 SITE_DOMAIN = '127.0.0.1:8000'  # Change to your domain in production
 
-# For development/testing (uncomment this and comment the above if needed):
-# EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# For development/testing, set GALLERY_INSTRUMENTATION['EMAIL_BACKEND'] to
+# 'django.core.mail.backends.console.EmailBackend'
 
 # Crispy Forms
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+# Caches: one per concern (see gallery/caching.py). With REDIS_URL set they
+# share a Redis server under separate key prefixes. Per-process in-memory
+# caches are only for development and tests (DEBUG): with several workers
+# each would keep its own catalogue generation and serve stale pages.
+REDIS_URL = os.environ.get('REDIS_URL')
+CACHE_TIMEOUTS = {
+    'default': 300,
+    'catalogue': 60 * 60,
+    'sessions': 60 * 60 * 24 * 14,
+    'fragments': 60 * 60 * 24,
+}
+if REDIS_URL:
+    CACHES = {
+        name: {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': f'gallery:{name}',
+            'TIMEOUT': timeout,
+        }
+        for name, timeout in CACHE_TIMEOUTS.items()
+    }
+elif DEBUG:
+    CACHES = {
+        name: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'gallery-{name}',
+            'TIMEOUT': timeout,
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+        for name, timeout in CACHE_TIMEOUTS.items()
+    }
+else:
+    raise ImproperlyConfigured('Set REDIS_URL: production needs a cache shared by every worker process.')
+
 # Session settings
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Sessions are read through the shared cache only when there is one: a
+# per-process cache would serve other workers' stale carts.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db' if REDIS_URL else 'django.contrib.sessions.backends.db'
+SESSION_CACHE_ALIAS = 'sessions'
 SESSION_COOKIE_AGE = 1209600  # 2 weeks
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_SAVE_EVERY_REQUEST = True
@@ -176,10 +225,19 @@ ROOT_URLCONF = 'campsbaygallery.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # django.template.backends.django.DjangoTemplates, timing each render
+        # for the request instrumentation (see gallery/instrumentation.py)
+        'BACKEND': 'gallery.instrumentation.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Parsed templates are kept per process; in development Django's
+            # autoreloader resets the cache whenever a template changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -194,6 +252,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'campsbaygallery.wsgi.application'
 
+# Parse every gallery template when a worker boots (see gallery/warmup.py)
+GALLERY_PREWARM_TEMPLATES = not DEBUG
+
 
 # Database
 DATABASES = {
@@ -235,9 +296,118 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'gallery/static'),
 ]
 
+# collectstatic bundles, minifies, hashes and precompresses outside DEBUG, and
+# StaticAssetMiddleware serves the result with year-long immutable caching
+# (see gallery/assets.py). In development runserver serves the sources.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # Artwork and artist images: stored once per distinct content (see gallery/storage.py)
+    'media': {'BACKEND': 'gallery.storage.ContentAddressedStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'gallery.assets.CompressedManifestStorage',
+    },
+}
+GALLERY_SERVE_STATIC = not DEBUG
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Media files (Uploaded images)
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Media is served by gallery.middleware.MediaMiddleware (see gallery/media.py).
+# Behind nginx set GALLERY_MEDIA_ACCEL=x-accel-redirect (or x-sendfile for
+# Apache) so the proxy streams the files; otherwise Django sends them itself.
+GALLERY_MEDIA = {
+    'ACCEL': os.environ.get('GALLERY_MEDIA_ACCEL') or None,
+    'ACCEL_PREFIX': '/_media/',
+    'MAX_AGE': 3600,
+}
+
+# manage.py sweep_media: orphaned uploads are quarantined once they are a day
+# old and deleted a week later (see gallery/sweeper.py)
+GALLERY_MEDIA_SWEEPER = {
+    'MIN_AGE_HOURS': 24,
+    'QUARANTINE_DAYS': 7,
+}
+
+# manage.py ingest_remote_images: local, resized copies of image_url targets
+# (see gallery/ingest.py)
+GALLERY_IMAGE_INGEST = {
+    'WORKERS': 8,
+    'MAX_BYTES': 15 * 1024 * 1024,
+    'MAX_DIMENSION': 1600,
+}
+
+
+# Interaction event capture (see gallery/events.py)
+GALLERY_EVENTS = {
+    'SINK': 'db',           # 'db' (InteractionEvent table) or 'jsonl'
+    'PATH': 'events.jsonl',
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 5.0,
+}
+
+# Related-artwork refreshes after feature edits are queued for
+# `manage.py build_recommendations --pending` (cron, every few minutes; see
+# gallery/recommendations.py). Under DEBUG they run when the save commits.
+GALLERY_RECOMMENDATIONS = {
+    'QUEUE': not DEBUG,
+}
+
+# Per-request SQL/template/cache/email timings (see gallery/instrumentation.py)
+GALLERY_INSTRUMENTATION = {
+    'SERVER_TIMING': 'owners',   # also shown to everyone when DEBUG is on
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_SAMPLE_RATE': 0.1,
+    'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+}
+
+# Prometheus-style metrics served at /metrics/ (see gallery/metrics.py).
+# With several gunicorn workers, point MULTIPROCESS_DIR at a shared directory.
+GALLERY_METRICS = {
+    'MULTIPROCESS_DIR': os.environ.get('PROMETHEUS_MULTIPROC_DIR'),
+    'SYNC_INTERVAL': 10.0,
+    # Prometheus sends it as "Authorization: Bearer <token>"; unset, only owners can scrape
+    'TOKEN': os.environ.get('GALLERY_METRICS_TOKEN'),
+}
+
+# Owner-only ?_profile=1 (HTML) and ?_profile=collapsed (flame graph) reports
+# (see gallery/profiling.py). Set ENABLED to False to remove the middleware.
+GALLERY_PROFILING = {
+    'ENABLED': True,
+    'SAMPLE_INTERVAL': 0.001,
+}
+
+# JSON logs through a background queue (see gallery/log.py). Request summaries
+# and cart events are sampled (not at all under DEBUG, where runserver already
+# prints each request); warnings and errors are always kept. `manage.py test`
+# only shows warnings and errors.
+TESTING = sys.argv[1:2] == ['test']
+GALLERY_LOG_LEVEL = os.environ.get('GALLERY_LOG_LEVEL', 'WARNING' if TESTING else 'INFO')
+GALLERY_LOG_SAMPLE_RATE = float(os.environ.get('GALLERY_LOG_SAMPLE_RATE', '0' if DEBUG else '0.1'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'gallery.log.JSONFormatter'},
+    },
+    'filters': {
+        'sample_info': {'()': 'gallery.log.SamplingFilter', 'rate': GALLERY_LOG_SAMPLE_RATE},
+    },
+    'handlers': {
+        'json': {
+            'class': 'gallery.log.BackgroundStreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'gallery': {'handlers': ['json'], 'level': GALLERY_LOG_LEVEL, 'propagate': False},
+        'gallery.requests': {'filters': ['sample_info']},
+        'gallery.cart': {'filters': ['sample_info']},
+    },
+}
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'campsbaygallery.settings')
 
 application = get_wsgi_application()
+
+# Parse the templates now rather than in the first requests (see gallery/warmup.py)
+from gallery.warmup import warm_on_boot  # noqa: E402
+
+warm_on_boot()
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, UserProfile, OTP, Artist, Artwork
+from .models import User, UserProfile, OTP, Artist, Artwork, Order, OrderItem, Term
 
 # Custom User Admin
 class CustomUserAdmin(UserAdmin):
@@ -119,9 +119,38 @@ class ArtworkAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
 
 
+# ORDER ADMIN
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    readonly_fields = ('artwork', 'artist', 'title', 'artist_name', 'medium', 'quantity', 'list_price', 'sale_price')
+    can_delete = False
+
+    def get_queryset(self, request):
+        # Artwork.__str__ includes the artist's name
+        return super().get_queryset(request).select_related('artwork__artist', 'artist')
+
+
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'first_name', 'last_name', 'email', 'total', 'status', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('reference', 'email', 'first_name', 'last_name')
+    readonly_fields = ('reference', 'user', 'subtotal', 'shipping', 'tax', 'total', 'created_at')
+    inlines = [OrderItemInline]
+
+
+# TAXONOMY ADMIN
+class TermAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'slug')
+    list_filter = ('kind',)
+    search_fields = ('name', 'slug')
+
+
 # Register models
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(OTP, OTPAdmin)
 admin.site.register(UserProfile, UserProfileAdmin)
 admin.site.register(Artist, ArtistAdmin)  # Add this line
-admin.site.register(Artwork, ArtworkAdmin)
\ No newline at end of file
+admin.site.register(Artwork, ArtworkAdmin)
+admin.site.register(Order, OrderAdmin)
+admin.site.register(Term, TermAdmin)
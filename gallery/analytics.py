@@ -0,0 +1,251 @@
+"""
+Owner analytics backed by incremental rollup tables.
+
+Checkout and artwork status changes push small deltas into SalesRollup and
+InventoryRollup (see gallery/signals.py), so the analytics dashboard reads a
+few hundred pre-aggregated rows instead of scanning every order and artwork.
+``rebuild_rollups()`` recomputes both tables from scratch and is exposed as
+``manage.py rebuild_analytics`` for repairing drift after bulk updates.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Q, Sum
+from django.utils import timezone
+
+from .models import Artwork, InventoryRollup, Order, SalesRollup
+
+ZERO = Decimal('0.00')
+
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def month_start(value):
+    """First day of the (local) month containing a datetime"""
+    return timezone.localtime(value).date().replace(day=1)
+
+
+def medium_key(medium):
+    """Normalised grouping key for a free-text medium"""
+    medium = (medium or '').strip()
+    return (medium.lower() or 'unspecified'), (medium or 'Unspecified')
+
+
+def _bump(model, lookup, defaults=None, **deltas):
+    """Add deltas to the rollup row matching lookup, creating it if missing"""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **(defaults or {}), **deltas)
+    except IntegrityError:
+        # Another worker created the row first; apply the delta to it.
+        model.objects.filter(**lookup).update(**updates)
+
+
+# ============================================================================
+# SALES ROLLUP
+# ============================================================================
+
+def _order_buckets(order):
+    """({(dimension, key): deltas}, {(dimension, key): label}) for one order"""
+    buckets = defaultdict(lambda: {'orders': 0, 'items_sold': 0, 'revenue': ZERO,
+                                   'list_value': ZERO, 'discount_total': ZERO})
+    labels = {('total', 'all'): 'All sales'}
+
+    for item in order.items.all():
+        artist_key = str(item.artist_id) if item.artist_id else 'unknown'
+        med_key, med_label = medium_key(item.medium)
+        labels[('artist', artist_key)] = item.artist_name or 'Unknown artist'
+        labels[('medium', med_key)] = med_label
+
+        for bucket in (('total', 'all'), ('artist', artist_key), ('medium', med_key)):
+            row = buckets[bucket]
+            row['items_sold'] += item.quantity
+            row['revenue'] += item.sale_price * item.quantity
+            row['list_value'] += item.list_price * item.quantity
+            row['discount_total'] += item.discount * item.quantity
+
+    # Every bucket an order touches counts that order once
+    for row in buckets.values():
+        row['orders'] = 1
+    return buckets, labels
+
+
+def record_order(order, sign=1):
+    """Apply an order to the sales rollups (sign=-1 reverses a cancelled order)"""
+    month = month_start(order.created_at)
+    buckets, labels = _order_buckets(order)
+
+    for (dimension, key), row in buckets.items():
+        lookup = {'month': month, 'dimension': dimension, 'key': key}
+        if sign > 0:
+            _bump(SalesRollup, lookup, defaults={'label': labels[(dimension, key)]}, **row)
+            continue
+        # A reversal only subtracts from a row that holds the order; a missing
+        # or short row (rollups out of step) is recounted from the orders.
+        reversed_row = SalesRollup.objects.filter(
+            **lookup, orders__gte=row['orders'], items_sold__gte=row['items_sold'],
+        ).update(**{field: F(field) - value for field, value in row.items()})
+        if not reversed_row:
+            rebuild_sales_bucket(month, dimension, key)
+
+
+def rebuild_sales_bucket(month, dimension, key):
+    """Recount one SalesRollup row from the placed orders of its month"""
+    start = timezone.make_aware(datetime.combine(month, time.min))
+    end = timezone.make_aware(datetime.combine((month + timedelta(days=32)).replace(day=1), time.min))
+    orders = Order.objects.filter(status='placed', created_at__gte=start, created_at__lt=end)
+
+    totals, label = None, None
+    for order in orders.prefetch_related('items').iterator(chunk_size=500):
+        buckets, labels = _order_buckets(order)
+        row = buckets.get((dimension, key))
+        if row is None:
+            continue
+        label = labels[(dimension, key)]
+        if totals is None:
+            totals = dict(row)
+        else:
+            for field, value in row.items():
+                totals[field] += value
+
+    lookup = {'month': month, 'dimension': dimension, 'key': key}
+    if totals is None:
+        SalesRollup.objects.filter(**lookup).delete()
+    else:
+        SalesRollup.objects.update_or_create(**lookup, defaults={'label': label, **totals})
+
+
+# ============================================================================
+# INVENTORY ROLLUP
+# ============================================================================
+
+def inventory_state(artwork):
+    """Snapshot of the fields the inventory rollup groups and sums by"""
+    return {
+        'availability': artwork.availability,
+        'sold': artwork.sold,
+        'is_active': artwork.is_active,
+        'value': artwork.display_price or ZERO,
+    }
+
+
+def apply_inventory_change(old_state, new_state):
+    """Move an artwork between inventory buckets (either state may be None)"""
+    if old_state == new_state:
+        return
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        _bump(
+            InventoryRollup,
+            {'availability': state['availability'], 'sold': state['sold'],
+             'is_active': state['is_active']},
+            artwork_count=sign,
+            total_value=state['value'] * sign,
+        )
+
+
+# ============================================================================
+# FULL REBUILD
+# ============================================================================
+
+@transaction.atomic
+def rebuild_rollups():
+    """Recompute every rollup row from the Order and Artwork tables"""
+    SalesRollup.objects.all().delete()
+    InventoryRollup.objects.all().delete()
+
+    orders = Order.objects.filter(status='placed').prefetch_related('items')
+    for order in orders.iterator(chunk_size=500):
+        record_order(order)
+
+    totals = defaultdict(lambda: {'artwork_count': 0, 'total_value': ZERO})
+    fields = ('availability', 'sold', 'is_active', 'price', 'discounted_price')
+    for row in Artwork.objects.values_list(*fields).iterator(chunk_size=2000):
+        availability, sold, is_active, price, discounted_price = row
+        bucket = totals[(availability, sold, is_active)]
+        bucket['artwork_count'] += 1
+        bucket['total_value'] += discounted_price or price or ZERO
+
+    InventoryRollup.objects.bulk_create([
+        InventoryRollup(availability=availability, sold=sold, is_active=is_active, **values)
+        for (availability, sold, is_active), values in totals.items()
+    ])
+
+
+# ============================================================================
+# DASHBOARD QUERIES
+# ============================================================================
+
+def _average(total, count):
+    return (total / count).quantize(Decimal('0.01')) if count else ZERO
+
+
+def dashboard_summary(months=12, top=10):
+    """Everything the analytics dashboard shows, read from the rollup tables"""
+    today = timezone.localdate()
+    year, month = today.year, today.month - (months - 1)
+    while month < 1:
+        month += 12
+        year -= 1
+    since = today.replace(year=year, month=month, day=1)
+
+    sales = SalesRollup.objects.filter(month__gte=since)
+
+    monthly = list(sales.filter(dimension='total').order_by('month'))
+    for row in monthly:
+        row.average_discount = _average(row.discount_total, row.items_sold)
+
+    def top_rows(dimension):
+        return list(
+            sales.filter(dimension=dimension)
+            .values('key')
+            .annotate(
+                label=Max('label'),
+                items_sold=Sum('items_sold'),
+                revenue=Sum('revenue'),
+                discount_total=Sum('discount_total'),
+            )
+            .order_by('-revenue')[:top]
+        )
+
+    totals = sales.filter(dimension='total').aggregate(
+        orders=Sum('orders'),
+        items_sold=Sum('items_sold'),
+        revenue=Sum('revenue'),
+        list_value=Sum('list_value'),
+        discount_total=Sum('discount_total'),
+    )
+    totals = {key: value or 0 for key, value in totals.items()}
+
+    inventory = list(InventoryRollup.objects.filter(artwork_count__gt=0)
+                     .order_by('availability', 'sold'))
+    stock = InventoryRollup.objects.filter(is_active=True).aggregate(
+        sold_count=Sum('artwork_count', filter=Q(sold=True)),
+        total_count=Sum('artwork_count'),
+        unsold_value=Sum('total_value', filter=Q(sold=False)),
+    )
+    sold_count = stock['sold_count'] or 0
+    total_count = stock['total_count'] or 0
+
+    return {
+        'since': since,
+        'monthly_sales': monthly,
+        'sales_by_artist': top_rows('artist'),
+        'sales_by_medium': top_rows('medium'),
+        'totals': totals,
+        'average_discount': _average(Decimal(totals['discount_total']), totals['items_sold']),
+        'average_order_value': _average(Decimal(totals['revenue']), totals['orders']),
+        'inventory': inventory,
+        'inventory_value': stock['unsold_value'] or ZERO,
+        'sell_through_rate': round(sold_count * 100 / total_count, 1) if total_count else 0,
+        'sold_count': sold_count,
+        'artwork_count': total_count,
+    }
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class GalleryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gallery'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import events, popularity
+
+        events.register_listener(popularity.apply_events)
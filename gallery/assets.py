@@ -0,0 +1,341 @@
+"""
+Static asset pipeline.
+
+``CompressedManifestStorage`` is the production STATICFILES storage (see
+settings.STORAGES). During ``collectstatic`` it:
+
+1. builds the BUNDLES (concatenated CSS) from their parts,
+2. minifies the gallery's own CSS and JS,
+3. content-hashes every file and rewrites ``url()`` references (Django's
+   ManifestStaticFilesStorage), and
+4. writes ``.gz`` - and ``.br`` when the optional ``brotli`` package is
+   installed - next to every compressible file.
+
+``serve()`` (used by gallery.middleware.StaticAssetMiddleware) serves the
+result straight from STATIC_ROOT: the smallest encoding the client accepts,
+``immutable`` year-long caching for hashed names and a short max-age for the
+rest, so no CDN or front-end proxy is required.
+
+Templates reference bundles with ``{% static_bundle %}``
+(gallery/templatetags/gallery_assets.py); in development, when nothing is
+built, it links the parts one by one.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin, ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.http import FileResponse, HttpResponseNotAllowed, HttpResponseNotFound, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip siblings are written without it
+    brotli = None
+
+BUNDLES = {
+    'gallery/css/site.css': (
+        'gallery/css/base.css',
+        'gallery/css/header.css',
+        'gallery/css/components.css',
+    ),
+}
+
+MINIFY_PREFIX = 'gallery/'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.json', '.xml', '.html', '.map')
+MIN_COMPRESS_SIZE = 256          # bytes; below this compression saves next to nothing
+IMMUTABLE = 'public, max-age=31536000, immutable'
+MUTABLE = 'public, max-age=60'
+
+
+# ============================================================================
+# MINIFIERS
+# ============================================================================
+
+CSS_TOKENS = re.compile(
+    r'(?P<string>"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')|(?P<comment>/\*.*?\*/)', re.S
+)
+
+
+def _compact_css(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r'\s*([{};,>])\s*', r'\1', code)
+    return re.sub(r':\s+', ':', code).replace(';}', '}')
+
+
+def minify_css(text):
+    """Drop comments and redundant whitespace; strings are left untouched"""
+    out, position = [], 0
+    for match in CSS_TOKENS.finditer(text):
+        out.append(_compact_css(text[position:match.start()]))
+        if match.group('string'):
+            out.append(match.group('string'))
+        position = match.end()
+    out.append(_compact_css(text[position:]))
+    return ''.join(out).strip()
+
+
+CODE, LITERAL, COMMENT = 'c', 's', 'm'
+REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete', 'void',
+                  'throw', 'instanceof', 'yield', 'await'}
+
+
+def _scan_quoted(text, i, quote, classes):
+    """Mark a '...' / "..." string (or a /regex/) starting at ``i``; returns the index after it"""
+    n = len(text)
+    j, in_class = i + 1, False
+    while j < n and text[j] != '\n':
+        char = text[j]
+        if char == '\\':
+            j += 2
+            continue
+        if quote == '/' and char in '[]':
+            in_class = char == '['
+        elif char == quote and not in_class:
+            classes[i:j + 1] = LITERAL * (j + 1 - i)
+            return j + 1
+        j += 1
+    return None                          # unterminated on this line: not a literal after all
+
+
+def _classify_js(text):
+    """One of CODE, LITERAL or COMMENT for every character of ``text``.
+
+    Strings, template literals (with nested ``${...}``) and, heuristically,
+    regular expression literals are LITERAL; comments are COMMENT.
+    """
+    n = len(text)
+    classes = [CODE] * n
+    templates = []                       # open ${ depth of each enclosing template literal
+    previous = ''                        # last significant code token, for regex detection
+    i = 0
+    while i < n:
+        char = text[i]
+        if char == '`' or (char == '}' and templates and templates[-1] == 0):
+            if char == '}':
+                templates.pop()
+            j = i + 1
+            while j < n:
+                if text[j] == '\\':
+                    j += 2
+                    continue
+                if text[j] == '`':
+                    break
+                if text.startswith('${', j):
+                    templates.append(0)
+                    j += 1
+                    break
+                j += 1
+            end = min(j + 1, n)
+            classes[i:end] = LITERAL * (end - i)
+            i, previous = end, ')'
+            continue
+        if text.startswith('//', i):
+            end = text.find('\n', i)
+            end = n if end < 0 else end
+            classes[i:end] = COMMENT * (end - i)
+            i = end
+            continue
+        if text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            classes[i:end] = COMMENT * (end - i)
+            i = end
+            continue
+        if char in '\'"' or (char == '/' and (not previous or previous in REGEX_PRECEDERS
+                                                or previous in REGEX_KEYWORDS)):
+            end = _scan_quoted(text, i, char, classes)
+            if end is not None:
+                i, previous = end, ')'
+                continue
+        if char == '{' and templates:
+            templates[-1] += 1
+        elif char == '}' and templates:
+            templates[-1] -= 1
+        if char.isalnum() or char in '_$':
+            j = i
+            while j < n and (text[j].isalnum() or text[j] in '_$'):
+                j += 1
+            previous, i = text[i:j], j
+            continue
+        if not char.isspace():
+            previous = char
+        i += 1
+    return classes
+
+
+def minify_js(text):
+    """Line-level minification: indentation, blank lines and comment-only lines.
+
+    Line breaks are kept, so automatic semicolon insertion behaves as before,
+    and lines that continue a string or template literal are left untouched.
+    """
+    text = text.replace('\r\n', '\n')
+    classes = _classify_js(text)
+    lines, start = [], 0
+    while start <= len(text):
+        end = text.find('\n', start)
+        end = len(text) if end < 0 else end
+        line, kinds = text[start:end], classes[start:end]
+        starts_in = classes[start - 1] if start > 0 else CODE
+        ends_in = classes[end] if end < len(text) else CODE
+        start = end + 1
+        if starts_in == LITERAL:
+            lines.append(line)
+            continue
+        # Leading whitespace and comments go; so does a block comment left open at the end.
+        first = 0
+        while first < len(line) and (kinds[first] == COMMENT or (kinds[first] == CODE and line[first].isspace())):
+            first += 1
+        last = len(line)
+        if ends_in == COMMENT:
+            while last > first and kinds[last - 1] == COMMENT:
+                last -= 1
+        line = line[first:last]
+        if ends_in != LITERAL:
+            line = line.rstrip()
+        if line:
+            lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+# ============================================================================
+# STORAGE
+# ============================================================================
+
+def compress(path):
+    """Write .gz (and .br) siblings of the file at ``path``; returns their paths"""
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    written = []
+    candidates = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        candidates.append(('.br', brotli.compress(data)))
+    for suffix, compressed in candidates:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as handle:
+                handle.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    """Bundles, minifies, hashes and precompresses during collectstatic"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+
+        for name, parts in BUNDLES.items():
+            content = '\n'.join(self._read(paths, part) for part in parts)
+            self._replace(name, content)
+            paths[name] = (self, name)
+
+        for name in list(paths):
+            extension = os.path.splitext(name)[1]
+            if name.startswith(MINIFY_PREFIX) and extension in MINIFIERS:
+                self._replace(name, MINIFIERS[extension](self._read(paths, name)))
+                paths[name] = (self, name)
+
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+        for name in set(self.hashed_files) | set(self.hashed_files.values()):
+            path = self.path(name)
+            if name.endswith(COMPRESSIBLE) and os.path.getsize(path) >= MIN_COMPRESS_SIZE:
+                compress(path)
+
+    def _read(self, paths, name):
+        storage, path = paths[name]
+        with storage.open(path) as handle:
+            return handle.read().decode('utf-8')
+
+    def _replace(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(content.encode('utf-8')))
+
+
+def is_built():
+    """Whether static files come from a collectstatic build (bundles exist)"""
+    return isinstance(storages['staticfiles'], ManifestFilesMixin)
+
+
+# ============================================================================
+# SERVING
+# ============================================================================
+
+_immutable_names = None
+
+
+def _immutable():
+    global _immutable_names
+    if _immutable_names is None:
+        hashed = getattr(storages['staticfiles'], 'hashed_files', None) or {}
+        _immutable_names = frozenset(hashed.values())
+    return _immutable_names
+
+
+def accepted_encodings(header):
+    """Content codings the ``Accept-Encoding`` header accepts (q > 0); '*' included as given"""
+    accepted, refused = set(), set()
+    for item in (header or '').split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        (accepted if quality > 0 else refused).add(coding)
+    if '*' in accepted:
+        accepted |= {coding for coding in ('br', 'gzip') if coding not in refused}
+    return accepted - refused
+
+
+def serve(request, name):
+    """Response for the file ``name`` (relative to STATIC_ROOT)"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    try:
+        path = safe_join(settings.STATIC_ROOT, name)
+    except SuspiciousFileOperation:
+        return HttpResponseNotFound()
+    if not os.path.isfile(path):
+        return HttpResponseNotFound()
+
+    content_type, _ = mimetypes.guess_type(path)
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING'))
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in accepted and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, candidate
+            break
+
+    stat = os.stat(path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream')
+        response.headers.pop('Content-Disposition', None)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = IMMUTABLE if name in _immutable() else MUTABLE
+    return response
@@ -0,0 +1,292 @@
+"""
+Request-level benchmark harness.
+
+Drives the main visitor journeys (home, every artworks sort and filter, artist
+and artwork detail, cart and checkout) through the Django test client and
+records latency percentiles and query counts per scenario. ``run()`` returns
+a JSON-serialisable report with stable keys, so reports from two commits can
+be diffed directly or with ``manage.py run_benchmark --compare old.json``.
+
+Scenarios that write (cart and checkout) run inside a transaction that is
+rolled back after every iteration, so the catalogue is left untouched.
+Populate the database first with ``manage.py seed_catalogue``.
+
+``startup()`` measures cold starts instead: it boots fresh processes, with
+and without the template warm-up (gallery/warmup.py), and times the first
+request each of them serves.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from . import facets, warmup
+from .models import Artist, Artwork
+
+CHECKOUT_FORM = {
+    'first_name': 'Bench',
+    'last_name': 'Mark',
+    'email': 'benchmark@example.com',
+    'phone': '0210000000',
+    'address': '1 Victoria Road',
+    'city': 'Cape Town',
+    'country': 'ZA',
+    'province': 'Western Cape',
+    'postal_code': '8005',
+    'payment_method': 'card',
+}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(fraction * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+
+def _add_to_cart(client, artwork_ids):
+    for artwork_id in artwork_ids:
+        client.post(reverse('add_to_cart', args=[artwork_id]), {'action': 'add_to_cart'})
+
+
+def scenarios():
+    """Scenario dicts: name, method, path, data, prepare(client), writes"""
+    artworks_url = reverse('artworks')
+    found = [
+        {'name': 'home', 'path': reverse('home')},
+        {'name': 'artists', 'path': reverse('artists')},
+        {'name': 'artworks', 'path': artworks_url},
+        {'name': 'artworks page 5', 'path': f'{artworks_url}?page=5'},
+        {'name': 'artworks search', 'path': f'{artworks_url}?q=harbour'},
+        {'name': 'artworks price range', 'path': f'{artworks_url}?min_price=5000&max_price=20000'},
+    ]
+    for sort in ('newest', 'oldest', 'title_asc', 'title_desc', 'price_low', 'price_high', 'popular', 'trending'):
+        found.append({'name': f'artworks sort {sort}', 'path': f'{artworks_url}?sort={sort}'})
+
+    # One filter per facet, using the most common option so the page is full
+    for facet, group in facets.facet_counts({}).items():
+        if group['options']:
+            option = max(group['options'], key=lambda option: option['count'])
+            found.append({
+                'name': f'artworks filter {facet}',
+                'path': f"{artworks_url}?{facet}={option['value']}",
+            })
+
+    artist = (
+        Artist.objects.filter(is_active=True, artworks__is_active=True)
+        .order_by('id').first()
+    )
+    if artist:
+        found.append({'name': 'artist detail', 'path': reverse('artist_detail', args=[artist.id])})
+
+    for_sale = list(
+        Artwork.objects.filter(is_active=True, sold=False, availability__in=['available', 'at_gallery'])
+        .exclude(price=None).order_by('-created_at').values_list('id', flat=True)[:3]
+    )
+    if for_sale:
+        found += [
+            {'name': 'artwork detail', 'path': reverse('artwork_detail', args=[for_sale[0]])},
+            {
+                'name': 'add to cart',
+                'method': 'post',
+                'path': reverse('add_to_cart', args=[for_sale[0]]),
+                'data': {'action': 'add_to_cart'},
+                'writes': True,
+            },
+            {
+                'name': 'cart',
+                'path': reverse('cart'),
+                'prepare': lambda client: _add_to_cart(client, for_sale),
+            },
+            {
+                'name': 'checkout',
+                'path': reverse('checkout'),
+                'prepare': lambda client: _add_to_cart(client, for_sale),
+            },
+            {
+                'name': 'process checkout',
+                'method': 'post',
+                'path': reverse('process_checkout'),
+                'data': CHECKOUT_FORM,
+                'prepare': lambda client: _add_to_cart(client, for_sale),
+                'writes': True,
+            },
+        ]
+    return found
+
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+def _request(client, scenario):
+    method = getattr(client, scenario.get('method', 'get'))
+    with CaptureQueriesContext(connection) as captured:
+        start = time.perf_counter()
+        response = method(scenario['path'], scenario.get('data'))
+        elapsed = time.perf_counter() - start
+    return response.status_code, elapsed * 1000, len(captured.captured_queries)
+
+
+def measure(scenario, iterations):
+    """Run one scenario ``iterations`` times (after a warm-up) and summarise it"""
+    if iterations < 1:
+        raise ValueError('iterations must be at least 1')
+    latencies, query_counts, statuses = [], [], set()
+    for iteration in range(iterations + 1):
+        with transaction.atomic():
+            client = Client()
+            if scenario.get('prepare'):
+                scenario['prepare'](client)
+            status, elapsed, queries = _request(client, scenario)
+            if scenario.get('writes') or scenario.get('prepare'):
+                transaction.set_rollback(True)
+        if iteration == 0:
+            continue
+        statuses.add(status)
+        latencies.append(elapsed)
+        query_counts.append(queries)
+
+    latencies.sort()
+    return {
+        'path': scenario['path'],
+        'method': scenario.get('method', 'get').upper(),
+        'status': sorted(statuses),
+        'iterations': iterations,
+        'latency_ms': {
+            'min': round(latencies[0], 2),
+            'p50': round(percentile(latencies, 0.50), 2),
+            'p90': round(percentile(latencies, 0.90), 2),
+            'p99': round(percentile(latencies, 0.99), 2),
+            'max': round(latencies[-1], 2),
+            'mean': round(statistics.fmean(latencies), 2),
+        },
+        'queries': {
+            'min': min(query_counts),
+            'median': statistics.median(query_counts),
+            'max': max(query_counts),
+        },
+    }
+
+
+OVERRIDES = {
+    'ALLOWED_HOSTS': ['*'],
+    # Keep interaction tracking and order emails out of the measurements.
+    'GALLERY_EVENTS': {'ENABLED': False},
+    'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+}
+
+
+def run(iterations=20, only=None, progress=None):
+    """Benchmark every scenario (or those whose name contains ``only``)"""
+    with override_settings(**OVERRIDES):
+        results = {}
+        for scenario in scenarios():
+            if only and only not in scenario['name']:
+                continue
+            results[scenario['name']] = measure(scenario, iterations)
+            if progress:
+                progress(scenario['name'], results[scenario['name']])
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'catalogue': {
+                'artists': Artist.objects.count(),
+                'artworks': Artwork.objects.count(),
+                'active_artworks': Artwork.objects.filter(is_active=True).count(),
+            },
+        },
+        'results': results,
+    }
+
+
+def compare(old, new):
+    """(name, old p50, new p50, old queries, new queries) rows for two reports"""
+    rows = []
+    for name, result in new['results'].items():
+        before = old['results'].get(name)
+        rows.append((
+            name,
+            before['latency_ms']['p50'] if before else None,
+            result['latency_ms']['p50'],
+            before['queries']['median'] if before else None,
+            result['queries']['median'],
+        ))
+    return rows
+
+
+# ============================================================================
+# COLD START
+# ============================================================================
+
+STARTUP_PAGES = ('home', 'artworks', 'artists', 'about', 'contact')
+
+
+def startup_sample(warm):
+    """Run in a fresh process: optional warm-up, then the first request to each page"""
+    sample = {'warmup_ms': None, 'first_request_ms': {}, 'second_request_ms': {}}
+    with override_settings(**OVERRIDES):
+        # What wsgi.py does at boot: load the middleware, then (maybe) warm up.
+        get_wsgi_application()
+        if warm:
+            sample['warmup_ms'] = round(warmup.warm_urls()[1] + warmup.warm_templates()[1], 2)
+        client = Client()
+        for name in STARTUP_PAGES:
+            for key in ('first_request_ms', 'second_request_ms'):
+                start = time.perf_counter()
+                client.get(reverse(name))
+                sample[key][name] = round((time.perf_counter() - start) * 1000, 2)
+    return sample
+
+
+def startup(runs=5):
+    """Median first-request latency per page in fresh processes, cold and pre-warmed"""
+    report = {}
+    for mode in ('cold', 'warm'):
+        samples = []
+        for _ in range(runs):
+            command = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'benchmark_startup', '--child']
+            if mode == 'warm':
+                command.append('--warm')
+            # Request logs would share stdout with the child's JSON result.
+            env = {**os.environ, 'GALLERY_LOG_LEVEL': 'WARNING'}
+            output = subprocess.run(command, capture_output=True, text=True, check=True, env=env).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        report[mode] = {
+            'warmup_ms': statistics.median(s['warmup_ms'] for s in samples) if mode == 'warm' else None,
+            'first_request_ms': {
+                name: statistics.median(s['first_request_ms'][name] for s in samples) for name in STARTUP_PAGES
+            },
+            'second_request_ms': {
+                name: statistics.median(s['second_request_ms'][name] for s in samples) for name in STARTUP_PAGES
+            },
+        }
+    return {'meta': {'commit': git_commit(), 'runs': runs}, 'results': report}
@@ -0,0 +1,77 @@
+"""
+HTTP cache policy per view.
+
+CacheControlMiddleware picks a policy for each response without loading the
+session or the user, from (in order):
+
+1. a ``Cache-Control`` header the view already set (``never_cache``, the
+   admin, profiling reports) - left alone;
+2. the ``cache_policy`` decorator on the view, e.g. ``@cache_policy(PUBLIC, 600)``;
+3. ``CACHE_POLICIES`` in gallery/urls.py, keyed by URL name;
+4. ``PRIVATE`` for everything else.
+
+``PUBLIC`` responses may be stored by shared caches for ``max_age`` seconds,
+but only when the visitor has no session cookie and the response sets no
+cookie; otherwise (a cart, a login, a flash message) they fall back to
+``PRIVATE``. ``PRIVATE`` responses may only be kept by the browser and must be
+revalidated. ``NO_STORE`` responses (cart, checkout, auth forms) are never
+stored. Every response given a policy here carries ``Vary: Cookie``.
+"""
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+PUBLIC = 'public'
+PRIVATE = 'private'
+NO_STORE = 'no-store'
+
+DEFAULT_MAX_AGE = 300
+
+
+def cache_policy(policy, max_age=DEFAULT_MAX_AGE):
+    """Decorator: cache policy (and lifetime, for PUBLIC) of a view"""
+    def decorator(view):
+        view.cache_policy = (policy, max_age)
+        return view
+    return decorator
+
+
+def policy_for(request):
+    """(policy, max_age) for the view that handled ``request``"""
+    from .urls import CACHE_POLICIES
+
+    match = request.resolver_match
+    if match is None:
+        return PRIVATE, 0
+    policy = getattr(match.func, 'cache_policy', None)
+    if policy is None:
+        policy = CACHE_POLICIES.get(match.url_name, PRIVATE)
+    return policy if isinstance(policy, tuple) else (policy, DEFAULT_MAX_AGE)
+
+
+def shareable(request, response):
+    return (
+        request.method in ('GET', 'HEAD')
+        and response.status_code == 200
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and not response.cookies
+    )
+
+
+def apply(request, response):
+    if response.has_header('Cache-Control'):
+        return response
+
+    policy, max_age = policy_for(request)
+    if policy == PUBLIC and not shareable(request, response):
+        policy = PRIVATE
+
+    if policy == NO_STORE:
+        patch_cache_control(response, no_cache=True, no_store=True, must_revalidate=True)
+        response['Pragma'] = 'no-cache'
+        response['Expires'] = '0'
+    elif policy == PUBLIC:
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+    return response
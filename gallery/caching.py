@@ -0,0 +1,115 @@
+"""
+Shared cache tier.
+
+Each concern has its own named cache in ``settings.CACHES``: ``catalogue``
+(facet index and other catalogue-derived data), ``sessions`` and
+``fragments`` (rendered HTML). They are Redis caches with their own key
+prefix when ``REDIS_URL`` is set; per-process LocMemCaches are only allowed
+under DEBUG (development and tests), and settings refuse to load without
+Redis otherwise.
+
+Catalogue-derived entries are versioned by a generation counter kept in the
+catalogue cache: ``bump_generation()`` (called when an artwork or artist
+field the facets depend on is written, see gallery/signals.py) moves every
+reader on to new keys at once instead of deleting keys one by one; the old
+entries simply expire.
+
+``get_or_compute()`` protects expensive entries from stampedes. A value is
+fresh for ``timeout`` seconds and then served stale for up to ``stale_for``
+more while a single caller, holding a short ``cache.add`` lock, recomputes
+it. When there is no value at all, one caller computes and the others wait
+briefly for its result rather than all hitting the database.
+"""
+import time
+
+from django.core.cache import caches
+
+from .instrumentation import record_cache
+
+CATALOGUE = 'catalogue'
+SESSIONS = 'sessions'
+FRAGMENTS = 'fragments'
+
+GENERATION_KEY = 'catalogue-generation'
+LOCK_TIMEOUT = 30        # seconds a recompute lock is held at most
+LOCK_WAIT = 2.0          # seconds a caller waits for someone else's recompute
+LOCK_POLL = 0.05
+
+
+def get_cache(name):
+    return caches[name]
+
+
+# ============================================================================
+# CATALOGUE GENERATION
+# ============================================================================
+
+def _seed():
+    # Past any generation still cached: counters only move up by one per write.
+    return int(time.time() * 1000)
+
+
+def generation():
+    """The current catalogue generation"""
+    cache = caches[CATALOGUE]
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # Never set, or evicted: a fresh start at 1 could reuse stale entries.
+        seed = _seed()
+        cache.add(GENERATION_KEY, seed, timeout=None)
+        value = cache.get(GENERATION_KEY, seed)
+    return value
+
+
+def bump_generation():
+    """Invalidate every generation-versioned entry"""
+    cache = caches[CATALOGUE]
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        value = _seed()
+        cache.set(GENERATION_KEY, value, timeout=None)
+        return value
+
+
+# ============================================================================
+# STAMPEDE PROTECTION
+# ============================================================================
+
+def _compute_and_store(cache, key, compute, timeout, stale_for, version):
+    value = compute()
+    cache.set(key, (time.time() + timeout, value), timeout + stale_for, version=version)
+    return value
+
+
+def get_or_compute(key, compute, timeout, stale_for=60, cache=CATALOGUE, versioned=True):
+    """Cached ``compute()`` with single-flight recompute and stale-while-revalidate"""
+    cache = caches[cache]
+    version = generation() if versioned else None
+    lock_key = f'{key}:lock'
+
+    entry = cache.get(key, version=version)
+    record_cache(entry is not None)
+    if entry is not None:
+        fresh_until, value = entry
+        if fresh_until > time.time() or not cache.add(lock_key, 1, LOCK_TIMEOUT, version=version):
+            return value   # fresh, or stale while another caller recomputes it
+        try:
+            return _compute_and_store(cache, key, compute, timeout, stale_for, version)
+        finally:
+            cache.delete(lock_key, version=version)
+
+    if cache.add(lock_key, 1, LOCK_TIMEOUT, version=version):
+        try:
+            return _compute_and_store(cache, key, compute, timeout, stale_for, version)
+        finally:
+            cache.delete(lock_key, version=version)
+
+    deadline = time.monotonic() + LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        entry = cache.get(key, version=version)
+        if entry is not None:
+            return entry[1]
+    # The other caller is slow or died holding the lock; compute it ourselves.
+    return _compute_and_store(cache, key, compute, timeout, stale_for, version)
@@ -1,5 +1,6 @@
 from django.conf import settings
-from .models import Artist
+from . import metrics
+from .models import Artist, Artwork
 
 
 # FILE: gallery/context_processors.py - Updated to handle sold items
@@ -12,27 +13,30 @@ def cart_context(request):
     cart_count = 0
     cart_items = []
     
-    for artwork_id, item_data in cart.items():
-        try:
-            # Check if artwork exists and is not sold
-            artwork = Artwork.objects.get(id=artwork_id, is_active=True)
-            if not artwork.sold:
-                cart_count += 1
-                cart_items.append({
-                    'artwork': {
-                        'id': artwork.id,
-                        'title': artwork.title,
-                        'price': float(artwork.price) if artwork.price else 0,
-                    }
-                })
-        except Artwork.DoesNotExist:
+    artworks = Artwork.objects.in_cart(cart)
+    for artwork_id in list(cart):
+        # Check if artwork exists and is not sold
+        artwork = artworks.get(str(artwork_id))
+        if artwork is None:
             # Remove invalid artwork from cart
-            if str(artwork_id) in cart:
-                del cart[str(artwork_id)]
-                request.session['cart'] = cart
+            del cart[artwork_id]
+            request.session['cart'] = cart
+        elif not artwork.sold:
+            cart_count += 1
+            cart_items.append({
+                'artwork': {
+                    'id': artwork.id,
+                    'title': artwork.title,
+                    'price': float(artwork.price) if artwork.price else 0,
+                }
+            })
     
-    # Update cart count in session
-    request.session['cart_count'] = cart_count
+    # Update cart count in session (only when it changed: writing it for
+    # every visitor would give everyone a session and make no page shareable)
+    if request.session.get('cart_count', 0) != cart_count:
+        request.session['cart_count'] = cart_count
+    if cart_count:
+        metrics.CART_SIZE.observe(cart_count)
     
     # Clear quick purchase from session if it's not being used
     if request.session.get('quick_purchase') and not request.path.startswith('/checkout'):
@@ -0,0 +1,270 @@
+"""
+Critical CSS for the landing templates.
+
+``manage.py extract_critical_css`` renders each page of ``page_paths()``
+(home, artworks and the newest artwork's detail page), collects the
+tags, classes and ids used above the fold (the header plus the first
+FOLD_ELEMENTS elements of ``<main>``) and keeps the rules of the site CSS
+bundle (gallery/assets.py BUNDLES) whose selectors only use those, along with
+their @media wrappers and the @keyframes they animate with. The result is
+written to gallery/static/gallery/css/critical/<page>.css and committed.
+
+The page templates put ``{% critical_css '<page>' %}`` in the ``stylesheets``
+block of base.html: it inlines that file in a ``<style>`` and loads the full
+bundle without blocking rendering (``rel=preload`` swapped to a stylesheet on
+load, with a ``<noscript>`` fallback). Until a page has been extracted the tag
+falls back to the normal blocking ``<link>``.
+
+``manage.py measure_render_blocking`` reports, per page, the bytes a browser
+has to fetch before it can render: the HTML up to ``</head>`` plus every
+render-blocking stylesheet and script, with and without the critical CSS.
+"""
+import functools
+import gzip
+import os
+import re
+from html.parser import HTMLParser
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.urls import reverse
+
+from .assets import BUNDLES, minify_css
+
+SITE_CSS = 'gallery/css/site.css'
+CRITICAL_DIR = 'gallery/css/critical'
+FOLD_ELEMENTS = 150          # elements of <main> treated as above the fold
+ALWAYS = {'html', 'body', 'main'}
+
+
+def page_paths():
+    """{page template name: URL} for the pages that get critical CSS"""
+    from .models import Artwork
+
+    paths = {'index': reverse('home'), 'artworks': reverse('artworks')}
+    artwork = Artwork.objects.filter(is_active=True).order_by('-created_at').values_list('id', flat=True).first()
+    if artwork:
+        paths['artwork_detail'] = reverse('artwork_detail', args=[artwork])
+    return paths
+
+
+def critical_path(page):
+    return os.path.join(apps.get_app_config('gallery').path, 'static', CRITICAL_DIR, f'{page}.css')
+
+
+# ============================================================================
+# ABOVE-THE-FOLD MARKUP
+# ============================================================================
+
+class FoldCollector(HTMLParser):
+    """Tags, classes and ids in the header and the first elements of <main>"""
+
+    def __init__(self, fold_elements=FOLD_ELEMENTS):
+        super().__init__()
+        self.tokens = set(ALWAYS)
+        self.fold_elements = fold_elements
+        self.in_body = False
+        self.in_main = False
+        self.main_elements = 0
+
+    @property
+    def done(self):
+        return self.main_elements >= self.fold_elements
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self.in_body = True
+        if not self.in_body or self.done:
+            return
+        if tag == 'main':
+            self.in_main = True
+        elif self.in_main:
+            self.main_elements += 1
+        self.tokens.add(tag)
+        for name, value in attrs:
+            if name == 'class' and value:
+                self.tokens.update(f'.{cls}' for cls in value.split())
+            elif name == 'id' and value:
+                self.tokens.add(f'#{value}')
+
+
+def fold_tokens(html, fold_elements=FOLD_ELEMENTS):
+    collector = FoldCollector(fold_elements)
+    collector.feed(html)
+    return collector.tokens
+
+
+# ============================================================================
+# CSS SELECTION
+# ============================================================================
+
+SIMPLE = re.compile(r'([.#]?-?[_a-zA-Z][\w-]*)|(\*)')
+ANIMATION = re.compile(r'animation(?:-name)?:([^;}]+)')
+
+
+def parse_blocks(css):
+    """Split minified CSS into (prelude, body) pairs; bodies of at-rules stay raw"""
+    blocks, position = [], 0
+    while position < len(css):
+        start = css.find('{', position)
+        if start == -1:
+            break
+        depth, end = 1, start + 1
+        while depth and end < len(css):
+            depth += {'{': 1, '}': -1}.get(css[end], 0)
+            end += 1
+        blocks.append((css[position:start].strip(), css[start + 1:end - 1]))
+        position = end
+    return blocks
+
+
+def _selector_matches(selector, tokens):
+    # Drop pseudo-classes/elements and attribute selectors, keep what the
+    # element itself must carry: its tag, classes and id.
+    selector = re.sub(r'\[[^\]]*\]', '', selector)
+    selector = re.sub(r'::?[\w-]+(\([^)]*\))?', '', selector)
+    for compound in re.split(r'[\s>+~]+', selector.strip()):
+        for name, star in SIMPLE.findall(compound):
+            if star or not name:
+                continue
+            if name not in tokens:
+                return False
+    return True
+
+
+def select_rules(css, tokens):
+    """Rules of ``css`` (minified) that can apply above the fold"""
+    kept, keyframes, animations = [], {}, set()
+    for prelude, body in parse_blocks(css):
+        if prelude.startswith('@keyframes'):
+            keyframes[prelude.split()[-1]] = f'{prelude}{{{body}}}'
+        elif prelude.startswith('@media') or prelude.startswith('@supports'):
+            inner = select_rules(body, tokens)
+            if inner:
+                kept.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            kept.append(f'{prelude}{{{body}}}')
+        else:
+            selectors = [selector for selector in prelude.split(',') if _selector_matches(selector, tokens)]
+            if selectors:
+                kept.append(f"{','.join(selectors)}{{{body}}}")
+                for match in ANIMATION.findall(body):
+                    animations.update(match.replace(',', ' ').split())
+    kept.extend(rule for name, rule in keyframes.items() if name in animations)
+    return ''.join(kept)
+
+
+def site_css():
+    """The site bundle's source CSS, minified"""
+    parts = []
+    for name in BUNDLES[SITE_CSS]:
+        with open(finders.find(name), encoding='utf-8') as handle:
+            parts.append(handle.read())
+    return minify_css('\n'.join(parts))
+
+
+def extract(client, pages=None):
+    """{page: critical CSS} for the rendered pages"""
+    css = site_css()
+    paths = page_paths()
+    result = {}
+    for page, path in paths.items():
+        if pages and page not in pages:
+            continue
+        html = client.get(path).content.decode('utf-8')
+        result[page] = select_rules(css, fold_tokens(html))
+    return result
+
+
+def write(result):
+    for page, css in result.items():
+        path = critical_path(page)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(css + '\n')
+
+
+def _read(page):
+    try:
+        with open(critical_path(page), encoding='utf-8') as handle:
+            return handle.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+_read_cached = functools.lru_cache(maxsize=None)(_read)
+
+
+def critical_for(page):
+    """Critical CSS of ``page``, or None when it has not been extracted"""
+    if not getattr(settings, 'GALLERY_CRITICAL_CSS', True):
+        return None
+    return _read(page) if settings.DEBUG else _read_cached(page)
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+class BlockingCollector(HTMLParser):
+    """Render-blocking stylesheets and scripts in <head>"""
+
+    def __init__(self):
+        super().__init__()
+        self.resources = []
+        self.head_end = None
+        self._in_noscript = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self.head_end is not None:
+            return
+        if tag == 'noscript':
+            self._in_noscript = True
+        elif tag == 'link' and attrs.get('rel') == 'stylesheet' and not self._in_noscript \
+                and attrs.get('media', 'all') in ('all', 'screen'):
+            self.resources.append(attrs['href'])
+        elif tag == 'script' and attrs.get('src') and 'async' not in attrs and 'defer' not in attrs:
+            self.resources.append(attrs['src'])
+
+    def handle_endtag(self, tag):
+        if tag == 'noscript':
+            self._in_noscript = False
+        elif tag == 'head' and self.head_end is None:
+            self.head_end = self.getpos()
+
+
+def _resource_bytes(url):
+    """(bytes, gzipped bytes) of a local static file, or None for external URLs"""
+    if not url.startswith(settings.STATIC_URL) and not url.startswith('/' + settings.STATIC_URL.lstrip('/')):
+        return None
+    name = url.split(settings.STATIC_URL.rstrip('/') + '/', 1)[-1]
+    path = finders.find(name) or os.path.join(settings.STATIC_ROOT, name)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    return len(data), len(gzip.compress(data))
+
+
+def measure(html):
+    """Bytes fetched before first render for one page's HTML"""
+    collector = BlockingCollector()
+    collector.feed(html)
+    head = html.split('</head>', 1)[0] + '</head>'
+    head_bytes = head.encode('utf-8')
+    raw, compressed, external = len(head_bytes), len(gzip.compress(head_bytes)), []
+    for url in collector.resources:
+        size = _resource_bytes(url)
+        if size is None:
+            external.append(url)
+            continue
+        raw += size[0]
+        compressed += size[1]
+    return {
+        'bytes': raw,
+        'gzip_bytes': compressed,
+        'blocking_resources': len(collector.resources),
+        'external': external,
+    }
@@ -0,0 +1,232 @@
+"""
+Batched capture of artwork interaction events.
+
+Views call ``track(request, 'view', artwork.id)``, which only appends a tuple
+to an in-memory buffer owned by the worker process. A background thread
+flushes the buffer every ``FLUSH_INTERVAL`` seconds, or as soon as it holds
+``BATCH_SIZE`` events, writing the whole batch with one bulk insert into
+InteractionEvent (or one append to a JSONL file). The request never waits on
+the database. A batch the sink fails to take goes back into the buffer and
+is retried at the next flush; beyond ``MAX_BUFFER`` the oldest events go.
+
+Configured through ``settings.GALLERY_EVENTS`` (read once, when the buffer is
+built); see DEFAULTS for the keys.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SINK': 'db',               # 'db' or 'jsonl'
+    'PATH': 'events.jsonl',     # used by the jsonl sink, relative to BASE_DIR
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 5.0,      # seconds
+    'MAX_BUFFER': 50000,        # events kept while the sink is unavailable (oldest dropped first)
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GALLERY_EVENTS', {})}
+
+
+# ============================================================================
+# SINKS
+# ============================================================================
+
+def db_sink(batch):
+    """Append a batch to the InteractionEvent table with one bulk insert"""
+    from .models import InteractionEvent
+
+    InteractionEvent.objects.bulk_create(
+        [
+            InteractionEvent(
+                event_type=event_type,
+                artwork_id=artwork_id,
+                user_id=user_id,
+                session_key=session_key,
+                created_at=created_at,
+            )
+            for event_type, artwork_id, user_id, session_key, created_at in batch
+        ],
+        batch_size=500,
+    )
+
+
+def jsonl_sink(batch):
+    """Append a batch to a JSON-lines file with a single write"""
+    path = os.path.join(settings.BASE_DIR, get_config()['PATH'])
+    lines = ''.join(
+        json.dumps({
+            'event_type': event_type,
+            'artwork_id': artwork_id,
+            'user_id': user_id,
+            'session_key': session_key,
+            'created_at': created_at.isoformat(),
+        }) + '\n'
+        for event_type, artwork_id, user_id, session_key, created_at in batch
+    )
+    with open(path, 'a', encoding='utf-8') as handle:
+        handle.write(lines)
+
+
+SINKS = {
+    'db': db_sink,
+    'jsonl': jsonl_sink,
+}
+
+
+# ============================================================================
+# BUFFER
+# ============================================================================
+
+class EventBuffer:
+    """Per-process event buffer drained by a background flusher thread"""
+
+    def __init__(self, sink, batch_size, flush_interval, max_buffer, enabled=True):
+        self.sink = sink
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.listeners = []
+        self.dropped = 0
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def add(self, event):
+        """Queue one event; never blocks on I/O"""
+        if self._pid != os.getpid():
+            self._start()
+        with self._lock:
+            if len(self._events) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._events.append(event)
+            full = len(self._events) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _start(self):
+        """Start the flusher thread (again, after a fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Events buffered before a fork belong to the parent process.
+            self._events = []
+            self._pid = os.getpid()
+        thread = threading.Thread(target=self._run, name='gallery-events', daemon=True)
+        thread.start()
+
+    def _run(self):
+        from django.db import close_old_connections
+
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            close_old_connections()
+
+    def flush(self):
+        """Write out everything buffered so far; returns the number of events"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._events = self._events, []
+            if not batch:
+                return 0
+            try:
+                self.sink(batch)
+            except Exception:
+                # Put the batch back for the next flush, ahead of newer events.
+                with self._lock:
+                    self._events = batch + self._events
+                    overflow = len(self._events) - self.max_buffer
+                    if overflow > 0:
+                        del self._events[:overflow]
+                        self.dropped += overflow
+                logger.exception('Interaction event sink failed; %d events kept for the next flush', len(batch))
+                return 0
+            for listener in self.listeners:
+                try:
+                    listener(batch)
+                except Exception:
+                    logger.exception('Interaction event listener %r failed', listener)
+            return len(batch)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+_listeners = []
+
+
+def register_listener(listener):
+    """Call ``listener(batch)`` after every successful flush (runs on the flusher thread)"""
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = get_config()
+                _buffer = EventBuffer(
+                    sink=SINKS[config['SINK']],
+                    batch_size=config['BATCH_SIZE'],
+                    flush_interval=config['FLUSH_INTERVAL'],
+                    max_buffer=config['MAX_BUFFER'],
+                    enabled=config['ENABLED'],
+                )
+                _buffer.listeners = _listeners
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+def flush():
+    """Synchronously flush this process's buffer (used by tests and shutdown)"""
+    return get_buffer().flush()
+
+
+@receiver(setting_changed)
+def reset_buffer(setting, **kwargs):
+    """Build the next buffer from the new settings (override_settings in tests)
+
+    The old buffer's flusher thread still writes out what it holds.
+    """
+    global _buffer
+    if setting == 'GALLERY_EVENTS':
+        with _buffer_lock:
+            _buffer = None
+
+
+# ============================================================================
+# PUBLIC API
+# ============================================================================
+
+def track(request, event_type, artwork_id):
+    """Record that the current visitor interacted with an artwork"""
+    buffer = get_buffer()
+    if not buffer.enabled:
+        return
+    session = getattr(request, 'session', None)
+    user_id = session.get('_auth_user_id') if session is not None else None
+    buffer.add((
+        event_type,
+        int(artwork_id),
+        int(user_id) if user_id else None,
+        (session.session_key or '') if session is not None else '',
+        timezone.now(),
+    ))
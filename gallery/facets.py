@@ -0,0 +1,238 @@
+"""
+Faceted navigation for the public artworks page.
+
+Each facet is counted with every *other* active filter applied, so the
+sidebar shows how many results picking that option would give. The counts
+for a filter selection come from one grouped query per facet (artist,
+availability, status, price band and decade on the artwork table; medium,
+style and theme through the taxonomy term tables) and are kept, per
+selection, in the shared catalogue cache, versioned by the catalogue
+generation that artwork and artist writes bump when a faceted field changes
+(see gallery/signals.py; a sale alone does not, so the Status counts may lag
+by up to CACHE_TIMEOUT).
+A cached entry is a few counts per facet value, whatever the catalogue size.
+
+Prices are bucketed on the stored, indexed ``Artwork.effective_price``. The
+numeric ``min_price``/``max_price`` range narrows the results but not the
+sidebar counts, which only know about price bands.
+"""
+import hashlib
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+
+from . import caching
+from .models import Artwork
+from .taxonomy import ARTWORK_KINDS, filter_artworks_by_terms
+
+CACHE_KEY = 'facet-counts'
+CACHE_TIMEOUT = 60 * 15
+
+# (band key, lower bound inclusive, upper bound exclusive, label)
+PRICE_BANDS = [
+    ('under-5k', 0, 5000, 'Under R5 000'),
+    ('5k-15k', 5000, 15000, 'R5 000 - R15 000'),
+    ('15k-50k', 15000, 50000, 'R15 000 - R50 000'),
+    ('50k-plus', 50000, None, 'R50 000 and above'),
+]
+
+FACETS = ('artist', 'medium', 'availability', 'sold', 'price', 'decade', 'style', 'theme')
+
+FACET_LABELS = {
+    'artist': 'Artist',
+    'medium': 'Medium',
+    'availability': 'Availability',
+    'sold': 'Status',
+    'price': 'Price',
+    'decade': 'Decade',
+    'style': 'Style',
+    'theme': 'Theme',
+}
+
+# Numeric price range parameters, applied to Artwork.effective_price
+PRICE_RANGE = ('min_price', 'max_price')
+
+# Facets backed by taxonomy terms; an artwork can carry several of each
+MULTI_VALUE_FACETS = {'medium', 'style', 'theme'}
+
+
+def price_band_expression():
+    whens = []
+    for index, (_key, low, high, _label) in enumerate(PRICE_BANDS):
+        condition = Q(effective_price__gte=low)
+        if high is not None:
+            condition &= Q(effective_price__lt=high)
+        whens.append(When(condition, then=Value(index)))
+    return Case(*whens, default=Value(None), output_field=IntegerField())
+
+
+# ============================================================================
+# FILTERS
+# ============================================================================
+
+def parse_filters(params):
+    """Selected facet values from a QueryDict, e.g. ?medium=Oil&medium=Bronze"""
+    filters = {}
+    for facet in FACETS:
+        values = {value for value in params.getlist(facet) if value and value != 'all'}
+        if values:
+            filters[facet] = values
+    for bound in PRICE_RANGE:
+        value = _parse_price(params.get(bound))
+        if value is not None:
+            filters[bound] = value
+    return filters
+
+
+def _parse_price(value):
+    try:
+        price = Decimal((value or '').replace(' ', '').replace(',', ''))
+    except InvalidOperation:
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
+def apply_filters(queryset, filters):
+    """Apply the parsed facet filters to an Artwork queryset"""
+    if 'artist' in filters:
+        queryset = queryset.filter(artist_id__in=[v for v in filters['artist'] if v.isdigit()])
+    if 'availability' in filters:
+        queryset = queryset.filter(availability__in=filters['availability'])
+    if 'sold' in filters and len(filters['sold']) == 1:
+        queryset = queryset.filter(sold=('1' in filters['sold']))
+    if 'price' in filters:
+        condition = Q()
+        for key, low, high, _label in PRICE_BANDS:
+            if key in filters['price']:
+                band = Q(effective_price__gte=low)
+                if high is not None:
+                    band &= Q(effective_price__lt=high)
+                condition |= band
+        queryset = queryset.filter(condition)
+    if 'decade' in filters:
+        condition = Q()
+        for decade in filters['decade']:
+            if decade.isdigit():
+                condition |= Q(year__gte=int(decade), year__lt=int(decade) + 10)
+        queryset = queryset.filter(condition)
+    if 'min_price' in filters:
+        queryset = queryset.filter(effective_price__gte=filters['min_price'])
+    if 'max_price' in filters:
+        queryset = queryset.filter(effective_price__lte=filters['max_price'])
+    for facet in sorted(MULTI_VALUE_FACETS):
+        if facet in filters:
+            queryset = filter_artworks_by_terms(queryset, facet, filters[facet])
+    return queryset
+
+
+# ============================================================================
+# COUNTS
+# ============================================================================
+
+def _term_counts(queryset, kind):
+    if kind in ARTWORK_KINDS:
+        path = 'artwork_terms__term'
+    else:
+        path = 'artist__artist_terms__term'
+    rows = (
+        queryset.filter(**{f'{path}__kind': kind})
+        .values_list(f'{path}__slug', f'{path}__name')
+        .annotate(total=Count('id', distinct=True))
+        .order_by()
+    )
+    counts, labels = {}, {}
+    for slug, name, total in rows:
+        counts[slug] = total
+        labels[slug] = name
+    return counts, labels
+
+
+def value_counts(queryset, facet):
+    """({value: artwork count}, {value: label}) of one facet over ``queryset``"""
+    if facet in MULTI_VALUE_FACETS:
+        return _term_counts(queryset, facet)
+    if facet == 'price':
+        queryset = queryset.annotate(_value=price_band_expression())
+    elif facet == 'decade':
+        queryset = queryset.annotate(_value=F('year') / 10 * 10)
+    else:
+        queryset = queryset.annotate(_value=F({'artist': 'artist_id'}.get(facet, facet)))
+    rows = queryset.values_list('_value').annotate(total=Count('id')).order_by()
+    counts = {}
+    for value, total in rows:
+        if value is None:
+            continue
+        if facet == 'price':
+            value = PRICE_BANDS[value][0]
+        elif facet == 'sold':
+            value = '1' if value else '0'
+        counts[str(value)] = total
+    return counts, {}
+
+
+def compute_counts(filters):
+    """Counts and term labels of every facet, each with the other facet filters applied"""
+    facet_filters = {facet: values for facet, values in filters.items() if facet in FACETS}
+    base = Artwork.objects.filter(is_active=True)
+    everything_else = apply_filters(base, facet_filters)
+    counts, labels = {}, {}
+    for facet in FACETS:
+        if facet in facet_filters:
+            others = {name: values for name, values in facet_filters.items() if name != facet}
+            queryset = apply_filters(base, others)
+        else:
+            queryset = everything_else
+        counts[facet], labels[facet] = value_counts(queryset, facet)
+    return {'counts': counts, 'labels': labels}
+
+
+def get_counts(filters):
+    """compute_counts() through the catalogue cache, one entry per facet selection"""
+    selection = repr([(facet, sorted(filters[facet])) for facet in FACETS if facet in filters])
+    key = f'{CACHE_KEY}:{hashlib.md5(selection.encode()).hexdigest()}'
+    return caching.get_or_compute(key, lambda: compute_counts(filters), CACHE_TIMEOUT)
+
+
+def _labels(facet, artists, index):
+    if facet in MULTI_VALUE_FACETS:
+        return index['labels'][facet]
+    if facet == 'artist':
+        return {str(artist.id): artist.full_name for artist in artists}
+    if facet == 'availability':
+        return dict(Artwork.AVAILABILITY_CHOICES)
+    if facet == 'sold':
+        return {'0': 'For sale', '1': 'Sold'}
+    if facet == 'price':
+        return {key: label for key, _low, _high, label in PRICE_BANDS}
+    return {}
+
+
+def facet_counts(filters, artists=()):
+    """Per-facet option lists: {'medium': [{'value', 'label', 'count', 'selected'}, ...]}"""
+    index = get_counts(filters)
+    result = {}
+    for facet in FACETS:
+        counts = index['counts'][facet]
+        labels = _labels(facet, artists, index)
+        selected = filters.get(facet, set())
+        if facet == 'price':
+            order = [key for key, *_rest in PRICE_BANDS]
+            ordered = [value for value in order if value in counts]
+        elif facet == 'decade':
+            ordered = sorted(counts, reverse=True)
+        else:
+            ordered = sorted(counts, key=lambda value: labels.get(value, value).lower())
+
+        options = []
+        for value in ordered:
+            label = labels.get(value, value)
+            if facet == 'decade':
+                label = f'{value}s'
+            options.append({
+                'value': value,
+                'label': label,
+                'count': counts[value],
+                'selected': value in selected,
+            })
+        result[facet] = {'label': FACET_LABELS[facet], 'options': options}
+    return result
@@ -0,0 +1,76 @@
+"""
+Rendered-fragment cache for artwork and artist cards.
+
+Grids render their cards through the ``artwork_cards`` and ``artist_cards``
+filters (gallery/templatetags/gallery_fragments.py), which call
+``render_cards``: one ``get_many`` on the ``fragments`` cache for the whole
+grid, a render of only the missing cards and one ``set_many`` to store them.
+
+A card's key is the object id, its ``updated_at`` (plus the artist's for
+artwork cards, which show the artist's name; they are the dicts built by
+views.artwork_card) and a hash of the card template, so editing an object or the template simply moves on to new keys.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from . import caching
+from .instrumentation import record_cache
+
+CARDS = {
+    'artwork': 'gallery/includes/_artwork_card.html',
+    'artist': 'gallery/includes/_artist_card.html',
+}
+
+
+def _stamp(value):
+    return value.strftime('%Y%m%d%H%M%S%f') if value else '0'
+
+
+def _template_version(template_name):
+    source = get_template(template_name).template.source
+    return hashlib.sha1(source.encode()).hexdigest()[:10]
+
+
+_cached_template_version = functools.lru_cache(maxsize=None)(_template_version)
+
+
+def template_version(template_name):
+    # Templates only change on deploy outside DEBUG; while developing, re-read them.
+    if settings.DEBUG:
+        return _template_version(template_name)
+    return _cached_template_version(template_name)
+
+
+def card_key(kind, obj, version):
+    if kind == 'artwork':
+        # views.artwork_card() dicts, which carry both timestamps
+        return f"artwork-card:{obj['id']}:{_stamp(obj['updated_at'])}:{_stamp(obj['artist_updated_at'])}:{version}"
+    return f'{kind}-card:{obj.pk}:{_stamp(obj.updated_at)}:{version}'
+
+
+def render_cards(kind, objects):
+    """Rendered card HTML for each object, in order"""
+    template_name = CARDS[kind]
+    objects = list(objects)
+    if not objects:
+        return []
+
+    cache = caching.get_cache(caching.FRAGMENTS)
+    version = template_version(template_name)
+    keys = [card_key(kind, obj, version) for obj in objects]
+    found = cache.get_many(keys)
+
+    missing = {}
+    for key, obj in zip(keys, objects):
+        if key not in found and key not in missing:
+            missing[key] = render_to_string(template_name, {kind: obj})
+    record_cache(True, len(keys) - len(missing))
+    record_cache(False, len(missing))
+    if missing:
+        cache.set_many(missing)
+        found.update(missing)
+    return [mark_safe(found[key]) for key in keys]
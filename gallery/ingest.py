@@ -0,0 +1,319 @@
+"""
+Local copies of remote ``image_url`` images.
+
+Artworks and artists without an uploaded image can point ``image_url`` at
+another host, which every visitor's browser would otherwise fetch on every
+page. ``manage.py ingest_remote_images`` (run it from cron) downloads those
+images with a bounded pool of threads, validates them and stores a resized
+derivative in ``cached_image`` (content-addressed, see gallery/storage.py),
+recording the URL it came from in ``cached_image_source``. ``primary_image``
+and ``Artist.image`` serve that copy while it matches the current
+``image_url`` and fall back to the remote URL otherwise.
+
+A download is rejected when:
+
+* the host resolves to a private, loopback or link-local address (unless
+  ``ALLOW_PRIVATE_HOSTS``; image URLs are user input); the connection then
+  goes to the address that was checked, so a second DNS answer cannot
+  point it elsewhere,
+* the response is not 200, its ``Content-Type`` is not in ``CONTENT_TYPES``,
+  or it is larger than ``MAX_BYTES`` (checked while streaming, not only from
+  ``Content-Length``), or
+* Pillow cannot decode it as one of those formats.
+
+A rejected URL is remembered (``cached_image_source`` set, ``cached_image``
+empty) and only retried with ``--retry-failed`` or once ``image_url`` changes.
+"""
+import http.client
+import io
+import ipaddress
+import logging
+import os
+import socket
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from urllib.error import URLError
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import storage
+
+logger = logging.getLogger('gallery.ingest')
+
+DEFAULTS = {
+    'WORKERS': 8,
+    'TIMEOUT': 10,                  # seconds per connection attempt and read
+    'MAX_BYTES': 15 * 1024 * 1024,
+    'MAX_DIMENSION': 1600,          # longest side of the stored derivative
+    'JPEG_QUALITY': 85,
+    'CONTENT_TYPES': ('image/jpeg', 'image/png', 'image/webp', 'image/gif'),
+    'ALLOW_PRIVATE_HOSTS': False,
+    'USER_AGENT': 'CampsBayGallery-ImageIngest/1.0',
+}
+
+PILLOW_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp', 'GIF': 'image/gif'}
+READ_CHUNK = 64 * 1024
+
+
+class IngestError(Exception):
+    """A remote image that cannot be used"""
+
+
+@dataclass
+class Fetched:
+    url: str
+    data: bytes = None
+    extension: str = None
+    error: str = None
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GALLERY_IMAGE_INGEST', {})}
+
+
+def targets():
+    """(model, has-upload field) pairs whose image_url is ingested"""
+    from .models import Artist, Artwork
+
+    return [(Artwork, 'image'), (Artist, 'profile_picture')]
+
+
+def pending(model, upload_field, retry_failed=False):
+    """Rows with an image_url and no upload whose local copy is missing or stale"""
+    queryset = (
+        model.objects.exclude(image_url='')
+        .filter(Q(**{upload_field: ''}) | Q(**{f'{upload_field}__isnull': True}))
+    )
+    stale = ~Q(cached_image_source=F('image_url'))
+    if retry_failed:
+        stale |= Q(cached_image='') | Q(cached_image__isnull=True)
+    return queryset.filter(stale).order_by('pk')
+
+
+# ============================================================================
+# DOWNLOADING
+# ============================================================================
+
+def _check_scheme(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise IngestError('only http(s) URLs are fetched')
+    return parts
+
+
+def _check_host(url, config):
+    """The address to connect to for ``url``, or None to let the socket resolve it
+
+    The caller must connect to the returned address rather than resolve the
+    name again: a second lookup may answer differently (DNS rebinding).
+    """
+    parts = _check_scheme(url)
+    if config['ALLOW_PRIVATE_HOSTS']:
+        return None
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or None,
+                                                               type=socket.SOCK_STREAM)]
+    except socket.gaierror as error:
+        raise IngestError(f'cannot resolve {parts.hostname}') from error
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or ip.is_multicast:
+            raise IngestError(f'{parts.hostname} resolves to a non-public address')
+    return addresses[0]
+
+
+class PinnedConnectionMixin:
+    """Connects to ``address`` while still sending the URL's host as ``Host``"""
+
+    def __init__(self, *args, address=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.address = address
+
+    def _open_socket(self):
+        return socket.create_connection((self.address or self.host, self.port), self.timeout, self.source_address)
+
+
+class PinnedHTTPConnection(PinnedConnectionMixin, http.client.HTTPConnection):
+    def connect(self):
+        self.sock = self._open_socket()
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class PinnedHTTPSConnection(PinnedConnectionMixin, http.client.HTTPSConnection):
+    """SNI and the certificate are still checked against the URL's host"""
+
+    def connect(self):
+        self.sock = self._context.wrap_socket(self._open_socket(), server_hostname=self.host)
+
+
+class PinnedHTTPHandler(urllib.request.HTTPHandler):
+    """Checks the host of every request (redirects included) and connects to the checked address"""
+
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+    def http_open(self, req):
+        return self.do_open(PinnedHTTPConnection, req, address=_check_host(req.full_url, self.config))
+
+
+class PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+    def https_open(self, req):
+        return self.do_open(PinnedHTTPSConnection, req, context=self._context,
+                            address=_check_host(req.full_url, self.config))
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Refuses redirects away from http(s); the connection handlers check the host"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        _check_scheme(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def download(url, config):
+    """The body of ``url``, validated against the size and type limits"""
+    _check_scheme(url)
+    # No proxies: the address check only means something for a direct connection.
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), PinnedHTTPHandler(config),
+                                         PinnedHTTPSHandler(config), CheckedRedirectHandler())
+    request = urllib.request.Request(url, headers={'User-Agent': config['USER_AGENT'], 'Accept': 'image/*'})
+    try:
+        with opener.open(request, timeout=config['TIMEOUT']) as response:
+            if response.status != 200:
+                raise IngestError(f'HTTP {response.status}')
+            content_type = response.headers.get_content_type()
+            if content_type not in config['CONTENT_TYPES']:
+                raise IngestError(f'unsupported content type {content_type}')
+            length = response.headers.get('Content-Length')
+            if length and length.isdigit() and int(length) > config['MAX_BYTES']:
+                raise IngestError(f'{length} bytes is over the limit')
+            body = io.BytesIO()
+            while True:
+                chunk = response.read(READ_CHUNK)
+                if not chunk:
+                    break
+                body.write(chunk)
+                if body.tell() > config['MAX_BYTES']:
+                    raise IngestError('body is over the size limit')
+            return body.getvalue()
+    except URLError as error:
+        raise IngestError(str(getattr(error, 'reason', error))) from error
+    except (OSError, ValueError) as error:
+        raise IngestError(str(error)) from error
+
+
+def derivative(data, config):
+    """(bytes, extension) of the stored copy: decoded, oriented and downscaled"""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in PILLOW_FORMATS or PILLOW_FORMATS[image.format] not in config['CONTENT_TYPES']:
+                raise IngestError(f'unsupported image format {image.format}')
+            image = ImageOps.exif_transpose(image)   # first frame of animations
+            image.thumbnail((config['MAX_DIMENSION'], config['MAX_DIMENSION']))
+            output = io.BytesIO()
+            if image.mode in ('RGBA', 'LA', 'P') and (image.mode != 'P' or 'transparency' in image.info):
+                image.save(output, 'PNG', optimize=True)
+                return output.getvalue(), '.png'
+            image.convert('RGB').save(output, 'JPEG', quality=config['JPEG_QUALITY'], optimize=True, progressive=True)
+            return output.getvalue(), '.jpg'
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as error:
+        raise IngestError(f'not a usable image: {error}') from error
+
+
+def fetch(url, config):
+    """Download and convert one URL; never raises for a bad image"""
+    try:
+        data, extension = derivative(download(url, config), config)
+    except IngestError as error:
+        return Fetched(url, error=str(error))
+    return Fetched(url, data=data, extension=extension)
+
+
+def fetch_all(urls, config):
+    """Yield a Fetched per URL, keeping at most 2 * WORKERS downloads queued"""
+    urls = iter(urls)
+    limit = config['WORKERS'] * 2
+    with ThreadPoolExecutor(max_workers=config['WORKERS'], thread_name_prefix='image-ingest') as pool:
+        running = set()
+        for url in urls:
+            running.add(pool.submit(fetch, url, config))
+            if len(running) >= limit:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in running:
+            yield future.result()
+
+
+# ============================================================================
+# STORING
+# ============================================================================
+
+def store(instance, fetched):
+    """Point ``instance`` at its new local copy (or record the failure)
+
+    Written with ``.update()``: ``save()`` would run ``full_clean()``, and one
+    legacy row that no longer validates must not stop the run. The blob
+    reference counts the save signals keep are adjusted here instead, and
+    ``updated_at`` still moves cached cards on to the local URL. Returns
+    False when ``image_url`` changed during the download (nothing written).
+    """
+    old_name = instance.cached_image.name or ''
+    new_name = ''
+    if fetched.data is not None:
+        name = os.path.basename(urlsplit(fetched.url).path) or 'image'
+        instance.cached_image.save(os.path.splitext(name)[0] + fetched.extension, ContentFile(fetched.data), save=False)
+        new_name = instance.cached_image.name
+    with transaction.atomic():
+        updated = type(instance).objects.filter(pk=instance.pk, image_url=fetched.url).update(
+            cached_image=new_name, cached_image_source=fetched.url, updated_at=timezone.now(),
+        )
+        if updated and new_name != old_name:
+            storage.acquire([new_name])
+            storage.release([old_name])
+    return bool(updated)
+
+
+def ingest(retry_failed=False, limit=None, config=None):
+    """Fetch every pending image_url; returns a summary dict"""
+    from . import caching
+
+    config = config or get_config()
+    summary = {'fetched': 0, 'failed': 0, 'stored_bytes': 0}
+    for model, upload_field in targets():
+        queryset = pending(model, upload_field, retry_failed)
+        if limit:
+            queryset = queryset[:limit]
+        rows = {}
+        for pk, url in queryset.values_list('pk', 'image_url').iterator(chunk_size=500):
+            rows.setdefault(url, []).append(pk)
+
+        for fetched in fetch_all(list(rows), config):
+            # Rows are re-read (and store() re-checks) so an image_url edited
+            # during the download is not overwritten.
+            for instance in model.objects.filter(pk__in=rows[fetched.url], image_url=fetched.url):
+                store(instance, fetched)
+            if fetched.error:
+                summary['failed'] += 1
+                logger.warning('Could not ingest %s: %s', fetched.url, fetched.error,
+                               extra={'url': fetched.url, 'model': model.__name__})
+            else:
+                summary['fetched'] += 1
+                summary['stored_bytes'] += len(fetched.data)
+
+    if summary['fetched'] or summary['failed']:
+        caching.bump_generation()
+    return summary
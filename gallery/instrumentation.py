@@ -0,0 +1,194 @@
+"""
+Per-request instrumentation.
+
+``RequestMetrics`` collects, for the request being handled, the resolved view
+name, SQL query count and time, template render time, cache hits and misses
+and outbound email time. gallery.middleware.RequestInstrumentationMiddleware
+creates one per request, logs it on the ``gallery.requests`` logger, adds a
+Server-Timing header and, for a sample of slow requests, logs every query.
+
+SQL is timed with a database execute wrapper. Template rendering is timed
+by the ``DjangoTemplates`` template backend (TEMPLATES 'BACKEND') and email
+by the ``EmailBackend`` (EMAIL_BACKEND), which sends through the backend named
+in ``EMAIL_BACKEND`` below; nothing of Django's is patched, and both only add
+a context variable lookup outside a request. Cache lookups are recorded by
+the code that makes them, with ``record_cache(hit)``. Lock errors, lock
+waits and email latency also go to gallery.metrics.
+
+Configured through ``settings.GALLERY_INSTRUMENTATION``; see DEFAULTS.
+"""
+import contextvars
+import re
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import DatabaseError
+from django.template.backends import django as django_backend
+
+from . import metrics
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': 'owners',   # True (everyone), 'owners' (owners and DEBUG) or False
+    'SLOW_REQUEST_MS': 500,
+    'SLOW_SAMPLE_RATE': 0.1,     # fraction of slow requests whose queries are logged
+    'MAX_QUERIES': 500,          # statements kept per request for the slow-request dump
+    'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',   # what EmailBackend sends with
+}
+
+# Lock timeouts and deadlocks as reported by SQLite, PostgreSQL and MySQL
+LOCK_ERROR = re.compile(r'database is locked|deadlock|lock timeout|could not obtain lock|Lock wait timeout', re.I)
+
+_current = contextvars.ContextVar('gallery_request_metrics', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GALLERY_INSTRUMENTATION', {})}
+
+
+class RequestMetrics:
+    """Counters for one request; times are in milliseconds"""
+
+    def __init__(self, max_queries):
+        self.started = time.perf_counter()
+        self.view_name = None
+        self.query_count = 0
+        self.query_ms = 0.0
+        self.queries = []
+        self.max_queries = max_queries
+        self.template_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.email_count = 0
+        self.email_ms = 0.0
+        self._render_depth = 0
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper: time every statement"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError as error:
+            if LOCK_ERROR.search(str(error)):
+                metrics.DB_LOCK_ERRORS.inc(alias=context['connection'].alias)
+            raise
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.query_count += 1
+            self.query_ms += elapsed
+            if len(self.queries) < self.max_queries:
+                self.queries.append((round(elapsed, 3), sql))
+            if 'FOR UPDATE' in sql:
+                metrics.DB_LOCK_WAIT_SECONDS.observe(elapsed / 1000, alias=context['connection'].alias)
+
+    def as_dict(self, total_ms):
+        return {
+            'view': self.view_name,
+            'duration_ms': round(total_ms, 2),
+            'queries': self.query_count,
+            'query_ms': round(self.query_ms, 2),
+            'template_ms': round(self.template_ms, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'emails': self.email_count,
+            'email_ms': round(self.email_ms, 2),
+        }
+
+    def server_timing(self, total_ms):
+        """Server-Timing header value"""
+        return ', '.join([
+            f'db;dur={self.query_ms:.1f};desc="{self.query_count} queries"',
+            f'tpl;dur={self.template_ms:.1f}',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f'mail;dur={self.email_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+
+
+def current():
+    """Metrics of the request being handled on this thread, or None"""
+    return _current.get()
+
+
+def activate(metrics):
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def record_cache(hit, count=1):
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += count
+        else:
+            metrics.cache_misses += count
+
+
+# ============================================================================
+# FRAMEWORK HOOKS
+# ============================================================================
+
+class Template(django_backend.Template):
+    """A template whose outermost render() is added to the request's template time"""
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        # Only the outermost render counts; nested renders are part of it.
+        metrics._render_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics._render_depth -= 1
+            if not metrics._render_depth:
+                metrics.template_ms += (time.perf_counter() - start) * 1000
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """The standard template backend, handing out timed templates"""
+
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+class EmailBackend(BaseEmailBackend):
+    """Times every send through the backend in GALLERY_INSTRUMENTATION['EMAIL_BACKEND']"""
+
+    def __init__(self, fail_silently=False, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        self.backend = get_connection(get_config()['EMAIL_BACKEND'], fail_silently=fail_silently, **kwargs)
+
+    def open(self):
+        return self.backend.open()
+
+    def close(self):
+        return self.backend.close()
+
+    def send_messages(self, email_messages):
+        result = 'error'
+        start = time.perf_counter()
+        try:
+            sent = self.backend.send_messages(email_messages)
+            result = 'sent'
+            return sent
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.EMAIL_SECONDS.observe(elapsed, result=result)
+            request_metrics = _current.get()
+            if request_metrics is not None:
+                request_metrics.email_count += len(email_messages)
+                request_metrics.email_ms += elapsed * 1000
@@ -0,0 +1,124 @@
+"""
+Structured, non-blocking logging.
+
+The gallery logs through one named logger per flow: ``gallery.checkout``,
+``gallery.email``, ``gallery.auth``, ``gallery.cart`` and the per-request
+``gallery.requests`` summaries (see gallery/middleware.py). ``settings.LOGGING``
+wires them to:
+
+* ``JSONFormatter`` - one JSON object per line, with every ``extra={...}``
+  field passed to the logging call as a top-level key.
+* ``BackgroundStreamHandler`` - a QueueHandler: the calling thread only puts
+  the record on an in-memory queue and a QueueListener thread formats and
+  writes it, so a slow stdout or log shipper never stalls a request.
+* ``SamplingFilter`` - keeps a fraction of INFO-and-below records on the
+  high-volume loggers; warnings and errors always pass. Kept records carry
+  ``sample_rate`` so counts can be scaled back up.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else came in through ``extra``.
+RESERVED = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and extras"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep ``rate`` of the records at ``level`` or below; pass everything above"""
+
+    def __init__(self, rate=1.0, level='INFO', name=''):
+        super().__init__(name)
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        if record.levelno > self.level or self.rate >= 1:
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class BackgroundStreamHandler(logging.handlers.QueueHandler):
+    """Queue records in the caller; write them to ``stream`` from a listener thread"""
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream)
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve the message and traceback now (arguments may change once
+        # the caller moves on) but leave the formatting to the listener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = (self.formatter or logging.Formatter()).formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the parent's listener thread is gone; start afresh.
+            self.queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def flush(self):
+        """Write everything queued so far (stops and restarts the listener)"""
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+                self._listener.start()
+        self.target.flush()
+
+    def close(self):
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+        self.target.close()
+        super().close()
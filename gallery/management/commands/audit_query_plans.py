@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from gallery.query_plans import audit
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN every query issued by the public catalogue pages and flag scans and sorts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the full report as JSON')
+        parser.add_argument('--plans', action='store_true', help='Show the plan of every query, not just flagged ones')
+
+    def handle(self, *args, **options):
+        report = audit()
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        total = 0
+        for page in report:
+            header = f"{page['label']} ({page['path']}): {page['query_count']} queries, HTTP {page['status']}"
+            style = self.style.WARNING if page['warnings'] else self.style.SUCCESS
+            self.stdout.write(style(header))
+            for query in page['queries']:
+                if not (query['warnings'] or options['plans']):
+                    continue
+                self.stdout.write(f"  {query['sql'][:200]}")
+                for line in query['plan'] if options['plans'] else query['warnings']:
+                    self.stdout.write(f'    {line}')
+            total += page['warnings']
+
+        summary = f'{total} plan warnings across {len(report)} pages.'
+        self.stdout.write(self.style.WARNING(summary) if total else self.style.SUCCESS(summary))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from gallery.models import Term
+from gallery.taxonomy import backfill
+
+
+class Command(BaseCommand):
+    help = 'Parse existing medium/style/theme text into normalised taxonomy terms'
+
+    def handle(self, *args, **options):
+        artists, artworks = backfill()
+        self.stdout.write(self.style.SUCCESS(
+            f'Linked {artists} artists and {artworks} artworks to {Term.objects.count()} terms.'
+        ))
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from gallery.benchmark import STARTUP_PAGES, startup, startup_sample
+
+
+class Command(BaseCommand):
+    help = 'Compare first-request latency of fresh processes with and without the template warm-up'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes per mode')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        # Internal: one measurement inside a freshly started process
+        parser.add_argument('--child', action='store_true', help='(internal)')
+        parser.add_argument('--warm', action='store_true', help='(internal)')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(startup_sample(options['warm'])))
+            return
+
+        report = startup(runs=options['runs'])
+        cold, warm = report['results']['cold'], report['results']['warm']
+        self.stdout.write(f"Template warm-up: {warm['warmup_ms']:.1f}ms (median of {options['runs']} processes)")
+        self.stdout.write(f"{'page':<12} {'cold first':>12} {'warm first':>12} {'steady':>10}")
+        for name in STARTUP_PAGES:
+            self.stdout.write(
+                f"{name:<12} {cold['first_request_ms'][name]:>10.1f}ms {warm['first_request_ms'][name]:>10.1f}ms "
+                f"{warm['second_request_ms'][name]:>8.1f}ms"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+                handle.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
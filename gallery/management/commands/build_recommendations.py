@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from gallery.recommendations import TOP_K, build_all, refresh_pending
+
+
+class Command(BaseCommand):
+    help = 'Precompute the related-artwork neighbours for every active artwork'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=TOP_K, help='Neighbours stored per artwork')
+        parser.add_argument('--pending', action='store_true',
+                            help='Only refresh the artworks queued by feature edits since the last run')
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            count = 0
+            while True:
+                batch = refresh_pending()
+                if not batch:
+                    break
+                count += batch
+            self.stdout.write(self.style.SUCCESS(f'Refreshed recommendations for {count} queued artworks.'))
+            return
+        count = build_all(k=options['k'])
+        self.stdout.write(self.style.SUCCESS(f'Built recommendations for {count} artworks.'))
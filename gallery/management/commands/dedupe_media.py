@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from gallery.storage import dedupe_existing
+
+
+class Command(BaseCommand):
+    help = 'Move existing artwork and artist images into content-addressed blobs, merging duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be merged')
+        parser.add_argument('--keep-originals', action='store_true', help='Leave the old files in place')
+
+    def handle(self, *args, **options):
+        summary = dedupe_existing(dry_run=options['dry_run'], keep_originals=options['keep_originals'])
+        prefix = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {summary.get('files', 0)} files into {summary.get('blobs', 0)} blobs "
+            f"({summary.get('duplicates', 0)} duplicates, {summary.get('bytes_saved', 0)} bytes saved, "
+            f"{summary.get('rows', 0)} rows updated, {summary.get('missing', 0)} missing files)."
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from gallery.benchmark import OVERRIDES
+from gallery.critical_css import critical_path, extract, write
+
+
+class Command(BaseCommand):
+    help = 'Extract above-the-fold CSS for the landing templates into gallery/static/gallery/css/critical/'
+
+    def add_arguments(self, parser):
+        parser.add_argument('pages', nargs='*', help='Only these pages (index, artworks, artwork_detail)')
+
+    def handle(self, *args, **options):
+        # Render with the full stylesheet so the markup is what visitors get.
+        with override_settings(GALLERY_CRITICAL_CSS=False, **OVERRIDES):
+            result = extract(Client(), options['pages'])
+        write(result)
+        for page, css in result.items():
+            self.stdout.write(f'{page:<16} {len(css.encode()):>7} bytes -> {critical_path(page)}')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from gallery.ingest import get_config, ingest
+
+
+class Command(BaseCommand):
+    help = 'Download image_url targets of artworks and artists and store local, resized copies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='Try URLs that failed before again')
+        parser.add_argument('--limit', type=int, help='At most this many rows per model')
+        parser.add_argument('--workers', type=int, help='Concurrent downloads (default: GALLERY_IMAGE_INGEST)')
+
+    def handle(self, *args, **options):
+        config = get_config()
+        if options['workers']:
+            config['WORKERS'] = options['workers']
+        summary = ingest(retry_failed=options['retry_failed'], limit=options['limit'], config=config)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {summary['fetched']} images ({summary['stored_bytes']} bytes); {summary['failed']} failed."
+        ))
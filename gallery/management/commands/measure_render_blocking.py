@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from gallery.benchmark import OVERRIDES
+from gallery.critical_css import measure, page_paths
+
+
+class Command(BaseCommand):
+    help = 'Report bytes fetched before first render per page, with and without critical CSS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        report = {}
+        for page, path in page_paths().items():
+            report[page] = {}
+            for mode, enabled in (('blocking', False), ('critical', True)):
+                with override_settings(GALLERY_CRITICAL_CSS=enabled, **OVERRIDES):
+                    html = Client().get(path).content.decode('utf-8')
+                report[page][mode] = measure(html)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, sort_keys=True))
+            return
+
+        self.stdout.write(f"{'page':<16} {'blocking CSS':>22} {'critical CSS':>22}   (raw / gzip bytes)")
+        for page, modes in report.items():
+            before, after = modes['blocking'], modes['critical']
+            self.stdout.write(
+                f"{page:<16} {before['bytes']:>10} / {before['gzip_bytes']:<9} "
+                f"{after['bytes']:>10} / {after['gzip_bytes']:<9}"
+            )
+        external = sorted({url for modes in report.values() for mode in modes.values() for url in mode['external']})
+        if external:
+            self.stdout.write(f"Not counted (external, render-blocking): {', '.join(external)}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from gallery.analytics import rebuild_rollups
+from gallery.models import InventoryRollup, SalesRollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute the analytics rollup tables from orders and artworks'
+
+    def handle(self, *args, **options):
+        rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {SalesRollup.objects.count()} sales rows and '
+            f'{InventoryRollup.objects.count()} inventory rows.'
+        ))
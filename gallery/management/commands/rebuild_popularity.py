@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from gallery.models import ArtworkPopularity
+from gallery.popularity import rebuild_from_events
+
+
+class Command(BaseCommand):
+    help = 'Recompute popular/trending scores from the interaction event log'
+
+    def handle(self, *args, **options):
+        rebuild_from_events()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt popularity for {ArtworkPopularity.objects.count()} artworks.'
+        ))
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gallery.benchmark import compare, run
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the public pages, cart and checkout and write a JSON latency/query report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--only', help='Only run scenarios whose name contains this text')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--compare', help='Print p50 and query changes against an earlier report')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        def progress(name, result):
+            self.stdout.write(
+                f"{name:<32} p50 {result['latency_ms']['p50']:>8.2f}ms  "
+                f"p90 {result['latency_ms']['p90']:>8.2f}ms  queries {result['queries']['median']}"
+            )
+
+        report = run(iterations=options['iterations'], only=options['only'], progress=progress)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+                handle.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as handle:
+                old = json.load(handle)
+            self.stdout.write(f"\nCompared with {old['meta'].get('commit') or options['compare']}:")
+            for name, old_p50, new_p50, old_queries, new_queries in compare(old, report):
+                if old_p50 is None:
+                    self.stdout.write(f'{name:<32} new scenario')
+                    continue
+                change = (new_p50 - old_p50) / old_p50 * 100 if old_p50 else 0
+                line = (f'{name:<32} p50 {old_p50:.2f} -> {new_p50:.2f}ms ({change:+.0f}%)  '
+                        f'queries {old_queries} -> {new_queries}')
+                style = self.style.WARNING if new_queries > old_queries or change > 20 else self.style.SUCCESS
+                self.stdout.write(style(line))
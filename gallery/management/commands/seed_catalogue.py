@@ -0,0 +1,172 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from gallery import caching, taxonomy
+from gallery.analytics import rebuild_rollups
+from gallery.models import Artist, Artwork, User
+from gallery.recommendations import build_all
+
+FIRST_NAMES = [
+    'Thandi', 'Sipho', 'Anke', 'Pieter', 'Lerato', 'Johan', 'Naledi', 'Marike', 'Zanele', 'David',
+    'Ayanda', 'Elsa', 'Kagiso', 'Ruth', 'Themba', 'Chloe', 'Bongani', 'Ilse', 'Mandla', 'Sarah',
+]
+LAST_NAMES = [
+    'Mokoena', 'van der Merwe', 'Dlamini', 'Botha', 'Nkosi', 'Pretorius', 'Khumalo', 'Smit',
+    'Ndlovu', 'Jacobs', 'Mthembu', 'Fourie', 'Zulu', 'Naidoo', 'Steyn', 'Petersen',
+]
+LOCATIONS = ['Cape Town', 'Johannesburg', 'Durban', 'Stellenbosch', 'Pretoria', 'Gqeberha', 'Knysna', 'Hermanus']
+MEDIUMS = [
+    'Oil on Canvas', 'Acrylic on Canvas', 'Watercolour', 'Charcoal', 'Bronze', 'Mixed Media',
+    'Ink on Paper', 'Photography', 'Linocut', 'Ceramic', 'Oil on Board', 'Pastel',
+]
+STYLES = ['Abstract', 'Figurative', 'Contemporary', 'Impressionist', 'Expressionist', 'Realist', 'Minimalist', 'Pop Art']
+THEMES = ['Landscape', 'Seascape', 'Portraiture', 'Identity', 'Urban Life', 'Wildlife', 'Botanical', 'Memory', 'Heritage']
+TITLE_WORDS = (
+    ['Quiet', 'Golden', 'Distant', 'Broken', 'Morning', 'Blue', 'Silent', 'Red', 'Winter', 'Hidden'],
+    ['Harbour', 'Tide', 'Mountain', 'Garden', 'Window', 'Figure', 'Road', 'Light', 'Shore', 'Field'],
+)
+AVAILABILITY_WEIGHTS = [('available', 70), ('at_gallery', 25), ('on_request', 5)]
+
+SEED_EMAIL_DOMAIN = 'seed.example.com'
+
+
+@contextmanager
+def keep_timestamps(*models):
+    """Let bulk_create store the created_at values we set instead of now()"""
+    fields = [model._meta.get_field('created_at') for model in models]
+    try:
+        for field in fields:
+            field.auto_now_add = False
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def pick_terms(rnd, vocabulary, most=2):
+    return ', '.join(rnd.sample(vocabulary, rnd.randint(1, most)))
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create a synthetic catalogue (artists, artworks, customers) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--artists', type=int, default=200)
+        parser.add_argument('--artworks', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1, help='Random seed, for repeatable catalogues')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--recommendations', action='store_true',
+                            help='Also build the related-artwork table (quadratic in catalogue size)')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        now = timezone.now()
+
+        owner = self.get_owner()
+        with transaction.atomic(), keep_timestamps(Artist, Artwork, User):
+            artists = self.create_artists(rnd, options['artists'], now, batch_size)
+            artworks = self.create_artworks(rnd, artists, owner, options['artworks'], now, batch_size)
+            users = self.create_users(rnd, options['users'], now, batch_size)
+
+        self.stdout.write('Rebuilding derived tables...')
+        taxonomy.backfill(batch_size)
+        rebuild_rollups()
+        caching.bump_generation()
+        if options['recommendations']:
+            build_all()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(artists)} artists, {artworks} artworks and {users} users.'
+        ))
+
+    def get_owner(self):
+        """Seeded artworks are created by an existing owner, or a seed owner account"""
+        owner = User.objects.filter(role='owner').order_by('id').first()
+        if owner is None:
+            owner = User.objects.create_user(
+                email=f'owner@{SEED_EMAIL_DOMAIN}', password='seed-password',
+                role='owner', is_email_verified=True,
+            )
+        return owner
+
+    def create_artists(self, rnd, count, now, batch_size):
+        return Artist.objects.bulk_create(
+            [
+                Artist(
+                    first_name=rnd.choice(FIRST_NAMES),
+                    last_name=rnd.choice(LAST_NAMES),
+                    location=rnd.choice(LOCATIONS),
+                    medium=pick_terms(rnd, MEDIUMS, 3),
+                    style=pick_terms(rnd, STYLES),
+                    theme=pick_terms(rnd, THEMES),
+                    bio='Synthetic artist created by seed_catalogue.',
+                    is_active=rnd.random() < 0.95,
+                    created_at=now - timedelta(days=rnd.randint(0, 1500)),
+                )
+                for _ in range(count)
+            ],
+            batch_size=batch_size,
+        )
+
+    def create_artworks(self, rnd, artists, owner, count, now, batch_size):
+        if not artists:
+            return 0
+        availabilities, weights = zip(*AVAILABILITY_WEIGHTS)
+        created = 0
+        while created < count:
+            batch = []
+            for _ in range(min(batch_size, count - created)):
+                availability = rnd.choices(availabilities, weights)[0]
+                price = Decimal(max(500, round(rnd.lognormvariate(9.6, 0.9), -2)))
+                if availability == 'on_request' and rnd.random() < 0.5:
+                    price = None
+                discounted = (price * Decimal('0.85')).quantize(Decimal('1')) if price and rnd.random() < 0.15 else None
+                batch.append(Artwork(
+                    artist=rnd.choice(artists),
+                    title=f'{rnd.choice(TITLE_WORDS[0])} {rnd.choice(TITLE_WORDS[1])} {rnd.randint(1, 999)}',
+                    availability=availability,
+                    price=price,
+                    discounted_price=discounted,
+                    sold=rnd.random() < 0.1,
+                    medium=rnd.choice(MEDIUMS),
+                    dimensions=f'{rnd.randint(20, 200)} x {rnd.randint(20, 200)} cm',
+                    year=rnd.randint(1960, now.year),
+                    description='Synthetic artwork created by seed_catalogue.',
+                    is_active=rnd.random() < 0.95,
+                    created_at=now - timedelta(minutes=rnd.randint(0, 60 * 24 * 1500)),
+                    created_by=owner,
+                ))
+            Artwork.objects.bulk_create(batch, batch_size=batch_size)
+            created += len(batch)
+            self.stdout.write(f'  {created}/{count} artworks')
+        return created
+
+    def create_users(self, rnd, count, now, batch_size):
+        # Hashing is deliberately slow, so every seeded user shares one hash.
+        password = make_password('seed-password')
+        start = User.objects.filter(email__endswith=f'@{SEED_EMAIL_DOMAIN}').count()
+        User.objects.bulk_create(
+            [
+                User(
+                    email=f'customer{start + number}@{SEED_EMAIL_DOMAIN}',
+                    first_name=rnd.choice(FIRST_NAMES),
+                    last_name=rnd.choice(LAST_NAMES),
+                    password=password,
+                    role='customer',
+                    is_email_verified=True,
+                    created_at=now - timedelta(days=rnd.randint(0, 1000)),
+                )
+                for number in range(count)
+            ],
+            batch_size=batch_size,
+        )
+        return count
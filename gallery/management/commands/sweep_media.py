@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from gallery import sweeper
+
+
+class Command(BaseCommand):
+    help = 'Quarantine media files no FileField references, and delete old quarantine runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be moved and deleted')
+        parser.add_argument('--min-age-hours', type=float, help='Leave files younger than this alone')
+        parser.add_argument('--quarantine-days', type=float, help='Delete quarantine runs older than this')
+        parser.add_argument('--skip-scan', action='store_true', help='Only purge old quarantine runs')
+        parser.add_argument('--restore', metavar='RUN', help='Put the files of a quarantine run back and exit')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            count = sweeper.restore(options['restore'])
+            self.stdout.write(self.style.SUCCESS(f"Restored {count} files from {options['restore']}."))
+            return
+
+        report = {}
+        if not options['skip_scan']:
+            report.update(sweeper.quarantine(dry_run=options['dry_run'], min_age_hours=options['min_age_hours']))
+        report.update(sweeper.purge(quarantine_days=options['quarantine_days'], dry_run=options['dry_run']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        if 'orphans' in report:
+            verb = 'Would quarantine' if options['dry_run'] else 'Quarantined'
+            count, size = (
+                (report['orphans'], report['orphan_bytes']) if options['dry_run']
+                else (report['quarantined'], report['quarantined_bytes'])
+            )
+            self.stdout.write(f"{verb} {count} orphaned files ({size} bytes) as run {report['run']}.")
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['reclaimed_bytes']} bytes from {len(report['purged_runs'])} quarantine runs."
+        ))
@@ -0,0 +1,217 @@
+"""
+Media delivery.
+
+``serve()`` (used by gallery.middleware.MediaMiddleware) answers every request
+under MEDIA_URL. It resolves the file inside MEDIA_ROOT, refusing dot-prefixed
+path segments (``.uploads/``, ``.quarantine/``), answers conditional requests
+(``If-None-Match`` / ``If-Modified-Since``) with 304 and then either:
+
+* hands the transfer to the front proxy, when ``GALLERY_MEDIA['ACCEL']`` is
+  ``'x-accel-redirect'`` (nginx) or ``'x-sendfile'`` (Apache mod_xsendfile,
+  lighttpd); the proxy streams the file and handles ``Range`` itself, or
+* streams it with ``FileResponse``, honouring a single-part ``Range`` (and
+  ``If-Range``) with 206. Under gunicorn the file goes out through
+  ``wsgi.file_wrapper`` and ``os.sendfile()``, without passing through Python.
+
+For nginx, the internal location matching ``ACCEL_PREFIX`` is::
+
+    location /_media/ {
+        internal;
+        alias /srv/campsbaygallery/media/;
+        expires 1h;
+    }
+
+A proxy serving MEDIA_URL itself (``SERVE`` False) needs the same rule as
+``serve()``: ``location ~ /\\. { deny all; }``.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed, HttpResponseNotFound, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.static import was_modified_since
+
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+DEFAULTS = {
+    'SERVE': True,                  # False leaves MEDIA_URL to the proxy (or to DEBUG's static())
+    'ACCEL': None,                  # None, X_ACCEL_REDIRECT or X_SENDFILE
+    'ACCEL_PREFIX': '/_media/',     # internal nginx location aliased to MEDIA_ROOT
+    'MAX_AGE': 3600,
+}
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GALLERY_MEDIA', {})}
+
+
+# ============================================================================
+# VALIDATORS AND RANGES
+# ============================================================================
+
+def etag_for(stat):
+    return quote_etag(f'{stat.st_size:x}-{int(stat.st_mtime * 1000000):x}')
+
+
+def _etag_matches(header, etag):
+    if header.strip() == '*':
+        return True
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match.
+    return any(tag.strip().removeprefix('W/') == etag for tag in header.split(','))
+
+
+def not_modified(request, stat, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    return not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime)
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single-part ``Range`` header.
+
+    Returns None to serve the whole file (no header, multiple or malformed
+    ranges) and raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+def _if_range_allows(request, stat, etag):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag            # strong comparison only
+    return parse_http_date_safe(if_range) == int(stat.st_mtime)
+
+
+class RangeFile:
+    """A file limited to ``length`` bytes from its current position.
+
+    ``fileno()``, ``seek()`` and ``tell()`` go to the real file, so gunicorn's
+    sendfile path (which sends Content-Length bytes from the current offset)
+    still applies; ``read()`` stops at the end of the range otherwise.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+# ============================================================================
+# SERVING
+# ============================================================================
+
+def _accel_response(config, name, path):
+    response = HttpResponse()
+    if config['ACCEL'] == X_ACCEL_REDIRECT:
+        response['X-Accel-Redirect'] = config['ACCEL_PREFIX'] + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    # Let the proxy pick the type from the file it sends.
+    del response['Content-Type']
+    return response
+
+
+def _file_response(request, path, stat, etag, content_type):
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), stat.st_size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range is not None and not _if_range_allows(request, stat, etag):
+        byte_range = None
+
+    handle = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(handle, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangeFile(handle, start, length), content_type=content_type, status=206)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response.headers.pop('Content-Disposition', None)
+    return response
+
+
+def serve(request, name):
+    """Response for the media file ``name`` (relative to MEDIA_ROOT)"""
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    if any(part.startswith('.') for part in name.replace('\\', '/').split('/')):
+        # .uploads (temporary files) and .quarantine (gallery/sweeper.py) are private.
+        return HttpResponseNotFound()
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+    except SuspiciousFileOperation:
+        return HttpResponseNotFound()
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return HttpResponseNotFound()
+    if not os.path.isfile(path):
+        return HttpResponseNotFound()
+
+    config = get_config()
+    etag = etag_for(stat)
+    if not_modified(request, stat, etag):
+        response = HttpResponseNotModified()
+    elif config['ACCEL']:
+        response = _accel_response(config, name, path)
+    else:
+        content_type, _ = mimetypes.guess_type(path)
+        response = _file_response(request, path, stat, etag, content_type or 'application/octet-stream')
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = f"public, max-age={config['MAX_AGE']}"
+    return response
@@ -0,0 +1,276 @@
+"""
+In-process metrics in the Prometheus text format.
+
+Counters and histograms live in a per-process registry; updating one is a
+lock, a bisect and a dict lookup, so hot paths (cart_context, every request
+through RequestInstrumentationMiddleware) can record freely. The ``metrics``
+view renders the registry for Prometheus to scrape; it answers owners and
+scrapers sending ``Authorization: Bearer <GALLERY_METRICS['TOKEN']>``.
+
+With several gunicorn workers each process only sees its own requests. Set
+``GALLERY_METRICS['MULTIPROCESS_DIR']`` to a directory shared by the workers:
+every process then writes a snapshot of its registry there every
+``SYNC_INTERVAL`` seconds (and at exit), and a scrape merges all snapshots,
+so any worker can answer it. Snapshots of exited workers keep counting, like
+prometheus_client's multiprocess mode; clear the directory on deploy.
+"""
+import atexit
+import bisect
+import hmac
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': os.environ.get('PROMETHEUS_MULTIPROC_DIR'),
+    'SYNC_INTERVAL': 10.0,    # seconds between snapshot writes
+    'TOKEN': None,            # bearer token for Prometheus; owners can always scrape
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 3, 5, 10, 20, 50)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GALLERY_METRICS', {})}
+
+
+def authorized(request):
+    """Owners, or a scraper presenting the configured bearer token"""
+    token = get_config()['TOKEN']
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and header.startswith('Bearer ') and hmac.compare_digest(header[7:].strip(), token):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and user.is_owner)
+
+
+# ============================================================================
+# METRIC TYPES
+# ============================================================================
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): self._copy(value) for key, value in self._values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, values):
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # one count per bucket plus +Inf, then the sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, values):
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        for key, state in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(bounds, state[:-1]):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': bound}, cumulative
+            yield f'{self.name}_sum', labels, state[-1]
+            yield f'{self.name}_count', labels, cumulative
+
+
+REGISTRY = {}
+
+
+def _register(metric):
+    REGISTRY[metric.name] = metric
+    return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+# ============================================================================
+# GALLERY METRICS
+# ============================================================================
+
+REQUESTS = counter('gallery_requests_total', 'Requests handled', ('view', 'method', 'status'))
+REQUEST_SECONDS = histogram('gallery_request_duration_seconds', 'Request latency', ('view', 'method'))
+DB_QUERIES = counter('gallery_db_queries_total', 'SQL statements executed during requests', ('view',))
+DB_CONNECTIONS = counter('gallery_db_connections_total', 'Database connections opened', ('alias',))
+DB_LOCK_ERRORS = counter('gallery_db_lock_errors_total', 'Statements that failed on a lock or deadlock', ('alias',))
+DB_LOCK_WAIT_SECONDS = histogram('gallery_db_lock_wait_seconds', 'Time spent in SELECT ... FOR UPDATE', ('alias',))
+CHECKOUTS = counter('gallery_checkouts_total', 'Checkout attempts by outcome', ('result',))
+EMAIL_SECONDS = histogram('gallery_email_send_seconds', 'Outbound email send latency', ('result',))
+CART_SIZE = histogram('gallery_cart_size', 'Items in non-empty carts per page view', buckets=SIZE_BUCKETS)
+CHECKOUT_CART_SIZE = histogram('gallery_checkout_cart_size', 'Items per completed checkout', buckets=SIZE_BUCKETS)
+
+
+# ============================================================================
+# MULTI-PROCESS AGGREGATION
+# ============================================================================
+
+def snapshot():
+    """This process's registry as a JSON-serialisable dict"""
+    return {name: metric.snapshot() for name, metric in REGISTRY.items()}
+
+
+class SnapshotWriter:
+    """Periodically writes this process's snapshot to the shared directory"""
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self._run, name='gallery-metrics', daemon=True).start()
+
+    def _run(self):
+        event = threading.Event()
+        while not event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        path = os.path.join(self.directory, f'gallery-{os.getpid()}.json')
+        temporary = f'{path}.tmp'
+        try:
+            with open(temporary, 'w', encoding='utf-8') as handle:
+                json.dump(snapshot(), handle)
+            os.replace(temporary, path)
+        except OSError:
+            logger.exception('Could not write metrics snapshot to %s', path)
+
+
+_writer = None
+
+
+def get_writer():
+    """The snapshot writer (started in this process), or None when multi-process mode is off"""
+    global _writer
+    if _writer is None:
+        config = get_config()
+        if not config['MULTIPROCESS_DIR']:
+            _writer = False
+        else:
+            _writer = SnapshotWriter(config['MULTIPROCESS_DIR'], config['SYNC_INTERVAL'])
+            atexit.register(_writer.write)
+    if _writer:
+        _writer.ensure_started()
+    return _writer or None
+
+
+def collect():
+    """{name: {label key: value}} merged over every process that reported"""
+    writer = get_writer()
+    if writer is None:
+        return snapshot()
+
+    writer.write()
+    merged = {}
+    for filename in os.listdir(writer.directory):
+        if not (filename.startswith('gallery-') and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(writer.directory, filename), encoding='utf-8') as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            continue  # a worker is replacing its file right now
+        for name, values in data.items():
+            metric = REGISTRY.get(name)
+            if metric is None:
+                continue
+            target = merged.setdefault(name, {})
+            for key, value in values.items():
+                target[key] = metric.merge(target.get(key), value)
+    return merged
+
+
+# ============================================================================
+# EXPOSITION
+# ============================================================================
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render():
+    """The registry in the Prometheus text exposition format (version 0.0.4)"""
+    data = collect()
+    lines = []
+    for name, metric in REGISTRY.items():
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        values = sorted((tuple(json.loads(key)), value) for key, value in data.get(name, {}).items())
+        for sample, labels, value in metric.samples(values):
+            label_text = ','.join(f'{label}="{_escape(text)}"' for label, text in labels.items())
+            lines.append(f'{sample}{{{label_text}}} {value}' if label_text else f'{sample} {value}')
+    return '\n'.join(lines) + '\n'
@@ -1,21 +1,24 @@
+import logging
+import random
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.utils.deprecation import MiddlewareMixin
 from django.contrib.sessions.models import Session
 from django.utils import timezone
 
+from . import assets, cache_policy, instrumentation, media, profiling
+from . import metrics as gallery_metrics
+
+request_logger = logging.getLogger('gallery.requests')
+
 class CacheControlMiddleware(MiddlewareMixin):
-    """Add cache control headers to responses"""
-    
+    """Cache-Control and Vary: Cookie from per-view rules (see gallery/cache_policy.py)"""
+
     def process_response(self, request, response):
-        # Add no-cache headers for authenticated users
-        if request.user.is_authenticated:
-            response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response['Pragma'] = 'no-cache'
-            response['Expires'] = '0'
-        else:
-            # Public pages can be cached for 5 minutes
-            response['Cache-Control'] = 'public, max-age=300'
-        
-        return response
+        return cache_policy.apply(request, response)
 
 
 class SessionCleanupMiddleware(MiddlewareMixin):
@@ -37,4 +40,117 @@ class CSRFProtectionMiddleware(MiddlewareMixin):
             # Generate new CSRF token
             from django.middleware.csrf import get_token
             get_token(request)
-        return None
\ No newline at end of file
+        return None
+
+class RequestInstrumentationMiddleware:
+    """Per-request SQL, template, cache and email timings (see gallery/instrumentation.py)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = instrumentation.get_config()
+        if not config['ENABLED']:
+            return self.get_response(request)
+
+        metrics = instrumentation.RequestMetrics(config['MAX_QUERIES'])
+        token = instrumentation.activate(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            instrumentation.deactivate(token)
+
+        total_ms = metrics.total_ms
+        if request.resolver_match is not None:
+            metrics.view_name = request.resolver_match.view_name
+        self.record(request, response, metrics, total_ms)
+        summary = metrics.as_dict(total_ms)
+        summary.update(method=request.method, path=request.path, status=response.status_code)
+        request_logger.info(
+            '%s %s %s %.1fms (%d queries)', request.method, request.path, response.status_code,
+            total_ms, metrics.query_count, extra={'metrics': summary},
+        )
+
+        if total_ms >= config['SLOW_REQUEST_MS'] and random.random() < config['SLOW_SAMPLE_RATE']:
+            request_logger.warning(
+                'Slow request %s %s took %.1fms', request.method, request.path, total_ms,
+                extra={'metrics': summary, 'sql': [
+                    {'ms': elapsed, 'sql': sql} for elapsed, sql in metrics.queries
+                ]},
+            )
+
+        if self.show_server_timing(config['SERVER_TIMING'], request):
+            response['Server-Timing'] = metrics.server_timing(total_ms)
+        return response
+
+    @staticmethod
+    def record(request, response, request_metrics, total_ms):
+        """Feed the Prometheus-style registry (see gallery/metrics.py)"""
+        view = request_metrics.view_name or 'unresolved'
+        gallery_metrics.get_writer()
+        gallery_metrics.REQUESTS.inc(view=view, method=request.method, status=response.status_code)
+        gallery_metrics.REQUEST_SECONDS.observe(total_ms / 1000, view=view, method=request.method)
+        gallery_metrics.DB_QUERIES.inc(request_metrics.query_count, view=view)
+
+    @staticmethod
+    def show_server_timing(setting, request):
+        if setting == 'owners':
+            if settings.DEBUG:
+                return True
+            # No session cookie, no owner: don't load a session and user just to find out.
+            if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+                return False
+            user = getattr(request, 'user', None)
+            return bool(user and user.is_authenticated and user.is_owner)
+        return bool(setting)
+
+
+class ProfilingMiddleware:
+    """Owner-only ``?_profile=1`` / ``?_profile=collapsed`` reports (see gallery/profiling.py)"""
+
+    def __init__(self, get_response):
+        if not profiling.get_config()['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mode = profiling.requested_mode(request)
+        if mode is None:
+            return None
+        return profiling.profile_view(request, view_func, view_args, view_kwargs, mode)
+
+
+class StaticAssetMiddleware:
+    """Serves the collectstatic build from STATIC_ROOT (see gallery/assets.py)"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'GALLERY_SERVE_STATIC', not settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.prefix):
+            return assets.serve(request, request.path_info[len(self.prefix):])
+        return self.get_response(request)
+
+
+class MediaMiddleware:
+    """Serves MEDIA_ROOT, or hands files to the front proxy (see gallery/media.py)"""
+
+    def __init__(self, get_response):
+        if not media.get_config()['SERVE']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = '/' + settings.MEDIA_URL.lstrip('/')
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.prefix):
+            return media.serve(request, request.path_info[len(self.prefix):])
+        return self.get_response(request)
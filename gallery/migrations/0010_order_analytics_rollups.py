@@ -0,0 +1,131 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def seed_inventory_rollup(apps, schema_editor):
+    """Aggregate the existing catalogue into the new inventory rollup"""
+    Artwork = apps.get_model('gallery', 'Artwork')
+    InventoryRollup = apps.get_model('gallery', 'InventoryRollup')
+    totals = {}
+    fields = ('availability', 'sold', 'is_active', 'price', 'discounted_price')
+    for availability, sold, is_active, price, discounted_price in Artwork.objects.values_list(*fields):
+        count, value = totals.get((availability, sold, is_active), (0, 0))
+        totals[(availability, sold, is_active)] = (count + 1, value + (discounted_price or price or 0))
+    InventoryRollup.objects.bulk_create([
+        InventoryRollup(availability=availability, sold=sold, is_active=is_active,
+                        artwork_count=count, total_value=value)
+        for (availability, sold, is_active), (count, value) in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0009_ordersequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('availability', models.CharField(choices=[('at_gallery', 'Available at Gallery'), ('available', 'Available'), ('on_request', 'Available on Request')], max_length=20)),
+                ('sold', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('artwork_count', models.IntegerField(default=0)),
+                ('total_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=40, unique=True)),
+                ('status', models.CharField(choices=[('placed', 'Placed'), ('cancelled', 'Cancelled')], default='placed', max_length=20)),
+                ('first_name', models.CharField(max_length=100)),
+                ('last_name', models.CharField(max_length=100)),
+                ('email', models.EmailField(max_length=254)),
+                ('phone', models.CharField(blank=True, max_length=50)),
+                ('address', models.TextField(blank=True)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('province', models.CharField(blank=True, max_length=100)),
+                ('postal_code', models.CharField(blank=True, max_length=20)),
+                ('country', models.CharField(blank=True, max_length=100)),
+                ('payment_method', models.CharField(default='card', max_length=20)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('shipping', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('tax', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200)),
+                ('artist_name', models.CharField(blank=True, max_length=200)),
+                ('medium', models.CharField(blank=True, max_length=200)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('list_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('sale_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('dimension', models.CharField(choices=[('total', 'Total'), ('artist', 'Artist'), ('medium', 'Medium')], max_length=20)),
+                ('key', models.CharField(max_length=200)),
+                ('label', models.CharField(blank=True, max_length=200)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('items_sold', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('list_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('discount_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['-month', 'dimension', '-revenue'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(fields=('month', 'dimension', 'key'), name='unique_sales_rollup'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='artist',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='gallery.artist'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='artwork',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_items', to='gallery.artwork'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='gallery.order'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='inventoryrollup',
+            constraint=models.UniqueConstraint(fields=('availability', 'sold', 'is_active'), name='unique_inventory_rollup'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at'], name='gallery_ord_status_971340_idx'),
+        ),
+        migrations.RunPython(seed_inventory_rollup, migrations.RunPython.noop),
+    ]
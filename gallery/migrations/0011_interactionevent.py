@@ -0,0 +1,27 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0010_order_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InteractionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('view', 'Viewed'), ('add_to_cart', 'Added to Cart'), ('quick_purchase', 'Quick Purchase'), ('inquiry', 'Inquiry'), ('schedule_viewing', 'Viewing Scheduled')], max_length=20)),
+                ('artwork_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('session_key', models.CharField(blank=True, max_length=40)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='gallery_int_created_fe1a04_idx'), models.Index(fields=['artwork_id', 'event_type'], name='gallery_int_artwork_26305c_idx')],
+            },
+        ),
+    ]
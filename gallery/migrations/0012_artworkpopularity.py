@@ -0,0 +1,28 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0011_interactionevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtworkPopularity',
+            fields=[
+                ('artwork', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='gallery.artwork')),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('interest', models.PositiveIntegerField(default=0)),
+                ('popular_score', models.FloatField(db_index=True, default=0)),
+                ('trending_score', models.FloatField(db_index=True, default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Artwork popularity',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0012_artworkpopularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedArtwork',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('artwork', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='gallery.artwork')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='gallery.artwork')),
+            ],
+            options={
+                'ordering': ['artwork', 'rank'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedartwork',
+            constraint=models.UniqueConstraint(fields=('artwork', 'rank'), name='unique_related_artwork_rank'),
+        ),
+    ]
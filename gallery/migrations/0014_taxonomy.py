@@ -0,0 +1,80 @@
+# Generated by Django 4.2.27 on 2026-10-19 13:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0013_relatedartwork'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtistTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArtworkTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Term',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('medium', 'Medium'), ('style', 'Style'), ('theme', 'Theme')], max_length=10)),
+                ('slug', models.SlugField(max_length=200)),
+                ('name', models.CharField(max_length=200)),
+            ],
+            options={
+                'ordering': ['kind', 'name'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='term',
+            constraint=models.UniqueConstraint(fields=('kind', 'slug'), name='unique_term_kind_slug'),
+        ),
+        migrations.AddField(
+            model_name='artworkterm',
+            name='artwork',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='artwork_terms', to='gallery.artwork'),
+        ),
+        migrations.AddField(
+            model_name='artworkterm',
+            name='term',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='artwork_terms', to='gallery.term'),
+        ),
+        migrations.AddField(
+            model_name='artistterm',
+            name='artist',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='artist_terms', to='gallery.artist'),
+        ),
+        migrations.AddField(
+            model_name='artistterm',
+            name='term',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='artist_terms', to='gallery.term'),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='terms',
+            field=models.ManyToManyField(blank=True, related_name='artists', through='gallery.ArtistTerm', to='gallery.term'),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='terms',
+            field=models.ManyToManyField(blank=True, related_name='artworks', through='gallery.ArtworkTerm', to='gallery.term'),
+        ),
+        migrations.AddConstraint(
+            model_name='artworkterm',
+            constraint=models.UniqueConstraint(fields=('term', 'artwork'), name='unique_artwork_term'),
+        ),
+        migrations.AddConstraint(
+            model_name='artistterm',
+            constraint=models.UniqueConstraint(fields=('term', 'artist'), name='unique_artist_term'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:01
+
+from django.db import migrations, models
+from django.db.models import Case, F, When
+
+
+def populate_effective_price(apps, schema_editor):
+    """Discounted price where one is set, otherwise the regular price"""
+    Artwork = apps.get_model('gallery', 'Artwork')
+    Artwork.objects.update(effective_price=Case(
+        When(discounted_price__gt=0, then=F('discounted_price')),
+        default=F('price'),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0014_taxonomy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artwork',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Effective Price'),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(fields=['is_active', 'effective_price'], name='gallery_art_is_acti_982ca2_idx'),
+        ),
+        migrations.RunPython(populate_effective_price, migrations.RunPython.noop),
+    ]
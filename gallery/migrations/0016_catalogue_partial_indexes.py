@@ -0,0 +1,29 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0015_artwork_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='artist',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['first_name', 'last_name'], name='artist_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at'], name='artwork_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['artist', '-created_at'], name='artwork_active_artist_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['title'], name='artwork_active_title_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:38
+
+from django.db import migrations, models
+import gallery.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0016_catalogue_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='artist',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=gallery.storage.media_storage, upload_to='artists/profile_pictures/', verbose_name='Profile Picture'),
+        ),
+        migrations.AlterField(
+            model_name='artwork',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=gallery.storage.media_storage, upload_to='artworks/images/', verbose_name='Artwork Image'),
+        ),
+    ]
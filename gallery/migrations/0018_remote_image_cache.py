@@ -0,0 +1,34 @@
+# Generated by Django 4.2.27 on 2026-10-19 14:41
+
+from django.db import migrations, models
+import gallery.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0017_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artist',
+            name='cached_image',
+            field=models.ImageField(blank=True, editable=False, null=True, storage=gallery.storage.media_storage, upload_to='artists/remote/'),
+        ),
+        migrations.AddField(
+            model_name='artist',
+            name='cached_image_source',
+            field=models.URLField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='cached_image',
+            field=models.ImageField(blank=True, editable=False, null=True, storage=gallery.storage.media_storage, upload_to='artworks/remote/'),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='cached_image_source',
+            field=models.URLField(blank=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+from gallery.taxonomy import parse_terms
+
+ARTIST_KINDS = ('medium', 'style', 'theme')
+
+
+def backfill(apps, schema_editor):
+    """Link existing artists and artworks to terms, as taxonomy.backfill() does"""
+    Term = apps.get_model('gallery', 'Term')
+    Artist = apps.get_model('gallery', 'Artist')
+    Artwork = apps.get_model('gallery', 'Artwork')
+    ArtistTerm = apps.get_model('gallery', 'ArtistTerm')
+    ArtworkTerm = apps.get_model('gallery', 'ArtworkTerm')
+    terms = {(term.kind, term.slug): term.id for term in Term.objects.all()}
+
+    def term_ids(kind, text):
+        ids = []
+        for slug, name in parse_terms(text):
+            if (kind, slug) not in terms:
+                terms[kind, slug] = Term.objects.create(kind=kind, slug=slug, name=name).id
+            ids.append(terms[kind, slug])
+        return ids
+
+    links = []
+    for artist in Artist.objects.only('id', *ARTIST_KINDS).iterator(chunk_size=1000):
+        for kind in ARTIST_KINDS:
+            links += [ArtistTerm(artist_id=artist.id, term_id=term_id) for term_id in term_ids(kind, getattr(artist, kind))]
+    ArtistTerm.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+
+    links = []
+    for artwork in Artwork.objects.only('id', 'medium').iterator(chunk_size=1000):
+        links += [ArtworkTerm(artwork_id=artwork.id, term_id=term_id) for term_id in term_ids('medium', artwork.medium)]
+    ArtworkTerm.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0018_remote_image_cache'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
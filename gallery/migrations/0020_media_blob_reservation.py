@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-19 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0019_backfill_taxonomy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediablob',
+            name='reserved_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
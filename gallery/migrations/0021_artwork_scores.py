@@ -0,0 +1,52 @@
+# Generated by Django 4.2.27 on 2026-10-19 15:20
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_scores(apps, schema_editor):
+    """Move the scores from ArtworkPopularity onto the artworks"""
+    Artwork = apps.get_model('gallery', 'Artwork')
+    ArtworkPopularity = apps.get_model('gallery', 'ArtworkPopularity')
+    scores = ArtworkPopularity.objects.filter(artwork_id=OuterRef('pk'))
+    Artwork.objects.filter(popularity__isnull=False).update(
+        popular_score=Subquery(scores.values('popular_score')[:1]),
+        trending_score=Subquery(scores.values('trending_score')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0020_media_blob_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artwork',
+            name='popular_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.RunPython(copy_scores, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='artworkpopularity',
+            name='popular_score',
+        ),
+        migrations.RemoveField(
+            model_name='artworkpopularity',
+            name='trending_score',
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-popular_score', '-created_at'], name='artwork_active_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-trending_score', '-created_at'], name='artwork_active_trending_idx'),
+        ),
+    ]
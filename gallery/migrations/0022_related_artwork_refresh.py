@@ -0,0 +1,21 @@
+# Generated by Django 4.2.27 on 2026-10-19 15:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0021_artwork_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedArtworkRefresh',
+            fields=[
+                ('artwork', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='gallery.artwork')),
+                ('queued_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
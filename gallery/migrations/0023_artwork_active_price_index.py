@@ -0,0 +1,21 @@
+# Generated by Django 4.2.27 on 2026-10-19 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gallery', '0022_related_artwork_refresh'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='artwork',
+            name='gallery_art_is_acti_982ca2_idx',
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(condition=models.Q(('effective_price__isnull', False), ('is_active', True)), fields=['effective_price', '-created_at'], name='artwork_active_price_idx'),
+        ),
+    ]
@@ -1,10 +1,13 @@
 from django.db import models
+from django.db.models.lookups import GreaterThan
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils import timezone
 import random
 import string
 from django_countries.fields import CountryField
 
+from .storage import media_storage
+
 # Custom User Manager
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -102,6 +105,33 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.email}'s Profile"
 
+# ============================================================================
+# TAXONOMY - NORMALISED MEDIUM / STYLE / THEME TERMS
+# ============================================================================
+
+class Term(models.Model):
+    """A normalised medium, style or theme term parsed from free-text fields"""
+    
+    KIND_CHOICES = (
+        ('medium', 'Medium'),
+        ('style', 'Style'),
+        ('theme', 'Theme'),
+    )
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    slug = models.SlugField(max_length=200)
+    name = models.CharField(max_length=200)
+    
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.name}"
+    
+    class Meta:
+        ordering = ['kind', 'name']
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'slug'], name='unique_term_kind_slug'),
+        ]
+
+
 # models.py - SIMPLIFIED ARTIST MODEL
 class Artist(models.Model):
     """Artist model for storing artist information in the database"""
@@ -149,6 +179,12 @@ class Artist(models.Model):
         verbose_name='Theme',
         help_text='Optional. Artistic themes (e.g., Identity, Urban Life)'
     )
+    terms = models.ManyToManyField(
+        Term,
+        through='ArtistTerm',
+        blank=True,
+        related_name='artists'
+    )
     
     # Biography
     bio = models.TextField(
@@ -159,6 +195,7 @@ class Artist(models.Model):
     # Profile Images
     profile_picture = models.ImageField(
         upload_to='artists/profile_pictures/',
+        storage=media_storage,
         blank=True,
         null=True,
         verbose_name='Profile Picture'
@@ -167,6 +204,15 @@ class Artist(models.Model):
         blank=True,
         verbose_name='Image URL'
     )
+    # Local copy of image_url, made by manage.py ingest_remote_images (see gallery/ingest.py)
+    cached_image = models.ImageField(
+        upload_to='artists/remote/',
+        storage=media_storage,
+        blank=True,
+        null=True,
+        editable=False
+    )
+    cached_image_source = models.URLField(blank=True, editable=False)
     
     # Status Field
     is_active = models.BooleanField(
@@ -195,7 +241,7 @@ class Artist(models.Model):
         if self.profile_picture:
             return self.profile_picture.url
         elif self.image_url:
-            return self.image_url
+            return self.cached_image_url or self.image_url
         else:
             return '/static/gallery/images/default-artist.jpg'  # You should create this
     
@@ -204,18 +250,76 @@ class Artist(models.Model):
         """Get the full name (for compatibility with existing code)"""
         return self.full_name
     
+    @property
+    def cached_image_url(self):
+        """URL of the local copy of image_url, if it is current"""
+        if self.cached_image and self.cached_image_source == self.image_url:
+            return self.cached_image.url
+        return None
+    
     class Meta:
         ordering = ['first_name', 'last_name']
         verbose_name = 'Artist'
         verbose_name_plural = 'Artists'
+        indexes = [
+            models.Index(fields=['first_name', 'last_name'], condition=models.Q(is_active=True),
+                         name='artist_active_name_idx'),
+        ]
 
 # ============================================================================
 # ARTWORK MODEL - CONNECTED TO ARTIST
 # ============================================================================
 
+class ArtworkQuerySet(models.QuerySet):
+    """Keeps Artwork.effective_price in step with bulk writes that bypass save()"""
+
+    PRICE_FIELDS = {'price', 'discounted_price'}
+
+    def update(self, **kwargs):
+        if self.PRICE_FIELDS & set(kwargs) and 'effective_price' not in kwargs:
+            # Both assignments see the pre-update row, so build the effective
+            # price from the new values rather than a second UPDATE.
+            decimal = models.DecimalField(max_digits=10, decimal_places=2)
+            price, discounted = (
+                value if hasattr(value, 'resolve_expression') else models.Value(value, output_field=decimal)
+                for value in (kwargs.get('price', models.F('price')),
+                              kwargs.get('discounted_price', models.F('discounted_price')))
+            )
+            kwargs['effective_price'] = models.Case(
+                models.When(GreaterThan(discounted, 0), then=discounted),
+                default=price,
+                output_field=decimal,
+            )
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.effective_price = obj.display_price
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if self.PRICE_FIELDS & set(fields):
+            for obj in objs:
+                obj.effective_price = obj.display_price
+            fields = list(fields) + ['effective_price']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def in_cart(self, cart):
+        """Active artworks (artist loaded) for a session cart, keyed by cart key"""
+        ids = [key for key in cart if str(key).isdigit()]
+        if not ids:
+            return {}
+        artworks = self.filter(id__in=ids, is_active=True).select_related('artist')
+        return {str(artwork.id): artwork for artwork in artworks}
+
+
 class Artwork(models.Model):
     """Artwork model for storing artwork information in the database"""
     
+    SCORE_FIELDS = ('popular_score', 'trending_score')
+    
     # AVAILABILITY CHOICES - EXACT MATCH TO FRONTEND
     AVAILABILITY_CHOICES = (
         ('at_gallery', 'Available at Gallery'),
@@ -267,6 +371,22 @@ class Artwork(models.Model):
         help_text='Optional. Special promotional price.'
     )
     
+    # Price customers actually pay (discounted price if set, else price);
+    # stored so price filters and sorts can use an index
+    effective_price = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Effective Price',
+    )
+    
+    # Forward-decayed interest scores (see gallery/popularity.py), stored on
+    # the artwork so the popular/trending sorts read one partial index
+    popular_score = models.FloatField(default=0, editable=False)
+    trending_score = models.FloatField(default=0, editable=False)
+    
     # Sold Status
     sold = models.BooleanField(
         default=False,
@@ -282,6 +402,13 @@ class Artwork(models.Model):
         help_text='Optional. Artistic medium (e.g., Oil on Canvas, Bronze Sculpture)'
     )
     
+    terms = models.ManyToManyField(
+        Term,
+        through='ArtworkTerm',
+        blank=True,
+        related_name='artworks'
+    )
+    
     dimensions = models.CharField(
         max_length=100,
         blank=True,
@@ -306,6 +433,7 @@ class Artwork(models.Model):
     # Images
     image = models.ImageField(
         upload_to='artworks/images/',
+        storage=media_storage,
         blank=True,
         null=True,
         verbose_name='Artwork Image'
@@ -316,6 +444,15 @@ class Artwork(models.Model):
         verbose_name='Image URL',
         help_text='Optional. URL to artwork image if hosted elsewhere.'
     )
+    # Local copy of image_url, made by manage.py ingest_remote_images (see gallery/ingest.py)
+    cached_image = models.ImageField(
+        upload_to='artworks/remote/',
+        storage=media_storage,
+        blank=True,
+        null=True,
+        editable=False
+    )
+    cached_image_source = models.URLField(blank=True, editable=False)
     
     # Status Field
     is_active = models.BooleanField(
@@ -335,6 +472,8 @@ class Artwork(models.Model):
         verbose_name='Created By'
     )
     
+    objects = ArtworkQuerySet.as_manager()
+    
     def __str__(self):
         """String representation of the artwork"""
         return f"{self.title} by {self.artist.full_name}"
@@ -411,6 +550,13 @@ class Artwork(models.Model):
         """Determine if schedule viewing is allowed"""
         return self.availability == 'at_gallery' and not self.sold
     
+    @property
+    def cached_image_url(self):
+        """URL of the local copy of image_url, if it is current"""
+        if self.cached_image and self.cached_image_source == self.image_url:
+            return self.cached_image.url
+        return None
+    
     # In the Artwork model class, update the primary_image property:
     @property
     def primary_image(self):
@@ -423,7 +569,7 @@ class Artwork(models.Model):
                 # If image field exists but file is missing
                 return '/static/gallery/images/default-artwork.jpg'
         elif self.image_url:
-            return self.image_url
+            return self.cached_image_url or self.image_url
         else:
             return '/static/gallery/images/default-artwork.jpg'
     
@@ -449,6 +595,18 @@ class Artwork(models.Model):
     def save(self, *args, **kwargs):
         """Custom save method"""
         self.full_clean()  # Run validation before saving
+        self.effective_price = self.display_price
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # Scores are only ever incremented in the database (gallery/popularity.py);
+            # writing back the loaded values would undo events folded in since.
+            deferred = self.get_deferred_fields()
+            update_fields = kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.SCORE_FIELDS and field.attname not in deferred
+            ]
+        if update_fields is not None and {'price', 'discounted_price'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'effective_price'}
         super().save(*args, **kwargs)
     
     class Meta:
@@ -459,4 +617,293 @@ class Artwork(models.Model):
             models.Index(fields=['artist', 'is_active', 'sold']),
             models.Index(fields=['availability', 'is_active']),
             models.Index(fields=['price']),
-        ]
\ No newline at end of file
+            # Public catalogue: only active artworks, newest first or by title
+            models.Index(fields=['-created_at'], condition=models.Q(is_active=True),
+                         name='artwork_active_created_idx'),
+            models.Index(fields=['artist', '-created_at'], condition=models.Q(is_active=True),
+                         name='artwork_active_artist_idx'),
+            models.Index(fields=['title'], condition=models.Q(is_active=True),
+                         name='artwork_active_title_idx'),
+            # Price sorts and ranges; priced artworks only (the sorts leave the rest out)
+            models.Index(fields=['effective_price', '-created_at'],
+                         condition=models.Q(is_active=True, effective_price__isnull=False),
+                         name='artwork_active_price_idx'),
+            models.Index(fields=['-popular_score', '-created_at'], condition=models.Q(is_active=True),
+                         name='artwork_active_popular_idx'),
+            models.Index(fields=['-trending_score', '-created_at'], condition=models.Q(is_active=True),
+                         name='artwork_active_trending_idx'),
+        ]
+
+class ArtistTerm(models.Model):
+    """Style/theme term attached to an artist (derived from Artist.style/theme)"""
+    
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, related_name='artist_terms')
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='artist_terms')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'artist'], name='unique_artist_term'),
+        ]
+
+
+class ArtworkTerm(models.Model):
+    """Medium term attached to an artwork (derived from Artwork.medium)"""
+    
+    artwork = models.ForeignKey(Artwork, on_delete=models.CASCADE, related_name='artwork_terms')
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='artwork_terms')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'artwork'], name='unique_artwork_term'),
+        ]
+
+
+# ============================================================================
+# ORDER REFERENCE SEQUENCE
+# ============================================================================
+
+class OrderSequence(models.Model):
+    """Counter row that hands out blocks of order reference numbers"""
+    
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.BigIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.name} (next: {self.next_value})"
+    
+    class Meta:
+        verbose_name = 'Order Sequence'
+        verbose_name_plural = 'Order Sequences'
+
+
+# ============================================================================
+# ORDER MODELS
+# ============================================================================
+
+class Order(models.Model):
+    """A completed checkout"""
+    
+    STATUS_CHOICES = (
+        ('placed', 'Placed'),
+        ('cancelled', 'Cancelled'),
+    )
+    
+    reference = models.CharField(max_length=40, unique=True)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='orders'
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='placed')
+    
+    # Customer details
+    first_name = models.CharField(max_length=100)
+    last_name = models.CharField(max_length=100)
+    email = models.EmailField()
+    phone = models.CharField(max_length=50, blank=True)
+    address = models.TextField(blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    province = models.CharField(max_length=100, blank=True)
+    postal_code = models.CharField(max_length=20, blank=True)
+    country = models.CharField(max_length=100, blank=True)
+    payment_method = models.CharField(max_length=20, default='card')
+    
+    # Totals
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    shipping = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.reference
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
+class OrderItem(models.Model):
+    """An artwork sold as part of an order, with prices captured at sale time"""
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    artwork = models.ForeignKey(
+        Artwork,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='order_items'
+    )
+    artist = models.ForeignKey(
+        Artist,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='order_items'
+    )
+    title = models.CharField(max_length=200)
+    artist_name = models.CharField(max_length=200, blank=True)
+    medium = models.CharField(max_length=200, blank=True)
+    quantity = models.PositiveIntegerField(default=1)
+    list_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    sale_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"{self.title} ({self.order.reference})"
+    
+    @property
+    def discount(self):
+        """Amount knocked off the list price"""
+        return max(self.list_price - self.sale_price, 0)
+
+
+# ============================================================================
+# ANALYTICS ROLLUP MODELS
+# ============================================================================
+
+class SalesRollup(models.Model):
+    """Pre-aggregated sales per month for one dimension value (artist, medium or total)"""
+    
+    DIMENSION_CHOICES = (
+        ('total', 'Total'),
+        ('artist', 'Artist'),
+        ('medium', 'Medium'),
+    )
+    
+    month = models.DateField()
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=200)
+    label = models.CharField(max_length=200, blank=True)
+    orders = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    list_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.dimension}={self.label or self.key}"
+    
+    class Meta:
+        ordering = ['-month', 'dimension', '-revenue']
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'dimension', 'key'], name='unique_sales_rollup'),
+        ]
+
+
+class InventoryRollup(models.Model):
+    """Running artwork count and value for each availability/sold/active combination"""
+    
+    availability = models.CharField(max_length=20, choices=Artwork.AVAILABILITY_CHOICES)
+    sold = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    artwork_count = models.IntegerField(default=0)
+    total_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"{self.availability} sold={self.sold} active={self.is_active}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['availability', 'sold', 'is_active'], name='unique_inventory_rollup'),
+        ]
+
+
+# ============================================================================
+# INTERACTION EVENTS
+# ============================================================================
+
+class InteractionEvent(models.Model):
+    """Append-only log of visitor interactions with artworks"""
+    
+    EVENT_CHOICES = (
+        ('view', 'Viewed'),
+        ('add_to_cart', 'Added to Cart'),
+        ('quick_purchase', 'Quick Purchase'),
+        ('inquiry', 'Inquiry'),
+        ('schedule_viewing', 'Viewing Scheduled'),
+    )
+    
+    event_type = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    artwork_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(null=True, blank=True)
+    session_key = models.CharField(max_length=40, blank=True)
+    created_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.event_type} artwork={self.artwork_id} at {self.created_at}"
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['artwork_id', 'event_type']),
+        ]
+
+
+class ArtworkPopularity(models.Model):
+    """Interaction counters behind Artwork.popular_score / trending_score"""
+    
+    artwork = models.OneToOneField(
+        Artwork,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity'
+    )
+    views = models.PositiveIntegerField(default=0)
+    interest = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Popularity of artwork {self.artwork_id}"
+    
+    class Meta:
+        verbose_name_plural = 'Artwork popularity'
+
+
+class RelatedArtwork(models.Model):
+    """Precomputed "you may also like" neighbours for an artwork"""
+    
+    artwork = models.ForeignKey(Artwork, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Artwork, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    def __str__(self):
+        return f"{self.artwork_id} -> {self.related_id} (#{self.rank})"
+    
+    class Meta:
+        ordering = ['artwork', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['artwork', 'rank'], name='unique_related_artwork_rank'),
+        ]
+
+
+class RelatedArtworkRefresh(models.Model):
+    """An artwork whose features changed, waiting for ``build_recommendations --pending``"""
+    
+    artwork = models.OneToOneField(Artwork, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    queued_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Refresh related artworks of {self.artwork_id}"
+
+
+# ============================================================================
+# MEDIA BLOBS
+# ============================================================================
+
+class MediaBlob(models.Model):
+    """A content-addressed media file and how many fields reference it (see gallery/storage.py)"""
+    
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refcount = models.PositiveIntegerField(default=0)
+    # Set when an upload hands out this name; the blob is kept until its reference is counted
+    reserved_until = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
@@ -0,0 +1,71 @@
+"""
+Order reference generation.
+
+References look like ``ORD-20260203-0000001234``. The numeric part comes from
+a database sequence that each worker process reserves in blocks, so issuing a
+reference is a local counter increment and only every ``BLOCK_SIZE``-th order
+touches the database. Numbers are unique across processes and hosts sharing the
+database, increase monotonically within a process, and are zero padded so the
+references sort correctly as strings and are safe as a unique index key.
+"""
+import os
+import threading
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OrderSequence
+
+SEQUENCE_NAME = 'order_reference'
+BLOCK_SIZE = 100
+
+
+class OrderReferenceAllocator:
+    """Hands out sequence numbers from a reserved block, refilling as needed"""
+    
+    def __init__(self, sequence_name=SEQUENCE_NAME, block_size=BLOCK_SIZE):
+        self.sequence_name = sequence_name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = None
+    
+    def _reserve_block(self):
+        """Claim the next block of numbers with a single locked UPDATE"""
+        with transaction.atomic():
+            OrderSequence.objects.get_or_create(name=self.sequence_name)
+            sequence = OrderSequence.objects.select_for_update().get(name=self.sequence_name)
+            start = sequence.next_value
+            OrderSequence.objects.filter(pk=sequence.pk).update(
+                next_value=F('next_value') + self.block_size
+            )
+        self._next = start
+        self._end = start + self.block_size
+        self._pid = os.getpid()
+    
+    def next_value(self):
+        """Return the next unused sequence number"""
+        with self._lock:
+            # A block inherited across fork() is shared with the parent, so
+            # a child process always starts with a fresh block of its own.
+            if self._pid != os.getpid() or self._next >= self._end:
+                self._reserve_block()
+            value = self._next
+            self._next += 1
+            return value
+
+
+_allocator = OrderReferenceAllocator()
+
+
+def format_order_reference(value, when=None):
+    """Format a sequence number as a human-readable order reference"""
+    when = when or timezone.now()
+    return f"ORD-{when.strftime('%Y%m%d')}-{value:010d}"
+
+
+def generate_order_reference():
+    """Issue a new, collision-free order reference"""
+    return format_order_reference(_allocator.next_value())
@@ -0,0 +1,115 @@
+"""
+Decayed popularity counters fed by the interaction event pipeline.
+
+Each flushed batch of events (see gallery/events.py) is folded into the
+ArtworkPopularity counters and ``Artwork.popular_score`` / ``trending_score``
+with one UPDATE each per touched artwork. Scores use forward decay: an event
+at time t contributes ``weight * exp((t - EPOCH) / tau)``, so ordering by the
+stored column is the same as ordering by the decayed score right now, and
+``sort=popular`` / ``sort=trending`` read the partial
+``(-score, -created_at) WHERE is_active`` indexes with no per-request
+aggregation or sort.
+
+Floats overflow roughly 700 * tau after the epoch (about five years for the
+trending half-life). Before then, move ``GALLERY_POPULARITY_EPOCH`` forward
+and run ``manage.py rebuild_popularity`` to recompute from the event log.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import ArtworkPopularity
+
+EPOCH = getattr(settings, 'GALLERY_POPULARITY_EPOCH', datetime(2026, 1, 1, tzinfo=dt_timezone.utc))
+
+POPULAR_HALF_LIFE = timedelta(days=30)
+TRENDING_HALF_LIFE = timedelta(days=2)
+
+# How much each kind of interaction counts towards the scores
+EVENT_WEIGHTS = {
+    'view': 1.0,
+    'add_to_cart': 5.0,
+    'quick_purchase': 8.0,
+    'inquiry': 6.0,
+    'schedule_viewing': 6.0,
+}
+
+INTEREST_EVENTS = {'add_to_cart', 'quick_purchase', 'inquiry', 'schedule_viewing'}
+
+
+def _tau(half_life):
+    return half_life.total_seconds() / math.log(2)
+
+
+POPULAR_TAU = _tau(POPULAR_HALF_LIFE)
+TRENDING_TAU = _tau(TRENDING_HALF_LIFE)
+
+
+def decay_factor(when, tau, epoch=EPOCH):
+    """Forward-decay multiplier for an event at ``when``"""
+    return math.exp((when - epoch).total_seconds() / tau)
+
+
+def current_score(stored, tau, now, epoch=EPOCH):
+    """Convert a stored forward-decayed value into the decayed score at ``now``"""
+    return stored / decay_factor(now, tau, epoch)
+
+
+def apply_events(batch):
+    """Fold a batch of (event_type, artwork_id, user_id, session_key, created_at) tuples"""
+    deltas = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    for event_type, artwork_id, _user_id, _session_key, created_at in batch:
+        weight = EVENT_WEIGHTS.get(event_type)
+        if weight is None:
+            continue
+        delta = deltas[artwork_id]
+        if event_type == 'view':
+            delta[0] += 1
+        elif event_type in INTEREST_EVENTS:
+            delta[1] += 1
+        delta[2] += weight * decay_factor(created_at, POPULAR_TAU)
+        delta[3] += weight * decay_factor(created_at, TRENDING_TAU)
+
+    if not deltas:
+        return
+
+    from .models import Artwork
+
+    # Events can outlive their artwork; only keep ids that still exist.
+    existing = set(Artwork.objects.filter(id__in=deltas).values_list('id', flat=True))
+    with transaction.atomic():
+        ArtworkPopularity.objects.bulk_create(
+            [ArtworkPopularity(artwork_id=artwork_id) for artwork_id in existing],
+            ignore_conflicts=True,
+        )
+        for artwork_id in existing:
+            views, interest, popular, trending = deltas[artwork_id]
+            ArtworkPopularity.objects.filter(artwork_id=artwork_id).update(
+                views=F('views') + views,
+                interest=F('interest') + interest,
+            )
+            Artwork.objects.filter(id=artwork_id).update(
+                popular_score=F('popular_score') + popular,
+                trending_score=F('trending_score') + trending,
+            )
+
+
+def rebuild_from_events(chunk_size=5000):
+    """Recompute every score from the InteractionEvent log"""
+    from .models import Artwork, InteractionEvent
+
+    with transaction.atomic():
+        ArtworkPopularity.objects.all().delete()
+        Artwork.objects.update(popular_score=0, trending_score=0)
+        fields = ('event_type', 'artwork_id', 'user_id', 'session_key', 'created_at')
+        batch = []
+        for row in InteractionEvent.objects.order_by().values_list(*fields).iterator(chunk_size=chunk_size):
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                apply_events(batch)
+                batch = []
+        apply_events(batch)
@@ -0,0 +1,206 @@
+"""
+On-demand profiling of a single request, for owners.
+
+Add ``?_profile=1`` to any URL while signed in as an owner and, instead of
+the page, gallery.middleware.ProfilingMiddleware returns an HTML summary of
+that request: the slowest functions under cProfile and every SQL statement
+the view ran, with timings. ``?_profile=collapsed`` runs the view under a
+stack sampler instead and returns the samples in the collapsed-stack format
+(``frame;frame;frame count`` per line) that flamegraph.pl, speedscope and
+inferno read directly.
+
+Everyone else, and every request without the parameter, pays one substring
+check on the query string. With ``GALLERY_PROFILING['ENABLED']`` off the
+middleware removes itself at startup. See DEFAULTS.
+"""
+import cProfile
+import functools
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from . import instrumentation
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_INTERVAL': 0.001,   # seconds between stack samples in collapsed mode
+    'TOP_FUNCTIONS': 40,        # rows in the HTML summary
+}
+
+PARAMETER = '_profile'
+MODES = ('html', 'collapsed')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GALLERY_PROFILING', {})}
+
+
+def requested_mode(request):
+    """'html', 'collapsed' or None when this request should not be profiled"""
+    if f'{PARAMETER}=' not in request.META.get('QUERY_STRING', ''):
+        return None
+    user = getattr(request, 'user', None)
+    if not (user and user.is_authenticated and user.is_owner):
+        return None
+    value = request.GET.get(PARAMETER, '')
+    if value in ('1', 'true'):
+        return 'html'
+    return value if value in MODES else None
+
+
+@functools.lru_cache(maxsize=4096)
+def _short_path(filename):
+    """Path relative to the project or the sys.path entry it was imported from"""
+    roots = sorted({str(settings.BASE_DIR), *(path for path in sys.path if path)}, key=len, reverse=True)
+    for root in roots:
+        if filename.startswith(root + os.sep):
+            return filename[len(root) + 1:]
+    return filename
+
+
+# ============================================================================
+# PROFILERS
+# ============================================================================
+
+_switch_lock = threading.Lock()
+_switch_users = 0
+_switch_saved = None
+
+
+@contextmanager
+def _short_switch_interval(interval):
+    """Lower the (process-wide) GIL switch interval while any sampler runs
+
+    The sampler thread only runs when the profiled thread releases the GIL,
+    so without this samples land every 5ms rather than every ``interval``.
+    Overlapping samplers share one saved value; the last one out restores it.
+    """
+    global _switch_users, _switch_saved
+    with _switch_lock:
+        if not _switch_users:
+            _switch_saved = sys.getswitchinterval()
+        _switch_users += 1
+        sys.setswitchinterval(min(sys.getswitchinterval(), interval))
+    try:
+        yield
+    finally:
+        with _switch_lock:
+            _switch_users -= 1
+            if not _switch_users:
+                sys.setswitchinterval(_switch_saved)
+
+
+class StackSampler:
+    """Samples one thread's Python stack every ``interval`` seconds (cProfile-like ``runcall``)"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f'{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+        return label
+
+    def _run(self, thread_id, root):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            # Walk up to (not including) the frame that started profiling.
+            while frame is not None and frame is not root:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def runcall(self, func, *args, **kwargs):
+        root = sys._getframe()
+        thread = threading.Thread(
+            target=self._run, args=(threading.get_ident(), root), name='gallery-profiler', daemon=True,
+        )
+        with _short_switch_interval(self.interval / 2):
+            thread.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._stop.set()
+                thread.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+def _top_functions(profile, limit):
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': name,
+            'location': f'{_short_path(filename)}:{line}' if line else filename,
+            'calls': calls,
+            'own_ms': own * 1000,
+            'cumulative_ms': cumulative * 1000,
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit]
+
+
+# ============================================================================
+# PROFILED REQUEST
+# ============================================================================
+
+def _call_view(view_func, request, args, kwargs):
+    response = view_func(request, *args, **kwargs)
+    # Template responses render lazily; render them here so it is profiled.
+    if hasattr(response, 'render') and callable(response.render):
+        response = response.render()
+    return response
+
+
+def profile_view(request, view_func, args, kwargs, mode):
+    """Run the view under the profiler for ``mode`` and return the report"""
+    config = get_config()
+    sql = instrumentation.RequestMetrics(max_queries=10_000)
+    profiler = cProfile.Profile() if mode == 'html' else StackSampler(config['SAMPLE_INTERVAL'])
+
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(sql))
+        response = profiler.runcall(_call_view, view_func, request, args, kwargs)
+    total_ms = (time.perf_counter() - start) * 1000
+
+    if mode == 'collapsed':
+        report = HttpResponse(profiler.collapsed(), content_type='text/plain; charset=utf-8')
+        view_name = request.resolver_match.view_name if request.resolver_match else 'view'
+        report['Content-Disposition'] = f'attachment; filename="{view_name}.collapsed.txt"'
+    else:
+        query = request.GET.copy()
+        query[PARAMETER] = 'collapsed'
+        report = HttpResponse(render_to_string('gallery/profiler_report.html', {
+            'path': request.get_full_path(),
+            'view_name': request.resolver_match.view_name if request.resolver_match else None,
+            'status': response.status_code,
+            'total_ms': total_ms,
+            'query_count': sql.query_count,
+            'query_ms': sql.query_ms,
+            'queries': sorted(sql.queries, reverse=True),
+            'functions': _top_functions(profiler, config['TOP_FUNCTIONS']),
+            'collapsed_url': f'{request.path}?{query.urlencode()}',
+        }))
+    report['Cache-Control'] = 'no-store'
+    return report
@@ -0,0 +1,112 @@
+"""
+Query-plan audit for the public catalogue pages.
+
+Each page in ``public_pages()`` is requested through the Django test client
+while its SQL is captured; every SELECT is then run again under the
+backend's EXPLAIN prefix and the plan is checked for full table scans and
+sorts that no index satisfies. Run it with ``manage.py audit_query_plans``
+against a realistically sized database (see ``manage.py seed_catalogue``).
+"""
+import re
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .models import Artist, Artwork
+
+# Plan fragments that mean "this reads or sorts more rows than it returns".
+# SQLite reports "SCAN <table>" for a full scan (an index-only scan says
+# "USING ... INDEX"); PostgreSQL and MySQL use their own wording.
+WARNING_PATTERNS = {
+    'sqlite': [
+        (re.compile(r'\bSCAN (?!.*\bUSING (COVERING )?INDEX\b)'), 'full table scan'),
+        (re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)'), 'sort without an index'),
+    ],
+    'postgresql': [
+        (re.compile(r'\bSeq Scan on\b'), 'full table scan'),
+        (re.compile(r'^\s*(->\s*)?Sort\b'), 'sort without an index'),
+    ],
+    'mysql': [
+        (re.compile(r'\btype\W+ALL\b'), 'full table scan'),
+        (re.compile(r'Using filesort'), 'sort without an index'),
+    ],
+}
+
+
+def public_pages():
+    """(label, path) pairs for the pages anonymous visitors hit most"""
+    pages = [
+        ('home', reverse('home')),
+        ('artists', reverse('artists')),
+        ('artworks newest', reverse('artworks')),
+        ('artworks title', reverse('artworks') + '?sort=title_asc'),
+        ('artworks price', reverse('artworks') + '?sort=price_low'),
+        ('artworks price descending', reverse('artworks') + '?sort=price_high'),
+        ('artworks popular', reverse('artworks') + '?sort=popular'),
+        ('artworks trending', reverse('artworks') + '?sort=trending'),
+        ('artworks price range', reverse('artworks') + '?min_price=5000&max_price=20000'),
+    ]
+    artist_id = Artist.objects.filter(is_active=True).values_list('id', flat=True).first()
+    if artist_id:
+        pages.append(('artist detail', reverse('artist_detail', args=[artist_id])))
+        pages.append(('artworks by artist', f"{reverse('artworks')}?artist={artist_id}"))
+    artwork_id = Artwork.objects.filter(is_active=True).values_list('id', flat=True).first()
+    if artwork_id:
+        pages.append(('artwork detail', reverse('artwork_detail', args=[artwork_id])))
+    return pages
+
+
+def capture(path, client=None):
+    """Status code and SQL statements executed while rendering ``path``"""
+    client = client or Client()
+    # Audit requests should not be recorded as visitor interactions.
+    with override_settings(ALLOWED_HOSTS=['*'], GALLERY_EVENTS={'ENABLED': False}):
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(path)
+    return response.status_code, [query['sql'] for query in captured.captured_queries]
+
+
+def explain(sql):
+    """Plan lines for one captured statement"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+        rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+def warnings_for(plan):
+    """Human-readable warnings for the plan lines of one statement"""
+    found = []
+    for line in plan:
+        for pattern, message in WARNING_PATTERNS.get(connection.vendor, []):
+            if pattern.search(line):
+                found.append(f'{message}: {line.strip()}')
+    return found
+
+
+def audit(pages=None):
+    """Explain every SELECT issued by each page; returns one report dict per page"""
+    client = Client()
+    report = []
+    for label, path in pages or public_pages():
+        status, statements = capture(path, client)
+        queries = []
+        for sql in statements:
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            plan = explain(sql)
+            queries.append({'sql': sql, 'plan': plan, 'warnings': warnings_for(plan)})
+        report.append({
+            'label': label,
+            'path': path,
+            'status': status,
+            'query_count': len(statements),
+            'queries': queries,
+            'warnings': sum(len(query['warnings']) for query in queries),
+        })
+    return report
@@ -0,0 +1,254 @@
+"""
+"You may also like" recommendations for the artwork detail page.
+
+Every active artwork is reduced to a small feature tuple (artist, medium
+words, the artist's style and theme words, price band). Similarity is a
+weighted sum of set overlaps between those tuples; the price band only adds
+to artworks that already share the artist or a word, so two artworks are
+related by what they are, not only by what they cost. The top ``TOP_K``
+neighbours per artwork are stored in RelatedArtwork, so the detail page only
+does one indexed lookup.
+
+``build_all()`` (``manage.py build_recommendations``, run nightly) computes
+the whole table. When an artwork's features change, signals call
+``queue_refresh()``, which records it in RelatedArtworkRefresh in the same
+transaction; ``manage.py build_recommendations --pending`` (run from cron
+every few minutes) then calls ``refresh_for_artworks()`` for the queue, so an
+admin save does no scoring. That recomputes only the changed artworks' own
+rows and the rows that currently list one of them (which may have to drop or
+re-rank it), scoring them against the candidates that can score above zero
+(same artist, or a shared medium, style or theme word) instead of the whole
+catalogue. Rows the changed artwork would newly enter stay as they are until
+the next full build.
+
+With ``GALLERY_RECOMMENDATIONS['QUEUE']`` False (development and tests) the
+refresh runs as soon as the saving transaction commits.
+"""
+import heapq
+import math
+import re
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Artwork, RelatedArtwork, RelatedArtworkRefresh
+
+TOP_K = 6
+
+DEFAULTS = {
+    'QUEUE': True,      # leave refreshes to build_recommendations --pending
+}
+
+WEIGHTS = {
+    'artist': 3.0,
+    'medium': 2.0,
+    'style': 1.5,
+    'theme': 1.5,
+    'price': 1.0,
+}
+
+STOP_WORDS = {'on', 'and', 'of', 'with', 'in', 'the', 'a', 'mixed'}
+TOKEN_SPLIT = re.compile(r'[^a-z0-9]+')
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GALLERY_RECOMMENDATIONS', {})}
+
+
+# ============================================================================
+# FEATURES
+# ============================================================================
+
+def tokens(text):
+    """Lower-cased content words of a free-text field"""
+    return frozenset(
+        word for word in TOKEN_SPLIT.split((text or '').lower())
+        if word and word not in STOP_WORDS
+    )
+
+
+def price_band(price):
+    """Logarithmic price bucket: bands double in width (None for no price)"""
+    if not price or price <= 0:
+        return None
+    return int(math.log2(float(price)))
+
+
+def features(artwork):
+    """Feature tuple for an artwork with its artist already loaded"""
+    artist = artwork.artist
+    return (
+        artwork.artist_id,
+        tokens(artwork.medium),
+        tokens(artist.style),
+        tokens(artist.theme),
+        price_band(artwork.display_price),
+    )
+
+
+def _overlap(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def similarity(a, b):
+    """Weighted similarity between two feature tuples"""
+    score = 0.0
+    if a[0] == b[0]:
+        score += WEIGHTS['artist']
+    score += WEIGHTS['medium'] * _overlap(a[1], b[1])
+    score += WEIGHTS['style'] * _overlap(a[2], b[2])
+    score += WEIGHTS['theme'] * _overlap(a[3], b[3])
+    if score and a[4] is not None and b[4] is not None:
+        gap = abs(a[4] - b[4])
+        if gap == 0:
+            score += WEIGHTS['price']
+        elif gap == 1:
+            score += WEIGHTS['price'] / 2
+    return score
+
+
+def _feature_queryset():
+    return (
+        Artwork.objects.filter(is_active=True)
+        .select_related('artist')
+        .only('id', 'artist_id', 'medium', 'price', 'discounted_price',
+              'artist__style', 'artist__theme')
+    )
+
+
+def load_features():
+    """Feature tuples for every active artwork, keyed by id"""
+    return {artwork.id: features(artwork) for artwork in _feature_queryset().iterator(chunk_size=2000)}
+
+
+def load_candidates(feature_map):
+    """Feature tuples of every active artwork that can score above zero against one in ``feature_map``
+
+    Words are matched with ``icontains``, a superset of a shared word; the
+    scoring itself compares whole words.
+    """
+    artist_ids, medium, style, theme = set(), set(), set(), set()
+    for artist_id, medium_words, style_words, theme_words, _band in feature_map.values():
+        artist_ids.add(artist_id)
+        medium |= medium_words
+        style |= style_words
+        theme |= theme_words
+    conditions = (
+        [Q(artist_id__in=artist_ids)]
+        + [Q(medium__icontains=word) for word in medium]
+        + [Q(artist__style__icontains=word) for word in style]
+        + [Q(artist__theme__icontains=word) for word in theme]
+    )
+    queryset = _feature_queryset().filter(reduce(or_, conditions))
+    return {artwork.id: features(artwork) for artwork in queryset.iterator(chunk_size=2000)}
+
+
+# ============================================================================
+# NEIGHBOUR COMPUTATION
+# ============================================================================
+
+def neighbours(artwork_id, feature_map, k=TOP_K):
+    """Top-k (score, id) pairs most similar to one artwork"""
+    own = feature_map[artwork_id]
+    scored = (
+        (similarity(own, other), other_id)
+        for other_id, other in feature_map.items()
+        if other_id != artwork_id
+    )
+    return [pair for pair in heapq.nlargest(k, scored) if pair[0] > 0]
+
+
+def _store(rows_by_artwork):
+    """Replace the neighbour rows of the given artworks"""
+    with transaction.atomic():
+        RelatedArtwork.objects.filter(artwork_id__in=list(rows_by_artwork)).delete()
+        RelatedArtwork.objects.bulk_create(
+            [
+                RelatedArtwork(artwork_id=artwork_id, related_id=related_id, rank=rank, score=score)
+                for artwork_id, pairs in rows_by_artwork.items()
+                for rank, (score, related_id) in enumerate(pairs, start=1)
+            ],
+            batch_size=1000,
+        )
+
+
+def build_all(k=TOP_K):
+    """Recompute the neighbour table for every active artwork"""
+    started = timezone.now()
+    feature_map = load_features()
+    rows = {artwork_id: neighbours(artwork_id, feature_map, k) for artwork_id in feature_map}
+    with transaction.atomic():
+        RelatedArtwork.objects.all().delete()
+        _store(rows)
+        # Edits queued before the features were read are covered by this build.
+        RelatedArtworkRefresh.objects.filter(queued_at__lt=started).delete()
+    return len(rows)
+
+
+def refresh_for_artworks(artwork_ids, k=TOP_K):
+    """Recompute the changed artworks' rows and the rows that list them"""
+    changed = set(artwork_ids)
+    if not changed:
+        return
+    listing = set(RelatedArtwork.objects.filter(related_id__in=changed).values_list('artwork_id', flat=True))
+    recompute_rows(changed | listing, k)
+
+
+def recompute_rows(artwork_ids, k=TOP_K):
+    """Recompute the neighbour lists of specific artworks only"""
+    artwork_ids = set(artwork_ids)
+    own = {artwork.id: features(artwork) for artwork in _feature_queryset().filter(id__in=artwork_ids)}
+    feature_map = load_candidates(own) if own else {}
+    _store({
+        artwork_id: neighbours(artwork_id, feature_map, k) if artwork_id in own else []
+        for artwork_id in artwork_ids
+    })
+
+
+# ============================================================================
+# QUEUED REFRESH
+# ============================================================================
+
+def queue_refresh(artwork_ids):
+    """Refresh the neighbours of ``artwork_ids`` (and the rows listing them) after this save"""
+    artwork_ids = list(artwork_ids)
+    if not get_config()['QUEUE']:
+        transaction.on_commit(lambda: refresh_for_artworks(artwork_ids))
+        return
+    RelatedArtworkRefresh.objects.bulk_create(
+        [RelatedArtworkRefresh(artwork_id=artwork_id) for artwork_id in artwork_ids],
+        ignore_conflicts=True,
+    )
+
+
+def refresh_pending(limit=500):
+    """Run up to ``limit`` queued refreshes; returns how many artworks were refreshed"""
+    with transaction.atomic():
+        artwork_ids = list(
+            RelatedArtworkRefresh.objects.order_by('queued_at').values_list('artwork_id', flat=True)[:limit]
+        )
+        # Claimed before scoring: a save committed from here on queues the
+        # artwork again and the next run picks up its new features.
+        RelatedArtworkRefresh.objects.filter(artwork_id__in=artwork_ids).delete()
+    try:
+        refresh_for_artworks(artwork_ids)
+    except Exception:
+        queue_refresh(artwork_ids)
+        raise
+    return len(artwork_ids)
+
+
+def related_for(artwork_id, limit=TOP_K):
+    """Stored neighbours of an artwork, ready for the detail page"""
+    links = (
+        RelatedArtwork.objects.filter(artwork_id=artwork_id, related__is_active=True)
+        .select_related('related__artist')
+        .order_by('rank')[:limit]
+    )
+    return [link.related for link in links]
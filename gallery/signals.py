@@ -0,0 +1,276 @@
+"""
+Model signal handlers that keep derived tables in sync with writes.
+"""
+from collections import Counter
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import analytics, caching, metrics, recommendations, storage, taxonomy
+from .models import Artist, Artwork, Order, RelatedArtwork
+
+
+UNKNOWN = object()
+
+INVENTORY_FIELDS = {'availability', 'sold', 'is_active', 'price', 'discounted_price'}
+RECOMMENDATION_FIELDS = {'artist_id', 'medium', 'price', 'discounted_price', 'is_active'}
+
+
+def _snapshot(instance, fields, build):
+    """Build a snapshot from loaded values; never trigger a deferred-field query"""
+    if not instance.pk:
+        return None
+    if fields & instance.get_deferred_fields():
+        return UNKNOWN
+    return build(instance)
+
+
+# ============================================================================
+# ANALYTICS ROLLUPS
+# ============================================================================
+
+@receiver(post_init, sender=Artwork)
+def remember_artwork_state(sender, instance, **kwargs):
+    """Keep the loaded state so post_save can diff it without another query"""
+    instance._inventory_state = _snapshot(instance, INVENTORY_FIELDS, analytics.inventory_state)
+
+
+def _stored_inventory_state(instance):
+    """Old state for an instance loaded with deferred fields (rare; one query)"""
+    stored = Artwork.objects.filter(pk=instance.pk).first()
+    return analytics.inventory_state(stored) if stored else None
+
+
+@receiver(post_save, sender=Artwork)
+def update_inventory_rollup(sender, instance, created, **kwargs):
+    new_state = analytics.inventory_state(instance)
+    old_state = None if created else getattr(instance, '_inventory_state', None)
+    analytics.apply_inventory_change(old_state, new_state)
+    instance._inventory_state = new_state
+
+
+@receiver(pre_save, sender=Artwork)
+def load_unknown_inventory_state(sender, instance, **kwargs):
+    if getattr(instance, '_inventory_state', None) is UNKNOWN:
+        instance._inventory_state = _stored_inventory_state(instance)
+    if getattr(instance, '_recommendation_features', None) is UNKNOWN:
+        # Treat as changed; the refresh is cheap relative to a deferred save.
+        instance._recommendation_features = None
+
+
+@receiver(pre_delete, sender=Artwork)
+def load_unknown_inventory_state_before_delete(sender, instance, **kwargs):
+    if getattr(instance, '_inventory_state', None) is UNKNOWN:
+        instance._inventory_state = _stored_inventory_state(instance)
+
+
+@receiver(post_delete, sender=Artwork)
+def remove_from_inventory_rollup(sender, instance, **kwargs):
+    analytics.apply_inventory_change(getattr(instance, '_inventory_state', None), None)
+
+
+@receiver(post_init, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    instance._loaded_status = _snapshot(instance, {'status'}, lambda order: order.status)
+
+
+@receiver(pre_save, sender=Order)
+def load_unknown_order_status(sender, instance, **kwargs):
+    if getattr(instance, '_loaded_status', None) is UNKNOWN:
+        instance._loaded_status = (
+            Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollup_on_status_change(sender, instance, created, **kwargs):
+    """Reverse or re-apply an order when it is cancelled or reinstated
+
+    New orders are recorded by the checkout once their items exist.
+    """
+    old_status = instance._loaded_status
+    instance._loaded_status = instance.status
+    if created or old_status == instance.status:
+        return
+    if instance.status == 'cancelled' and old_status == 'placed':
+        analytics.record_order(instance, sign=-1)
+    elif instance.status == 'placed' and old_status == 'cancelled':
+        analytics.record_order(instance)
+
+
+# ============================================================================
+# RELATED ARTWORKS
+# ============================================================================
+
+def _recommendation_features(artwork):
+    return (artwork.artist_id, artwork.medium, artwork.price, artwork.discounted_price, artwork.is_active)
+
+
+@receiver(post_init, sender=Artwork)
+def remember_recommendation_features(sender, instance, **kwargs):
+    instance._recommendation_features = _snapshot(instance, RECOMMENDATION_FIELDS, _recommendation_features)
+
+
+@receiver(post_save, sender=Artwork)
+def refresh_related_artworks(sender, instance, created, **kwargs):
+    """Only feature changes matter; marking an artwork sold costs nothing here"""
+    features = _recommendation_features(instance)
+    if created or features != instance._recommendation_features:
+        recommendations.queue_refresh([instance.pk])
+    instance._recommendation_features = features
+
+
+@receiver(pre_delete, sender=Artwork)
+def refresh_neighbours_of_deleted_artwork(sender, instance, **kwargs):
+    """Artworks that listed the deleted one need a replacement neighbour"""
+    listing = list(
+        RelatedArtwork.objects.filter(related_id=instance.pk)
+        .exclude(artwork_id=instance.pk)
+        .values_list('artwork_id', flat=True)
+    )
+    if listing:
+        recommendations.queue_refresh(listing)
+
+
+@receiver(post_init, sender=Artist)
+def remember_artist_features(sender, instance, **kwargs):
+    instance._recommendation_features = _snapshot(
+        instance, {'style', 'theme'}, lambda artist: (artist.style, artist.theme)
+    )
+
+
+@receiver(post_save, sender=Artist)
+def refresh_artist_artworks(sender, instance, created, **kwargs):
+    features = (instance.style, instance.theme)
+    if not created and features != instance._recommendation_features:
+        artwork_ids = list(instance.artworks.values_list('id', flat=True))
+        if artwork_ids:
+            recommendations.queue_refresh(artwork_ids)
+    instance._recommendation_features = features
+
+
+# ============================================================================
+# CATALOGUE CACHE
+# ============================================================================
+
+# Fields the generation-versioned facet counts depend on. Cards are keyed by
+# updated_at (gallery/fragments.py) and need no bump. ``sold`` is left out on
+# purpose: a sale would otherwise drop every cached selection at checkout, and
+# the Status counts catch up within facets.CACHE_TIMEOUT instead.
+CATALOGUE_FIELDS = {
+    Artwork: ('artist_id', 'medium', 'availability', 'price', 'discounted_price', 'year', 'is_active'),
+    Artist: ('style', 'theme'),
+}
+
+
+def _catalogue_state(instance):
+    return tuple(getattr(instance, field) for field in CATALOGUE_FIELDS[type(instance)])
+
+
+@receiver(post_init, sender=Artwork)
+@receiver(post_init, sender=Artist)
+def remember_catalogue_state(sender, instance, **kwargs):
+    instance._catalogue_state = _snapshot(instance, set(CATALOGUE_FIELDS[sender]), _catalogue_state)
+
+
+@receiver(post_save, sender=Artwork)
+@receiver(post_save, sender=Artist)
+def bump_catalogue_generation(sender, instance, created, **kwargs):
+    state = _catalogue_state(instance)
+    if created or state != instance._catalogue_state:
+        caching.bump_generation()
+    instance._catalogue_state = state
+
+
+@receiver(post_delete, sender=Artwork)
+@receiver(post_delete, sender=Artist)
+def bump_catalogue_generation_on_delete(sender, **kwargs):
+    caching.bump_generation()
+
+
+# ============================================================================
+# TAXONOMY
+# ============================================================================
+
+@receiver(post_init, sender=Artwork)
+def remember_artwork_medium(sender, instance, **kwargs):
+    instance._taxonomy_fields = _snapshot(instance, {'medium'}, lambda artwork: artwork.medium)
+
+
+@receiver(post_save, sender=Artwork)
+def sync_artwork_terms(sender, instance, created, **kwargs):
+    if created or instance.medium != instance._taxonomy_fields:
+        taxonomy.sync_artwork_terms(instance)
+    instance._taxonomy_fields = instance.medium
+
+
+def _artist_term_fields(artist):
+    return tuple(getattr(artist, kind) for kind in taxonomy.ARTIST_KINDS)
+
+
+@receiver(post_init, sender=Artist)
+def remember_artist_terms(sender, instance, **kwargs):
+    instance._taxonomy_fields = _snapshot(instance, set(taxonomy.ARTIST_KINDS), _artist_term_fields)
+
+
+@receiver(post_save, sender=Artist)
+def sync_artist_terms(sender, instance, created, **kwargs):
+    fields = _artist_term_fields(instance)
+    if created or fields != instance._taxonomy_fields:
+        taxonomy.sync_artist_terms(instance)
+    instance._taxonomy_fields = fields
+
+
+# ============================================================================
+# MEDIA BLOB REFERENCES
+# ============================================================================
+
+MEDIA_FIELDS = {Artwork: ('image', 'cached_image'), Artist: ('profile_picture', 'cached_image')}
+
+
+def _media_names(instance):
+    return tuple(getattr(instance, field).name or None for field in MEDIA_FIELDS[type(instance)])
+
+
+@receiver(post_init, sender=Artwork)
+@receiver(post_init, sender=Artist)
+def remember_media_names(sender, instance, **kwargs):
+    instance._media_names = _snapshot(instance, set(MEDIA_FIELDS[sender]), _media_names)
+
+
+@receiver(pre_save, sender=Artwork)
+@receiver(pre_save, sender=Artist)
+@receiver(pre_delete, sender=Artwork)
+@receiver(pre_delete, sender=Artist)
+def load_unknown_media_names(sender, instance, **kwargs):
+    if getattr(instance, '_media_names', None) is UNKNOWN:
+        stored = sender.objects.filter(pk=instance.pk).values_list(*MEDIA_FIELDS[sender]).first()
+        instance._media_names = tuple(name or None for name in stored) if stored else None
+
+
+@receiver(post_save, sender=Artwork)
+@receiver(post_save, sender=Artist)
+def update_media_references(sender, instance, created, **kwargs):
+    names = Counter(filter(None, _media_names(instance)))
+    old_names = Counter() if created else Counter(filter(None, instance._media_names or ()))
+    if names != old_names:
+        storage.acquire(list((names - old_names).elements()))
+        storage.release(list((old_names - names).elements()))
+    instance._media_names = _media_names(instance)
+
+
+@receiver(post_delete, sender=Artwork)
+@receiver(post_delete, sender=Artist)
+def release_media_references(sender, instance, **kwargs):
+    # The stored names: a view may have cleared a field before deleting.
+    storage.release([name for name in instance._media_names or () if name])
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+@receiver(connection_created)
+def count_database_connection(sender, connection, **kwargs):
+    metrics.DB_CONNECTIONS.inc(alias=connection.alias)
@@ -0,0 +1,296 @@
+"""
+Content-addressed media storage.
+
+Artwork.image and Artist.profile_picture, and the local copies of their
+``image_url`` (``cached_image``, see gallery/ingest.py), use
+``ContentAddressedStorage`` (settings.STORAGES['media']). An upload is hashed
+while it is written and stored once as ``blobs/<aa>/<bb>/<sha256><ext>``;
+uploading the same bytes again (for another artwork, or a re-upload) just
+reuses that file, instead of the ``_OcCDYml``-suffixed copies FileSystemStorage
+makes.
+
+Because files are shared, each blob has a ``MediaBlob`` row counting the
+fields that reference it. gallery/signals.py calls ``acquire()`` and
+``release()`` as artworks and artists are saved and deleted (cascades
+included); a blob's file is removed once the transaction that dropped its
+last reference commits. ``delete()`` on a blob that is still referenced does
+nothing, so ``field.delete()`` in a view cannot break another artwork.
+
+An upload only counts its reference when the row is saved, after the file is
+stored. So that a concurrent ``delete_unreferenced()`` cannot remove a blob in
+between, ``_save()`` first reserves the MediaBlob row (for at most
+``RESERVATION``; ``acquire()`` ends it). Deletion skips reserved blobs and
+holds each row under ``select_for_update()`` while it removes the file.
+
+``manage.py dedupe_media`` moves files uploaded before this storage existed
+into the blob layout, points the rows at them, rebuilds the counts and
+removes the originals.
+"""
+import hashlib
+import os
+import tempfile
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+BLOB_DIR = 'blobs'
+UPLOAD_DIR = '.uploads'     # temporary files, on the same filesystem as the blobs
+CHUNK_SIZE = 64 * 1024
+RESERVATION = timedelta(hours=1)    # upper bound on upload-to-save time
+
+
+def media_storage():
+    """Storage of the content-addressed fields (a callable, so settings can swap it)"""
+    return storages['media']
+
+
+def references():
+    """(model, field name) of every content-addressed file field"""
+    from .models import Artist, Artwork
+
+    return [
+        (Artwork, 'image'), (Artwork, 'cached_image'),
+        (Artist, 'profile_picture'), (Artist, 'cached_image'),
+    ]
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(BLOB_DIR + '/')
+
+
+def blob_name(digest, original_name):
+    extension = os.path.splitext(original_name)[1].lower()
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def hash_file(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+# ============================================================================
+# STORAGE
+# ============================================================================
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores each distinct file once, named by the SHA-256 of its content"""
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is only known once the content is hashed in _save().
+        return name
+
+    def _makedirs(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+        try:
+            os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def _save(self, name, content):
+        upload_dir = self.path(UPLOAD_DIR)
+        self._makedirs(upload_dir)
+        fd, temporary = tempfile.mkstemp(dir=upload_dir)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as handle:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    handle.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+
+            name = blob_name(digest.hexdigest(), name)
+            # Before the file is (re)used, so a deletion cannot slip in between.
+            reserve(name, os.path.getsize(temporary))
+            full_path = self.path(name)
+            self._makedirs(os.path.dirname(full_path))
+            try:
+                # Atomic and never overwrites: a concurrent upload of the same
+                # bytes simply finds the blob already there.
+                os.link(temporary, full_path)
+            except FileExistsError:
+                pass
+        finally:
+            os.unlink(temporary)
+        return name
+
+    def delete(self, name):
+        if is_blob(name):
+            from .models import MediaBlob
+
+            if MediaBlob.objects.filter(in_use(), name=name).exists():
+                return
+        super().delete(name)
+
+
+# ============================================================================
+# REFERENCE COUNTS
+# ============================================================================
+
+def in_use():
+    """MediaBlob rows whose file must stay: referenced, or reserved by an upload"""
+    return Q(refcount__gt=0) | Q(reserved_until__gte=timezone.now())
+
+
+def reserve(name, size):
+    """Keep blob ``name`` for RESERVATION while an upload of it is being saved"""
+    from .models import MediaBlob
+
+    until = timezone.now() + RESERVATION
+    if MediaBlob.objects.filter(name=name).update(reserved_until=until):
+        return
+    blob, created = MediaBlob.objects.get_or_create(name=name, defaults={'size': size, 'reserved_until': until})
+    if not created:
+        MediaBlob.objects.filter(pk=blob.pk).update(reserved_until=until)
+
+
+def reserved(names):
+    """Subset of ``names`` an upload has reserved"""
+    from .models import MediaBlob
+
+    return set(
+        MediaBlob.objects.filter(name__in=names, reserved_until__gte=timezone.now()).values_list('name', flat=True)
+    )
+
+
+def acquire(names):
+    """Count one more reference to each blob in ``names`` (ending an upload's reservation)"""
+    from .models import MediaBlob
+
+    storage = media_storage()
+    for name in filter(is_blob, names):
+        if MediaBlob.objects.filter(name=name).update(refcount=F('refcount') + 1, reserved_until=None):
+            continue
+        size = storage.size(name) if storage.exists(name) else 0
+        blob, created = MediaBlob.objects.get_or_create(name=name, defaults={'size': size, 'refcount': 1})
+        if not created:
+            MediaBlob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1, reserved_until=None)
+
+
+def release(names):
+    """Drop one reference to each blob in ``names``; unreferenced files go after commit"""
+    from .models import MediaBlob
+
+    names = [name for name in names if is_blob(name)]
+    if not names:
+        return
+    for name in names:
+        MediaBlob.objects.filter(name=name, refcount__gt=0).update(refcount=F('refcount') - 1)
+    transaction.on_commit(lambda: delete_unreferenced(names))
+
+
+def delete_unreferenced(names):
+    """Remove the blobs among ``names`` that nothing references any more"""
+    from .models import MediaBlob
+
+    storage = media_storage()
+    removed = 0
+    for name in names:
+        with transaction.atomic():
+            # The row stays locked while the file goes, so an upload reserving
+            # it waits and then stores the file again.
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is None or blob.refcount or (blob.reserved_until and blob.reserved_until >= timezone.now()):
+                continue
+            storage.delete(name)
+            blob.delete()
+            removed += 1
+    return removed
+
+
+def count_references(names=None):
+    """{blob name: number of fields referencing it}, straight from the tables
+
+    Every blob, or only those in ``names``.
+    """
+    counts = Counter()
+    for model, field in references():
+        if names is None:
+            queryset = model.objects.filter(**{f'{field}__startswith': BLOB_DIR + '/'})
+        else:
+            queryset = model.objects.filter(**{f'{field}__in': names})
+        counts.update(queryset.values_list(field, flat=True).iterator(chunk_size=2000))
+    return counts
+
+
+def rebuild_refcounts():
+    """Recompute every MediaBlob count from the tables; returns the counts"""
+    from .models import MediaBlob
+
+    counts = count_references()
+    storage = media_storage()
+    with transaction.atomic():
+        existing = {blob.name: blob for blob in MediaBlob.objects.all()}
+        for blob in existing.values():
+            blob.refcount = counts.get(blob.name, 0)
+        MediaBlob.objects.bulk_update(existing.values(), ['refcount'], batch_size=500)
+        MediaBlob.objects.bulk_create([
+            MediaBlob(name=name, size=storage.size(name) if storage.exists(name) else 0, refcount=count)
+            for name, count in counts.items() if name not in existing
+        ], batch_size=500)
+    return counts
+
+
+# ============================================================================
+# MIGRATING EXISTING FILES
+# ============================================================================
+
+def dedupe_existing(dry_run=False, keep_originals=False):
+    """Move pre-existing uploads into blobs; returns a summary dict"""
+    from . import caching
+
+    storage = media_storage()
+    moved = {}                      # original name -> blob name
+    seen_blobs = set()
+    summary = Counter()
+
+    for model, field in references():
+        # One entry per distinct file, read up front: the loop rewrites these rows.
+        names = list(
+            model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            .exclude(**{f'{field}__startswith': BLOB_DIR + '/'})
+            .order_by().values_list(field, flat=True).distinct()
+        )
+        for name in names:
+            if name not in moved:
+                if not storage.exists(name):
+                    summary['missing'] += 1
+                    continue
+                size = storage.size(name)
+                with storage.open(name, 'rb') as handle:
+                    target = blob_name(hash_file(handle), name)
+                    if target in seen_blobs or storage.exists(target):
+                        summary['duplicates'] += 1
+                        summary['bytes_saved'] += size
+                    elif not dry_run:
+                        storage.save(name, handle)
+                seen_blobs.add(target)
+                moved[name] = target
+                summary['files'] += 1
+            if not dry_run:
+                summary['rows'] += model.objects.filter(**{field: name}).update(
+                    **{field: moved[name], 'updated_at': timezone.now()}
+                )
+
+    summary['blobs'] = len(seen_blobs)
+    if dry_run:
+        return dict(summary)
+
+    rebuild_refcounts()
+    caching.bump_generation()
+    if not keep_originals:
+        for name in moved:
+            storage.delete(name)
+    return dict(summary)
@@ -0,0 +1,233 @@
+"""
+Orphaned media sweeper.
+
+Files stop being referenced when an image is replaced, when an artwork or
+artist is deleted, or when a user changes their profile picture; blobs of
+gallery/storage.py are released by reference counting, but everything else
+(and anything a crash left behind) stays on disk. ``manage.py sweep_media``
+finds and removes those files in two stages:
+
+1. **Quarantine.** Every FileField of every model is streamed into one set of
+   referenced names; MEDIA_ROOT is walked directory by directory and each
+   directory's files minus that set are the orphans. Files younger than
+   ``MIN_AGE_HOURS`` are skipped (an upload whose row is not committed yet
+   looks orphaned), and each batch is checked against the database once more
+   just before it is moved to ``.quarantine/<run>/`` (gallery/media.py does
+   not serve dot-prefixed paths, so quarantined files are not reachable).
+2. **Purge.** Quarantine runs older than ``QUARANTINE_DAYS`` are deleted and
+   their bytes reported as reclaimed. Until then ``restore()`` puts a run back.
+
+Memory grows with the number of references (one string per file), not with
+the number of rows or directory sizes; the database is read in chunks and
+the tree with ``os.scandir``.
+"""
+import os
+import shutil
+import time
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from . import storage
+
+QUARANTINE_DIR = '.quarantine'
+SKIP_DIRS = {QUARANTINE_DIR, storage.UPLOAD_DIR}
+
+DEFAULTS = {
+    'MIN_AGE_HOURS': 24,
+    'QUARANTINE_DAYS': 7,
+    'BATCH_SIZE': 1000,
+    'CHUNK_SIZE': 5000,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'GALLERY_MEDIA_SWEEPER', {})}
+
+
+# ============================================================================
+# REFERENCES AND FILES
+# ============================================================================
+
+def file_fields():
+    """(model, field name) of every FileField/ImageField of every installed model"""
+    return [
+        (model, field.attname)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+    ]
+
+
+def referenced_names(chunk_size=None):
+    """Every file name stored in a FileField, streamed from the database"""
+    chunk_size = chunk_size or get_config()['CHUNK_SIZE']
+    names = set()
+    for model, field in file_fields():
+        queryset = (
+            model._base_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+            .order_by().values_list(field, flat=True)
+        )
+        names.update(queryset.iterator(chunk_size=chunk_size))
+    return names
+
+
+def still_referenced(names):
+    """Subset of ``names`` the database references right now"""
+    found = set()
+    for model, field in file_fields():
+        found.update(
+            model._base_manager.filter(**{f'{field}__in': names}).order_by().values_list(field, flat=True)
+        )
+    return found
+
+
+def walk(root):
+    """Yield (directory name relative to root, {file name: stat}) for each directory"""
+    pending = ['']
+    while pending:
+        relative = pending.pop()
+        files = {}
+        with os.scandir(os.path.join(root, relative)) as entries:
+            for entry in entries:
+                name = f'{relative}/{entry.name}' if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if not (relative == '' and entry.name in SKIP_DIRS):
+                        pending.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    files[name] = entry.stat(follow_symlinks=False)
+        yield relative, files
+
+
+def find_orphans(root, referenced, min_age_hours):
+    """Yield (name, size) of unreferenced files older than ``min_age_hours``"""
+    cutoff = time.time() - min_age_hours * 3600
+    for _directory, files in walk(root):
+        for name in files.keys() - referenced:
+            stat = files[name]
+            if stat.st_mtime <= cutoff:
+                yield name, stat.st_size
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ============================================================================
+# QUARANTINE, PURGE AND RESTORE
+# ============================================================================
+
+def _move(source, destination):
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    os.replace(source, destination)
+
+
+def quarantine(root=None, dry_run=False, min_age_hours=None):
+    """Move orphaned files into a new quarantine run; returns a summary dict"""
+    from .models import MediaBlob
+
+    config = get_config()
+    root = root or settings.MEDIA_ROOT
+    min_age_hours = config['MIN_AGE_HOURS'] if min_age_hours is None else min_age_hours
+    run = timezone.now().strftime('%Y%m%dT%H%M%S')
+    summary = {'run': run, 'orphans': 0, 'orphan_bytes': 0, 'quarantined': 0, 'quarantined_bytes': 0}
+    if not os.path.isdir(root):
+        return summary
+
+    referenced = referenced_names()
+    summary['referenced'] = len(referenced)
+    for batch in _batches(find_orphans(root, referenced, min_age_hours), config['BATCH_SIZE']):
+        summary['orphans'] += len(batch)
+        summary['orphan_bytes'] += sum(size for _name, size in batch)
+        if dry_run:
+            continue
+        # Re-check: a row may have started pointing at one of these since the
+        # scan, or an upload may be about to (a reserved blob).
+        names = [name for name, _size in batch]
+        in_use = still_referenced(names) | storage.reserved(names)
+        moved = []
+        for name, size in batch:
+            if name in in_use:
+                continue
+            try:
+                _move(os.path.join(root, name), os.path.join(root, QUARANTINE_DIR, run, name))
+            except FileNotFoundError:
+                continue
+            moved.append(name)
+            summary['quarantined'] += 1
+            summary['quarantined_bytes'] += size
+        # Blobs nobody references any more also lose their (zero) count rows.
+        MediaBlob.objects.filter(name__in=moved, refcount=0).delete()
+    return summary
+
+
+def quarantine_runs(root=None):
+    """Sorted names of the quarantine runs on disk"""
+    directory = os.path.join(root or settings.MEDIA_ROOT, QUARANTINE_DIR)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(entry.name for entry in os.scandir(directory) if entry.is_dir())
+
+
+def _tree_size(path):
+    total = 0
+    for directory, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(directory, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def purge(root=None, quarantine_days=None, dry_run=False):
+    """Delete quarantine runs older than ``quarantine_days``; returns a summary dict"""
+    root = root or settings.MEDIA_ROOT
+    quarantine_days = get_config()['QUARANTINE_DAYS'] if quarantine_days is None else quarantine_days
+    cutoff = (timezone.now() - timedelta(days=quarantine_days)).strftime('%Y%m%dT%H%M%S')
+    summary = {'purged_runs': [], 'reclaimed_bytes': 0}
+    for run in quarantine_runs(root):
+        if run > cutoff:
+            continue
+        path = os.path.join(root, QUARANTINE_DIR, run)
+        summary['reclaimed_bytes'] += _tree_size(path)
+        summary['purged_runs'].append(run)
+        if not dry_run:
+            shutil.rmtree(path)
+    return summary
+
+
+def restore(run, root=None):
+    """Move every file of quarantine ``run`` back into place; returns the count
+
+    Blobs get back the MediaBlob rows quarantine() deleted, counted from the
+    tables, so a restored blob is reference counted (and shared) again.
+    """
+    from .models import MediaBlob
+
+    root = root or settings.MEDIA_ROOT
+    base = os.path.join(root, QUARANTINE_DIR, run)
+    restored = []
+    for _directory, files in walk(base):
+        for name, stat in files.items():
+            _move(os.path.join(base, name), os.path.join(root, name))
+            restored.append((name, stat.st_size))
+    shutil.rmtree(base)
+
+    blobs = {name: size for name, size in restored if storage.is_blob(name)}
+    if blobs:
+        counts = storage.count_references(list(blobs))
+        with transaction.atomic():
+            for name, size in blobs.items():
+                MediaBlob.objects.update_or_create(name=name, defaults={'size': size, 'refcount': counts[name]})
+    return len(restored)
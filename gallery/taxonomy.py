@@ -0,0 +1,106 @@
+"""
+Normalised medium/style/theme taxonomy.
+
+Artist.medium/style/theme and Artwork.medium stay free text for editing;
+each comma-, semicolon- or slash-separated value is parsed into a Term
+(unique per kind and slug) and linked through ArtistTerm / ArtworkTerm.
+Signals keep the links in sync on save, migration 0019 (and
+``manage.py backfill_taxonomy``) parses existing rows, and catalogue filters
+use indexed joins on the through tables instead of ``icontains`` scans, so "Oil" no longer matches
+"Oil on Canvas" or "Soil".
+"""
+import re
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from .models import Artist, ArtistTerm, Artwork, ArtworkTerm, Term
+
+TERM_SPLIT = re.compile(r'[,;/]')
+
+ARTIST_KINDS = ('medium', 'style', 'theme')
+# Artwork filters: medium is the artwork's own, style and theme its artist's
+ARTWORK_KINDS = ('medium',)
+
+
+def parse_terms(text):
+    """[(slug, name), ...] for a free-text field, de-duplicated and in order"""
+    seen = {}
+    for part in TERM_SPLIT.split(text or ''):
+        name = ' '.join(part.split())
+        slug = slugify(name)[:200]
+        if slug and slug not in seen:
+            seen[slug] = name[:200]
+    return list(seen.items())
+
+
+def get_terms(kind, parsed):
+    """Term objects for parsed (slug, name) pairs, creating any that are missing"""
+    if not parsed:
+        return []
+    slugs = [slug for slug, _name in parsed]
+    existing = {term.slug: term for term in Term.objects.filter(kind=kind, slug__in=slugs)}
+    missing = [Term(kind=kind, slug=slug, name=name) for slug, name in parsed if slug not in existing]
+    if missing:
+        Term.objects.bulk_create(missing, ignore_conflicts=True)
+        existing = {term.slug: term for term in Term.objects.filter(kind=kind, slug__in=slugs)}
+    return [existing[slug] for slug in slugs if slug in existing]
+
+
+def _sync(through, owner_field, owner_id, kinds, wanted_terms):
+    """Make the through rows for one owner match wanted_terms"""
+    current = set(
+        through.objects.filter(**{owner_field: owner_id}, term__kind__in=kinds)
+        .values_list('term_id', flat=True)
+    )
+    wanted = {term.id for term in wanted_terms}
+    stale = current - wanted
+    if stale:
+        through.objects.filter(**{owner_field: owner_id}, term_id__in=stale).delete()
+    through.objects.bulk_create(
+        [through(**{owner_field: owner_id}, term_id=term_id) for term_id in wanted - current],
+        ignore_conflicts=True,
+    )
+
+
+def sync_artwork_terms(artwork):
+    with transaction.atomic():
+        terms = get_terms('medium', parse_terms(artwork.medium))
+        _sync(ArtworkTerm, 'artwork_id', artwork.pk, ('medium',), terms)
+
+
+def sync_artist_terms(artist):
+    with transaction.atomic():
+        terms = []
+        for kind in ARTIST_KINDS:
+            terms += get_terms(kind, parse_terms(getattr(artist, kind)))
+        _sync(ArtistTerm, 'artist_id', artist.pk, ARTIST_KINDS, terms)
+
+
+@transaction.atomic
+def backfill(batch_size=1000):
+    """Parse every existing artist and artwork; returns (artists, artworks) processed"""
+    artists = 0
+    for artist in Artist.objects.only('id', *ARTIST_KINDS).iterator(chunk_size=batch_size):
+        sync_artist_terms(artist)
+        artists += 1
+    artworks = 0
+    for artwork in Artwork.objects.only('id', 'medium').iterator(chunk_size=batch_size):
+        sync_artwork_terms(artwork)
+        artworks += 1
+    # Terms no longer used by anything
+    Term.objects.filter(artists__isnull=True, artworks__isnull=True).delete()
+    return artists, artworks
+
+
+# ============================================================================
+# FILTERING
+# ============================================================================
+
+def filter_artworks_by_terms(queryset, kind, slugs):
+    """Artworks having any of the given terms (medium on the artwork, style/theme on its artist)"""
+    if kind in ARTWORK_KINDS:
+        artwork_ids = ArtworkTerm.objects.filter(term__kind=kind, term__slug__in=slugs).values('artwork_id')
+        return queryset.filter(id__in=artwork_ids)
+    artist_ids = ArtistTerm.objects.filter(term__kind=kind, term__slug__in=slugs).values('artist_id')
+    return queryset.filter(artist_id__in=artist_ids)
@@ -0,0 +1,36 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from gallery.assets import BUNDLES, is_built
+from gallery.critical_css import SITE_CSS, critical_for
+
+register = template.Library()
+
+
+@register.simple_tag
+def static_bundle(name):
+    """<link> tags for a CSS bundle: the built bundle, or its parts in development"""
+    return format_html_join('\n    ', '<link rel="stylesheet" href="{}">', ((url,) for url in _bundle_urls(name)))
+
+
+def _bundle_urls(name):
+    return [static(part) for part in ([name] if is_built() else BUNDLES[name])]
+
+
+@register.simple_tag
+def critical_css(page):
+    """Inline critical CSS for ``page`` and load the site CSS without blocking rendering"""
+    css = critical_for(page)
+    if css is None:
+        return static_bundle(SITE_CSS)
+    urls = _bundle_urls(SITE_CSS)
+    deferred = format_html_join(
+        '\n    ', '<link rel="preload" href="{}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'">',
+        ((url,) for url in urls),
+    )
+    fallback = format_html_join('', '<link rel="stylesheet" href="{}">', ((url,) for url in urls))
+    # The CSS is our own build output, not user input; only a closing tag could break out.
+    inline = mark_safe(css.replace('</', '<\\/'))
+    return format_html('<style>{}</style>\n    {}\n    <noscript>{}</noscript>', inline, deferred, fallback)
@@ -0,0 +1,17 @@
+from django import template
+
+from gallery.fragments import render_cards
+
+register = template.Library()
+
+
+@register.filter
+def artwork_cards(artworks):
+    """Cached _artwork_card.html for every artwork, fetched in one round trip"""
+    return render_cards('artwork', artworks)
+
+
+@register.filter
+def artist_cards(artists):
+    """Cached _artist_card.html for every artist, fetched in one round trip"""
+    return render_cards('artist', artists)
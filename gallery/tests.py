@@ -1,3 +1,1221 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    assets, benchmark, caching, events, facets, ingest, instrumentation, media, popularity, profiling, query_plans,
+    storage, sweeper, taxonomy,
+)
+from .models import (
+    Artist, ArtistTerm, Artwork, ArtworkPopularity, InventoryRollup, MediaBlob, Order, RelatedArtwork,
+    RelatedArtworkRefresh, SalesRollup, Term, User,
+)
+from .recommendations import build_all
+from .urls import QUERY_BUDGETS
+
+FIXTURE_SIZES = (1, 10, 100)
+
+
+@override_settings(GALLERY_EVENTS={'ENABLED': False})
+class QueryBudgetTests(TestCase):
+    """Public views must run a fixed number of queries, whatever the data size"""
+
+    PATHS = {
+        'home': lambda artists, artworks: reverse('home'),
+        'about': lambda artists, artworks: reverse('about'),
+        'contact': lambda artists, artworks: reverse('contact'),
+        'artists': lambda artists, artworks: reverse('artists'),
+        'artist_detail': lambda artists, artworks: reverse('artist_detail', args=[artists[0].id]),
+        'artworks': lambda artists, artworks: reverse('artworks'),
+        'artwork_detail': lambda artists, artworks: reverse('artwork_detail', args=[artworks[0].id]),
+        'cart': lambda artists, artworks: reverse('cart'),
+        'checkout': lambda artists, artworks: reverse('checkout'),
+    }
+
+    def build_catalogue(self, size):
+        """``size`` artists, and ``size`` artworks all by the first of them"""
+        owner = User.objects.create_user(email=f'owner{size}@example.com', password='pw', role='owner')
+        artists = [
+            Artist.objects.create(first_name=f'Artist{number}', last_name='Test', medium='Oil',
+                                  style='Abstract', theme='Sea')
+            for number in range(size)
+        ]
+        artworks = [
+            Artwork.objects.create(artist=artists[0], title=f'Work {number}', price=1000 + number,
+                                   medium='Oil on Canvas', year=2000, created_by=owner)
+            for number in range(size)
+        ]
+        build_all()
+        return artists, artworks
+
+    def count_queries(self, client, path):
+        client.get(path)  # warm the session and the facet cache
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        return len(captured.captured_queries)
+
+    def assertQueryBudget(self, name):
+        """Render the view at every fixture size and compare the query counts"""
+        counts = {}
+        for size in FIXTURE_SIZES:
+            with transaction.atomic():
+                artists, artworks = self.build_catalogue(size)
+                client = Client()
+                session = client.session
+                session['cart'] = {str(artwork.id): {'quantity': 1} for artwork in artworks}
+                session.save()
+                client.cookies['sessionid'] = session.session_key
+                counts[size] = self.count_queries(client, self.PATHS[name](artists, artworks))
+                transaction.set_rollback(True)
+
+        self.assertEqual(len(set(counts.values())), 1,
+                         f'{name}: query count grows with data size {counts}')
+        self.assertLessEqual(counts[FIXTURE_SIZES[-1]], QUERY_BUDGETS[name],
+                             f'{name}: {counts[FIXTURE_SIZES[-1]]} queries, budget {QUERY_BUDGETS[name]}')
+
+    def test_every_budget_is_checked(self):
+        self.assertEqual(set(QUERY_BUDGETS), set(self.PATHS))
+
+    def test_home(self):
+        self.assertQueryBudget('home')
+
+    def test_about(self):
+        self.assertQueryBudget('about')
+
+    def test_contact(self):
+        self.assertQueryBudget('contact')
+
+    def test_artists(self):
+        self.assertQueryBudget('artists')
+
+    def test_artist_detail(self):
+        self.assertQueryBudget('artist_detail')
+
+    def test_artworks(self):
+        self.assertQueryBudget('artworks')
+
+    def test_artwork_detail(self):
+        self.assertQueryBudget('artwork_detail')
+
+    def test_cart(self):
+        self.assertQueryBudget('cart')
+
+    def test_checkout(self):
+        self.assertQueryBudget('checkout')
+
+    def test_benchmark_needs_an_iteration(self):
+        with self.assertRaises(ValueError):
+            benchmark.measure({'path': reverse('about')}, 0)
+        with self.assertRaises(CommandError):
+            call_command('run_benchmark', iterations=0)
+
+
+def _image_bytes(size, mode='RGB', image_format='JPEG'):
+    output = io.BytesIO()
+    Image.new(mode, size, (200, 100, 50, 128)[:len(mode)]).save(output, image_format)
+    return output.getvalue()
+
+
+class ImageHost(BaseHTTPRequestHandler):
+    """Stand-in for the remote hosts image_url points at"""
+
+    ROUTES = {
+        '/photo.jpg': ('image/jpeg', _image_bytes((3200, 2000))),
+        '/logo.png': ('image/png', _image_bytes((400, 400), 'RGBA', 'PNG')),
+        '/page.html': ('text/html', b'<html></html>'),
+        '/fake.jpg': ('image/jpeg', b'not really a jpeg'),
+        '/huge.jpg': ('image/jpeg', b'x' * 4096),
+    }
+
+    def do_GET(self):
+        if self.path == '/moved.jpg':
+            self.send_response(302)
+            self.send_header('Location', '/photo.jpg')
+            self.end_headers()
+            return
+        if self.path not in self.ROUTES:
+            self.send_error(404)
+            return
+        content_type, body = self.ROUTES[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RemoteImageIngestTests(TestCase):
+    """manage.py ingest_remote_images against a local HTTP server"""
+
+    CONFIG = {**ingest.DEFAULTS, 'ALLOW_PRIVATE_HOSTS': True, 'MAX_BYTES': 1024 * 1024, 'WORKERS': 2}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ImageHost)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        self.artist = Artist.objects.create(first_name='Remote', last_name='Artist')
+        self.owner = owner
+
+    def artwork(self, path, **fields):
+        return Artwork.objects.create(artist=self.artist, title=path, price=100, medium='Oil on Canvas',
+                                      year=2000, created_by=self.owner, image_url=self.base_url + path, **fields)
+
+    def run_ingest(self, **options):
+        return ingest.ingest(config=self.CONFIG, **options)
+
+    def test_stores_a_resized_local_copy(self):
+        photo, logo, moved = self.artwork('/photo.jpg'), self.artwork('/logo.png'), self.artwork('/moved.jpg')
+        self.assertEqual(photo.primary_image, self.base_url + '/photo.jpg')
+
+        summary = self.run_ingest()
+
+        self.assertEqual((summary['fetched'], summary['failed']), (3, 0))
+        photo.refresh_from_db()
+        self.assertTrue(photo.primary_image.startswith('/media/blobs/'))
+        with Image.open(photo.cached_image.path) as image:
+            self.assertEqual(image.size, (1600, 1000))
+        logo.refresh_from_db()
+        self.assertTrue(logo.cached_image.name.endswith('.png'))
+        moved.refresh_from_db()
+        self.assertEqual(moved.cached_image.name, photo.cached_image.name)
+        self.assertEqual(MediaBlob.objects.get(name=photo.cached_image.name).refcount, 2)
+
+    def test_rejects_unusable_responses(self):
+        artworks = [self.artwork(path) for path in ('/page.html', '/fake.jpg', '/missing.jpg')]
+        artworks.append(self.artwork('/huge.jpg'))
+
+        with self.assertLogs('gallery.ingest', 'WARNING') as logs:
+            summary = ingest.ingest(config={**self.CONFIG, 'MAX_BYTES': 1024})
+
+        self.assertEqual((summary['fetched'], summary['failed']), (0, 4))
+        self.assertEqual(len(logs.records), 4)
+        for artwork in artworks:
+            artwork.refresh_from_db()
+            self.assertFalse(artwork.cached_image)
+            self.assertEqual(artwork.primary_image, artwork.image_url)
+        # Failures are remembered until asked to retry.
+        self.assertEqual(self.run_ingest()['failed'], 0)
+        with self.assertLogs('gallery.ingest', 'WARNING'):
+            self.assertEqual(self.run_ingest(retry_failed=True)['failed'], 4)
+
+    def test_invalid_row_does_not_stop_the_run(self):
+        valid, invalid, other = self.artwork('/photo.jpg'), self.artwork('/moved.jpg'), self.artwork('/logo.png')
+        # A legacy row that full_clean() would reject (no price, not on request).
+        Artwork.objects.filter(pk=invalid.pk).update(price=None)
+
+        summary = self.run_ingest()
+
+        self.assertEqual((summary['fetched'], summary['failed']), (3, 0))
+        for artwork in (valid, invalid, other):
+            artwork.refresh_from_db()
+            self.assertTrue(artwork.cached_image.name.startswith('blobs/'))
+        self.assertEqual(MediaBlob.objects.get(name=valid.cached_image.name).refcount, 2)
+        self.assertEqual(MediaBlob.objects.get(name=other.cached_image.name).refcount, 1)
+
+    def test_changed_url_uses_remote_until_ingested(self):
+        artwork = self.artwork('/photo.jpg')
+        self.run_ingest()
+        artwork = Artwork.objects.get(pk=artwork.pk)
+
+        artwork.image_url = self.base_url + '/logo.png'
+        artwork.save()
+        self.assertEqual(artwork.primary_image, self.base_url + '/logo.png')
+
+        self.assertEqual(self.run_ingest()['fetched'], 1)
+        artwork.refresh_from_db()
+        self.assertTrue(artwork.primary_image.endswith('.png'))
+        self.assertEqual(list(MediaBlob.objects.filter(refcount__gt=0).values_list('name', flat=True)),
+                         [artwork.cached_image.name])
+
+    def test_connects_to_the_checked_address(self):
+        # "images.invalid" never resolves, so the fetch only works if both the
+        # request and its redirect go to the address the host check returned.
+        url = self.base_url.replace('127.0.0.1', 'images.invalid') + '/moved.jpg'
+        with mock.patch.object(ingest, '_check_host', return_value='127.0.0.1') as check:
+            data = ingest.download(url, self.CONFIG)
+        self.assertEqual(data, ImageHost.ROUTES['/photo.jpg'][1])
+        self.assertEqual([call.args[0] for call in check.call_args_list], [url, url.replace('moved', 'photo')])
+
+    def test_refuses_private_hosts_by_default(self):
+        self.artwork('/photo.jpg')
+        with self.assertLogs('gallery.ingest', 'WARNING'):
+            summary = ingest.ingest(config={**self.CONFIG, 'ALLOW_PRIVATE_HOSTS': False})
+        self.assertEqual((summary['fetched'], summary['failed']), (0, 1))
+
+
+class InstrumentationHookTests(SimpleTestCase):
+    """Template and email timings come from the configured backends, nothing patched"""
+
+    def test_templates_and_email_are_timed_inside_a_request(self):
+        from django.core import mail
+        from django.template.loader import render_to_string
+
+        request_metrics = instrumentation.RequestMetrics(max_queries=10)
+        token = instrumentation.activate(request_metrics)
+        try:
+            with override_settings(GALLERY_INSTRUMENTATION={
+                'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+            }):
+                render_to_string('gallery/includes/_artist_card.html', {'artist': Artist(id=1, first_name='Ann')})
+                connection = instrumentation.EmailBackend()
+                connection.send_messages([mail.EmailMessage('Hi', 'Body', to=['ann@example.com'])])
+        finally:
+            instrumentation.deactivate(token)
+
+        self.assertGreater(request_metrics.template_ms, 0)
+        self.assertEqual(request_metrics.email_count, 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_nothing_is_patched(self):
+        from django.core.mail import EmailMessage
+        from django.template.backends.django import Template
+
+        self.assertFalse(hasattr(Template.render, '__wrapped__'))
+        self.assertFalse(hasattr(EmailMessage.send, '__wrapped__'))
+
+
+class StackSamplerTests(SimpleTestCase):
+    def test_switch_interval_is_restored(self):
+        before = sys.getswitchinterval()
+
+        def fail():
+            raise ValueError
+
+        outer = profiling.StackSampler(0.001)
+        inner = profiling.StackSampler(0.001)
+        self.assertEqual(outer.runcall(lambda: inner.runcall(sum, [1, 2])), 3)
+        with self.assertRaises(ValueError):
+            outer.runcall(fail)
+        with mock.patch.object(threading.Thread, 'start', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                outer.runcall(sum, [])
+        self.assertEqual(sys.getswitchinterval(), before)
+
+
+class MetricsAccessTests(TestCase):
+    """/metrics/ behind the front proxy, where every request comes from loopback"""
+
+    def test_anonymous_request_through_proxy_is_forbidden(self):
+        response = Client().get(reverse('metrics'), REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.9')
+        self.assertEqual(response.status_code, 403)
+
+    def test_owner_can_scrape(self):
+        User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        client = Client()
+        client.login(email='owner@example.com', password='pw')
+        self.assertEqual(client.get(reverse('metrics')).status_code, 200)
+
+    @override_settings(GALLERY_METRICS={'TOKEN': 's3cret'})
+    def test_bearer_token(self):
+        client = Client()
+        self.assertEqual(client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        self.assertEqual(client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+
+class TaxonomyTests(TestCase):
+    """Free-text medium/style/theme parsed into terms, and the filters built on them"""
+
+    def setUp(self):
+        self.owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+
+    def artwork(self, artist, medium):
+        return Artwork.objects.create(artist=artist, title=medium, price=100, medium=medium,
+                                      year=2000, created_by=self.owner)
+
+    def artist_terms(self, artist):
+        return set(ArtistTerm.objects.filter(artist=artist).values_list('term__kind', 'term__slug'))
+
+    def test_parse_terms(self):
+        self.assertEqual(
+            taxonomy.parse_terms(' Oil; Acrylic / oil ,Mixed   Media,,'),
+            [('oil', 'Oil'), ('acrylic', 'Acrylic'), ('mixed-media', 'Mixed Media')],
+        )
+        self.assertEqual(taxonomy.parse_terms(''), [])
+        self.assertEqual(taxonomy.parse_terms(None), [])
+
+    def test_saves_keep_terms_in_sync(self):
+        artist = Artist.objects.create(first_name='Ann', medium='Oil, Bronze', style='Abstract', theme='Sea')
+        self.assertEqual(self.artist_terms(artist), {
+            ('medium', 'oil'), ('medium', 'bronze'), ('style', 'abstract'), ('theme', 'sea'),
+        })
+
+        artist.style = 'Figurative'
+        artist.medium = 'Oil'
+        artist.save()
+        self.assertEqual(self.artist_terms(artist), {('medium', 'oil'), ('style', 'figurative'), ('theme', 'sea')})
+
+        artwork = self.artwork(artist, 'Oil on Canvas')
+        self.assertEqual(list(artwork.terms.values_list('kind', 'slug')), [('medium', 'oil-on-canvas')])
+
+    def test_filters_match_whole_terms(self):
+        abstract = Artist.objects.create(first_name='Ann', style='Abstract')
+        figurative = Artist.objects.create(first_name='Bo', style='Figurative; Abstract Expressionism')
+        oil = self.artwork(abstract, 'Oil')
+        canvas = self.artwork(figurative, 'Oil on Canvas')
+        soil = self.artwork(figurative, 'Soil')
+
+        by_medium = taxonomy.filter_artworks_by_terms(Artwork.objects.all(), 'medium', ['oil'])
+        self.assertEqual(list(by_medium), [oil])
+        by_style = taxonomy.filter_artworks_by_terms(Artwork.objects.all(), 'style', ['abstract'])
+        self.assertEqual(list(by_style), [oil])
+        by_style = taxonomy.filter_artworks_by_terms(Artwork.objects.all(), 'style', ['abstract-expressionism'])
+        self.assertEqual(set(by_style), {canvas, soil})
+
+    def test_backfill_links_existing_rows(self):
+        artist = Artist.objects.create(first_name='Ann', medium='Ink', style='Abstract')
+        ArtistTerm.objects.all().delete()
+        Term.objects.all().delete()
+
+        taxonomy.backfill()
+
+        self.assertEqual(self.artist_terms(artist), {('medium', 'ink'), ('style', 'abstract')})
+
+    def test_seed_catalogue_links_every_kind(self):
+        call_command('seed_catalogue', artists=3, artworks=5, users=0, stdout=io.StringIO())
+
+        for artist in Artist.objects.all():
+            kinds = {kind for kind, _slug in self.artist_terms(artist)}
+            self.assertEqual(kinds, {'medium', 'style', 'theme'})
+        self.assertFalse(Artwork.objects.filter(terms__isnull=True).exists())
+
+
+class RecommendationRefreshTests(TestCase):
+    """Feature edits rewrite only the neighbour rows they can affect"""
+
+    def setUp(self):
+        owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        oil = Artist.objects.create(first_name='Ann', style='Abstract', theme='Sea')
+        bronze = Artist.objects.create(first_name='Bo', style='Figurative', theme='Body')
+        self.artworks = [
+            Artwork.objects.create(artist=artist, title=f'{medium} {number}', price=price, medium=medium,
+                                   year=2000, created_by=owner)
+            for number, (artist, medium, price) in enumerate(
+                [(oil, 'Oil on Canvas', 1000)] * 8 + [(bronze, 'Bronze', 50000)] * 8
+            )
+        ]
+        build_all(k=3)
+
+    def rows(self):
+        return {
+            artwork_id: list(RelatedArtwork.objects.filter(artwork_id=artwork_id).values_list('pk', flat=True))
+            for artwork_id in RelatedArtwork.objects.values_list('artwork_id', flat=True).distinct()
+        }
+
+    def test_price_edit_rewrites_only_affected_rows(self):
+        edited = self.artworks[7]   # ties rank higher ids first, so this one is listed
+        listing = set(RelatedArtwork.objects.filter(related=edited).values_list('artwork_id', flat=True))
+        self.assertTrue(listing)
+        before = self.rows()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            edited.price = 90000
+            edited.save()
+
+        after = self.rows()
+        rewritten = {artwork_id for artwork_id in before if before[artwork_id] != after.get(artwork_id)}
+        self.assertIn(edited.id, rewritten)
+        self.assertEqual(rewritten, {edited.id} | listing)
+
+    def test_refreshed_row_matches_a_full_build(self):
+        edited = self.artworks[3]
+        with self.captureOnCommitCallbacks(execute=True):
+            edited.medium = 'Bronze'
+            edited.save()
+        refreshed = list(RelatedArtwork.objects.filter(artwork=edited).values_list('related_id', 'score'))
+
+        build_all()
+        self.assertEqual(list(RelatedArtwork.objects.filter(artwork=edited).values_list('related_id', 'score')),
+                         refreshed)
+
+    def test_queued_refresh_runs_from_the_command(self):
+        edited = self.artworks[3]
+        before = self.rows()
+        with override_settings(GALLERY_RECOMMENDATIONS={'QUEUE': True}), \
+                self.captureOnCommitCallbacks(execute=True):
+            edited.medium = 'Bronze'
+            edited.save()
+        self.assertEqual(self.rows(), before)
+        self.assertEqual(list(RelatedArtworkRefresh.objects.values_list('artwork_id', flat=True)), [edited.id])
+
+        call_command('build_recommendations', pending=True, stdout=io.StringIO())
+        self.assertFalse(RelatedArtworkRefresh.objects.exists())
+        self.assertNotEqual(self.rows()[edited.id], before[edited.id])
+
+    def test_price_alone_does_not_relate(self):
+        loner = Artwork.objects.create(artist=Artist.objects.create(first_name='Cy'), title='Loner', price=1000,
+                                       medium='Glass', year=2000, created_by=self.artworks[0].created_by)
+        build_all()
+        self.assertFalse(RelatedArtwork.objects.filter(artwork=loner).exists())
+
+    def test_sold_flag_does_not_refresh(self):
+        before = self.rows()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.artworks[0].sold = True
+            self.artworks[0].save()
+        self.assertEqual(self.rows(), before)
+
+
+@override_settings(GALLERY_EVENTS={'ENABLED': False})
+class SalesRollupTests(TestCase):
+    """Checkout records what was charged, and the rollups follow the orders"""
+
+    CUSTOMER = {
+        'first_name': 'Ann', 'last_name': 'Lee', 'email': 'ann@example.com', 'phone': '021',
+        'address': '1 Main Road', 'city': 'Cape Town', 'country': 'ZA', 'province': 'WC', 'postal_code': '8005',
+    }
+
+    def setUp(self):
+        owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        artist = Artist.objects.create(first_name='Ann')
+        self.full_price = Artwork.objects.create(artist=artist, title='Full', price=1000, medium='Oil',
+                                                 year=2000, created_by=owner)
+        self.discounted = Artwork.objects.create(artist=artist, title='Sale', price=2000, discounted_price=1500,
+                                                 medium='Bronze', year=2000, created_by=owner)
+        self.already_sold = Artwork.objects.create(artist=artist, title='Gone', price=5000, medium='Oil',
+                                                   year=2000, created_by=owner)
+
+    def checkout(self, *artworks):
+        client = Client()
+        for artwork in artworks:
+            client.post(reverse('add_to_cart', args=[artwork.id]), {'action': 'add_to_cart'})
+        return client.post(reverse('process_checkout'), self.CUSTOMER)
+
+    def rollup(self, dimension, key):
+        return SalesRollup.objects.get(dimension=dimension, key=key)
+
+    def test_checkout_charges_and_records_display_price(self):
+        client = Client()
+        for artwork in (self.full_price, self.discounted, self.already_sold):
+            client.post(reverse('add_to_cart', args=[artwork.id]), {'action': 'add_to_cart'})
+        self.already_sold.mark_as_sold()     # sold to someone else before this checkout
+        client.post(reverse('process_checkout'), self.CUSTOMER)
+
+        order = Order.objects.get()
+        self.assertEqual(order.subtotal, Decimal('2500'))
+        self.assertEqual(order.tax, Decimal('375.00'))
+        self.assertEqual(order.total, Decimal('3375.00'))
+        self.assertEqual(
+            sorted(order.items.values_list('title', 'list_price', 'sale_price')),
+            [('Full', Decimal('1000'), Decimal('1000')), ('Sale', Decimal('2000'), Decimal('1500'))],
+        )
+
+        total = self.rollup('total', 'all')
+        self.assertEqual((total.orders, total.items_sold), (1, 2))
+        self.assertEqual(total.revenue, order.subtotal)
+        self.assertEqual(total.list_value, Decimal('3000'))
+        self.assertEqual(total.discount_total, Decimal('500'))
+        self.assertEqual(self.rollup('medium', 'bronze').revenue, Decimal('1500'))
+        self.assertEqual(self.rollup('medium', 'oil').items_sold, 1)
+
+    def test_cancel_and_reinstate(self):
+        self.checkout(self.full_price, self.discounted)
+        order = Order.objects.get()
+
+        order.status = 'cancelled'
+        order.save()
+        total = self.rollup('total', 'all')
+        self.assertEqual((total.orders, total.items_sold, total.revenue), (0, 0, 0))
+
+        order.status = 'placed'
+        order.save()
+        self.assertEqual(self.rollup('total', 'all').revenue, Decimal('2500'))
+
+    def test_cancel_recounts_a_missing_rollup_row(self):
+        self.checkout(self.full_price)
+        self.checkout(self.discounted)
+        first = Order.objects.get(items__title='Full')
+        SalesRollup.objects.filter(dimension='total').delete()      # e.g. a partial rebuild
+
+        first.status = 'cancelled'
+        first.save()
+
+        total = self.rollup('total', 'all')
+        self.assertEqual((total.orders, total.items_sold, total.revenue), (1, 1, Decimal('1500')))
+        self.assertEqual(self.rollup('medium', 'oil').orders, 0)
+
+    def test_failed_order_leaves_artworks_unsold(self):
+        with mock.patch('gallery.views.record_order', side_effect=RuntimeError), \
+                self.assertLogs('gallery.checkout', 'ERROR'):
+            self.checkout(self.full_price)
+
+        self.full_price.refresh_from_db()
+        self.assertFalse(self.full_price.sold)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(InventoryRollup.objects.filter(sold=True).exists())
+
+    def test_inventory_follows_sales(self):
+        self.checkout(self.discounted)
+        unsold = InventoryRollup.objects.get(availability=self.discounted.availability, sold=False, is_active=True)
+        sold = InventoryRollup.objects.get(availability=self.discounted.availability, sold=True, is_active=True)
+        self.assertEqual((unsold.artwork_count, unsold.total_value), (2, Decimal('6000')))
+        self.assertEqual((sold.artwork_count, sold.total_value), (1, Decimal('1500')))
+
+
+class MinifierTests(SimpleTestCase):
+
+    def test_minify_css(self):
+        css = '/* header */\nh1 > a ,  p {\n  color: red ;\n  content: "a  /* b */  c";\n}\n'
+        self.assertEqual(assets.minify_css(css), 'h1>a,p{color:red;content:"a  /* b */  c"}')
+
+    def test_minify_js_drops_only_comment_only_lines(self):
+        js = (
+            '/* note */ init();\n'
+            '  // setup\n'
+            '  if (a) {\n'
+            '\n'
+            '    b(); /* trailing\n'
+            '       block */\n'
+            '  }\n'
+        )
+        self.assertEqual(assets.minify_js(js), 'init();\nif (a) {\nb();\n}\n')
+
+    def test_minify_js_leaves_literals_alone(self):
+        js = (
+            '  const html = `<ul>\n'
+            '    // not a comment\n'
+            '\n'
+            '    ${items.map(i => `<li>${i}</li>`).join("")}\n'
+            '  </ul>`;\n'
+            "  const url = 'http://example.com/*x*/';\n"
+            '  const re = /\\/\\/"/;\n'
+        )
+        self.assertEqual(assets.minify_js(js), (
+            'const html = `<ul>\n'
+            '    // not a comment\n'
+            '\n'
+            '    ${items.map(i => `<li>${i}</li>`).join("")}\n'
+            '  </ul>`;\n'
+            "const url = 'http://example.com/*x*/';\n"
+            'const re = /\\/\\/"/;\n'
+        ))
+
+    def test_accepted_encodings(self):
+        self.assertEqual(assets.accepted_encodings('gzip, deflate, br'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(assets.accepted_encodings('br;q=0, gzip;q=0.5'), {'gzip'})
+        self.assertEqual(assets.accepted_encodings('*, gzip;q=0'), {'*', 'br'})
+        self.assertEqual(assets.accepted_encodings(''), set())
+
+
+class StaticBuildTests(SimpleTestCase):
+    """collectstatic through CompressedManifestStorage, then serve() from the build"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root)
+        cls.settings_override = override_settings(
+            STATIC_ROOT=cls.static_root,
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'gallery.assets.CompressedManifestStorage'}},
+        )
+        cls.settings_override.enable()
+        cls.addClassCleanup(cls.settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def setUp(self):
+        assets._immutable_names = None
+        self.addCleanup(setattr, assets, '_immutable_names', None)
+
+    def built(self, name):
+        return assets.storages['staticfiles'].stored_name(name)
+
+    def get(self, name, **headers):
+        return assets.serve(RequestFactory().get('/static/' + name, **headers), name)
+
+    def test_post_process_bundles_minifies_and_compresses(self):
+        bundle = self.built('gallery/css/site.css')
+        path = os.path.join(self.static_root, bundle)
+        with open(path) as handle:
+            css = handle.read()
+        self.assertNotIn('/*', css)
+        self.assertNotIn('\n  ', css)
+        with open(path + '.gz', 'rb') as handle:
+            self.assertEqual(gzip.decompress(handle.read()).decode(), css)
+
+    def test_serve_negotiates_encoding(self):
+        name = self.built('gallery/css/site.css')
+
+        response = self.get(name, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(response['Cache-Control'], assets.IMMUTABLE)
+
+        response = self.get(name, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Content-Type'], 'text/css')
+
+        response = self.get('gallery/css/site.css', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Cache-Control'], assets.MUTABLE)
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+
+
+class SweeperTests(TestCase):
+    """Orphaned media: quarantined out of reach, purged later, or restored with their counts"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        artist = Artist.objects.create(first_name='Ann')
+        self.kept, self.replaced = [
+            Artwork.objects.create(artist=artist, title=title, price=100, medium='Oil', year=2000, created_by=owner,
+                                   image=SimpleUploadedFile(f'{title}.jpg', _image_bytes((10 + size, 10))))
+            for size, title in enumerate(('kept', 'replaced'))
+        ]
+        self.orphan_blob, self.orphan_size = self.replaced.image.name, self.replaced.image.size
+        # Dropped without its file being removed, as a crash before the on_commit cleanup leaves it.
+        Artwork.objects.filter(pk=self.replaced.pk).update(image='')
+        MediaBlob.objects.filter(name=self.orphan_blob).update(refcount=0)
+        self.write('artists/old-profile.jpg', b'old')
+        self.write('.uploads/tmpabc', b'partial')
+        self.fresh = self.write('artworks/just-uploaded.jpg', b'new', age_hours=0)
+        for name in (self.kept.image.name, self.orphan_blob):
+            self.age(name)
+
+    def write(self, name, data, age_hours=48):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as handle:
+            handle.write(data)
+        self.age(name, age_hours)
+        return name
+
+    def age(self, name, hours=48):
+        then = time.time() - hours * 3600
+        os.utime(os.path.join(self.root, name), (then, then))
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def test_quarantine_then_purge(self):
+        summary = sweeper.quarantine()
+
+        self.assertEqual(summary['quarantined'], 2)
+        run = summary['run']
+        self.assertTrue(self.exists(self.kept.image.name))
+        self.assertTrue(self.exists(self.fresh))
+        self.assertTrue(self.exists('.uploads/tmpabc'))
+        self.assertFalse(self.exists('artists/old-profile.jpg'))
+        self.assertTrue(self.exists(f'.quarantine/{run}/artists/old-profile.jpg'))
+        self.assertFalse(MediaBlob.objects.filter(name=self.orphan_blob).exists())
+        # Not reachable through MEDIA_URL while quarantined.
+        request = RequestFactory().get('/media/')
+        self.assertEqual(media.serve(request, f'.quarantine/{run}/artists/old-profile.jpg').status_code, 404)
+        self.assertEqual(media.serve(request, 'artworks/../.uploads/tmpabc').status_code, 404)
+
+        self.assertEqual(sweeper.purge()['purged_runs'], [])
+        summary = sweeper.purge(quarantine_days=0)
+        self.assertEqual(summary['purged_runs'], [run])
+        self.assertEqual(summary['reclaimed_bytes'], 3 + self.orphan_size)
+        self.assertEqual(sweeper.quarantine_runs(), [])
+
+    def test_restore_recreates_blob_counts(self):
+        run = sweeper.quarantine()['run']
+        # The row that used the blob comes back (say, from a backup).
+        Artwork.objects.filter(pk=self.replaced.pk).update(image=self.orphan_blob)
+
+        self.assertEqual(sweeper.restore(run), 2)
+
+        self.assertTrue(self.exists(self.orphan_blob))
+        self.assertTrue(self.exists('artists/old-profile.jpg'))
+        self.assertEqual(sweeper.quarantine_runs(), [])
+        blob = MediaBlob.objects.get(name=self.orphan_blob)
+        self.assertEqual((blob.refcount, blob.size), (1, self.orphan_size))
+        # Counted again, so releasing it deletes it as usual.
+        with self.captureOnCommitCallbacks(execute=True):
+            Artwork.objects.get(pk=self.replaced.pk).delete()
+        self.assertFalse(self.exists(self.orphan_blob))
+
+
+class CatalogueGenerationTests(TestCase):
+    """Generation-versioned entries and what moves them on"""
+
+    def setUp(self):
+        self.cache = caching.get_cache(caching.CATALOGUE)
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+
+    def test_missing_generation_is_seeded_past_old_ones(self):
+        first = caching.generation()
+        self.assertGreater(first, 1)
+        self.assertEqual(caching.generation(), first)
+        self.assertEqual(caching.bump_generation(), first + 1)
+
+        time.sleep(0.01)                              # a few milliseconds later...
+        self.cache.delete(caching.GENERATION_KEY)     # ...the counter is evicted
+        self.assertGreater(caching.generation(), first + 1)
+
+    def test_bump_invalidates_versioned_entries(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(caching.get_or_compute('answer', compute, timeout=60), 1)
+        self.assertEqual(caching.get_or_compute('answer', compute, timeout=60), 1)
+        caching.bump_generation()
+        self.assertEqual(caching.get_or_compute('answer', compute, timeout=60), 2)
+        self.assertEqual(caching.get_or_compute('plain', compute, timeout=60, versioned=False), 3)
+        caching.bump_generation()
+        self.assertEqual(caching.get_or_compute('plain', compute, timeout=60, versioned=False), 3)
+
+    def test_catalogue_writes_bump_the_generation(self):
+        before = caching.generation()
+        artist = Artist.objects.create(first_name='Ann')
+        self.assertGreater(caching.generation(), before)
+
+        before = caching.generation()
+        artist.delete()
+        self.assertGreater(caching.generation(), before)
+
+    def test_only_faceted_fields_bump_the_generation(self):
+        owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        artwork = Artwork.objects.create(artist=Artist.objects.create(first_name='Ann'), title='Sea', price=100,
+                                         medium='Oil', year=2000, created_by=owner)
+        artwork = Artwork.objects.get(pk=artwork.pk)
+        before = caching.generation()
+        artwork.title = 'Sea II'
+        artwork.save()
+        artwork.mark_as_sold()
+        self.assertEqual(caching.generation(), before)
+
+        artwork.medium = 'Bronze'
+        artwork.save()
+        self.assertGreater(caching.generation(), before)
+
+
+class FacetCountTests(TestCase):
+    """Every sidebar count equals the number of results picking that option gives"""
+
+    def setUp(self):
+        caching.bump_generation()
+        owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        self.artists = artists = [
+            Artist.objects.create(first_name='Ann', style='Abstract', theme='Sea; Light'),
+            Artist.objects.create(first_name='Bo', style='Figurative, Abstract', theme='Body'),
+            Artist.objects.create(first_name='Cy', style='Pop'),
+        ]
+        mediums = ['Oil', 'Oil, Acrylic', 'Bronze', 'Ink / Oil', 'Acrylic']
+        for number in range(30):
+            Artwork.objects.create(
+                artist=artists[number % 3], title=f'Work {number}', medium=mediums[number % 5],
+                price=(number * 2311) % 80000 + 500, year=1950 + number * 2, created_by=owner,
+                availability=('available', 'on_request')[number % 7 == 0], sold=number % 4 == 0,
+            )
+        Artwork.objects.filter(title='Work 1').update(is_active=False)
+
+    def assertCountsMatch(self, filters):
+        base = Artwork.objects.filter(is_active=True)
+        for facet, group in facets.facet_counts(filters).items():
+            others = {name: values for name, values in filters.items() if name != facet}
+            for option in group['options']:
+                expected = facets.apply_filters(base, {**others, facet: {option['value']}}).count()
+                self.assertEqual(option['count'], expected, f"{filters} {facet}={option['value']}")
+            self.assertTrue(group['options'] or not base.exists(), facet)
+
+    def test_counts_without_filters(self):
+        self.assertCountsMatch({})
+        self.assertEqual(sum(option['count'] for option in facets.facet_counts({})['artist']['options']), 29)
+
+    def test_counts_with_filters(self):
+        self.assertCountsMatch({'medium': {'oil'}})
+        self.assertCountsMatch({'medium': {'oil', 'bronze'}, 'price': {'under-5k', '50k-plus'}})
+        self.assertCountsMatch({'style': {'abstract'}, 'sold': {'0'}, 'decade': {'1960', '1990'}})
+        self.assertCountsMatch({'theme': {'sea'}, 'availability': {'on_request'},
+                                'artist': {str(self.artists[0].id), 'x'}})
+
+    def test_price_sorts_read_the_price_index(self):
+        Artwork.objects.filter(title='Work 2').update(price=None)
+        for sort in ('price_low', 'price_high'):
+            status, statements = query_plans.capture(f"{reverse('artworks')}?sort={sort}")
+            self.assertEqual(status, 200)
+            listing = [sql for sql in statements if 'ORDER BY "gallery_artwork"."effective_price"' in sql]
+            self.assertTrue(listing)
+            for sql in listing:
+                plan = query_plans.explain(sql)
+                self.assertEqual(query_plans.warnings_for(plan), [], plan)
+
+    def test_selection_is_marked(self):
+        options = facets.facet_counts({'medium': {'oil'}})['medium']['options']
+        self.assertEqual([option['label'] for option in options if option['selected']], ['Oil'])
+
+
+class EventBufferTests(TestCase):
+    """track() only buffers; flush() writes batches and keeps them when the sink fails"""
+
+    def setUp(self):
+        self.written = []
+        self.failing = False
+
+    def sink(self, batch):
+        if self.failing:
+            raise OSError('sink unavailable')
+        self.written.extend(batch)
+
+    def buffer(self, **options):
+        options = {'batch_size': 100, 'flush_interval': 3600, 'max_buffer': 5, **options}
+        return events.EventBuffer(self.sink, **options)
+
+    def test_failed_batch_is_kept_up_to_max_buffer(self):
+        buffer = self.buffer()
+        for number in range(3):
+            buffer.add(('view', number))
+        self.failing = True
+        with self.assertLogs('gallery.events', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        for number in range(3, 6):
+            buffer.add(('view', number))
+        self.assertEqual(buffer.dropped, 1)           # the sixth event did not fit
+
+        with self.assertLogs('gallery.events', 'ERROR'):
+            buffer.flush()
+        self.failing = False
+        self.assertEqual(buffer.flush(), 5)
+        self.assertEqual([event[1] for event in self.written], [0, 1, 2, 3, 4])
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_listeners_see_each_written_batch(self):
+        buffer = self.buffer()
+        seen = []
+        buffer.listeners = [seen.append, lambda batch: 1 / 0]
+        buffer.add(('view', 1))
+        with self.assertLogs('gallery.events', 'ERROR'):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(seen, [[('view', 1)]])
+
+    def test_track(self):
+        owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        artist = Artist.objects.create(first_name='Ann')
+        artwork = Artwork.objects.create(artist=artist, title='Seen', price=100, medium='Oil', year=2000,
+                                         created_by=owner)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'events.jsonl')
+        request = RequestFactory().get('/')
+        request.session = Client().session
+        request.session['_auth_user_id'] = str(owner.id)
+
+        with override_settings(GALLERY_EVENTS={'ENABLED': False}):
+            events.track(request, 'view', artwork.id)
+            self.assertEqual(events.flush(), 0)
+        with override_settings(GALLERY_EVENTS={'SINK': 'jsonl', 'PATH': path, 'FLUSH_INTERVAL': 3600}):
+            events.track(request, 'view', artwork.id)
+            events.track(request, 'add_to_cart', str(artwork.id))
+            self.assertEqual(events.flush(), 2)
+
+        with open(path) as handle:
+            written = [json.loads(line) for line in handle]
+        self.assertEqual([(event['event_type'], event['artwork_id'], event['user_id']) for event in written],
+                         [('view', artwork.id, owner.id), ('add_to_cart', artwork.id, owner.id)])
+
+
+class PopularityTests(TestCase):
+    """Forward-decayed scores: stored once, ranking like the decayed score at any time"""
+
+    def setUp(self):
+        owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        artist = Artist.objects.create(first_name='Ann')
+        self.old_favourite, self.new_hit = [
+            Artwork.objects.create(artist=artist, title=title, price=100, medium='Oil', year=2000, created_by=owner)
+            for title in ('Old favourite', 'New hit')
+        ]
+        self.then = popularity.EPOCH + timedelta(days=10)
+        self.now = popularity.EPOCH + timedelta(days=30)
+
+    def events(self, artwork, count, when, event_type='view'):
+        return [(event_type, artwork.id, None, '', when)] * count
+
+    def test_decay_arithmetic(self):
+        popularity.apply_events(self.events(self.old_favourite, 1, self.then) + [('view', 999999, None, '', self.then)])
+        counts = ArtworkPopularity.objects.get()
+        scores = Artwork.objects.get(pk=self.old_favourite.pk)
+        half_life_later = self.then + popularity.TRENDING_HALF_LIFE
+        self.assertAlmostEqual(popularity.current_score(scores.trending_score, popularity.TRENDING_TAU, self.then), 1)
+        self.assertAlmostEqual(
+            popularity.current_score(scores.trending_score, popularity.TRENDING_TAU, half_life_later), 0.5)
+        self.assertAlmostEqual(
+            popularity.current_score(scores.popular_score, popularity.POPULAR_TAU, self.now), 0.5 ** (20 / 30))
+
+        popularity.apply_events(self.events(self.old_favourite, 1, self.then, 'add_to_cart'))
+        counts.refresh_from_db()
+        scores.refresh_from_db()
+        self.assertEqual((counts.views, counts.interest), (1, 1))
+        self.assertAlmostEqual(popularity.current_score(scores.popular_score, popularity.POPULAR_TAU, self.then), 6)
+
+    def test_trending_and_all_time_order(self):
+        popularity.apply_events(self.events(self.old_favourite, 20, self.then) + self.events(self.new_hit, 3, self.now))
+
+        def ranking(field):
+            return list(Artwork.objects.order_by(f'-{field}'))
+
+        self.assertEqual(ranking('popular_score'), [self.old_favourite, self.new_hit])
+        self.assertEqual(ranking('trending_score'), [self.new_hit, self.old_favourite])
+        old = Artwork.objects.get(pk=self.old_favourite.pk)
+        self.assertAlmostEqual(popularity.current_score(old.trending_score, popularity.TRENDING_TAU, self.now),
+                               20 * math.exp(-20 * 86400 / popularity.TRENDING_TAU))
+
+    def test_saving_a_loaded_artwork_keeps_newer_scores(self):
+        artwork = Artwork.objects.get(pk=self.new_hit.pk)
+        popularity.apply_events(self.events(self.new_hit, 3, self.now))
+        artwork.title = 'Renamed'
+        artwork.save()
+
+        artwork.refresh_from_db()
+        self.assertEqual(artwork.title, 'Renamed')
+        self.assertGreater(artwork.popular_score, 0)
+
+    def test_sorts_read_the_score_indexes(self):
+        for sort in ('popular', 'trending'):
+            status, statements = query_plans.capture(f"{reverse('artworks')}?sort={sort}")
+            self.assertEqual(status, 200)
+            listing = [sql for sql in statements if f'{sort}_score" DESC' in sql]
+            self.assertTrue(listing)
+            for sql in listing:
+                plan = query_plans.explain(sql)
+                self.assertEqual(query_plans.warnings_for(plan), [], plan)
+
+
+@override_settings(GALLERY_EVENTS={'ENABLED': False})
+class CachePolicyTests(TestCase):
+    """Cache-Control and Vary chosen per view by CacheControlMiddleware"""
+
+    def setUp(self):
+        owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        artist = Artist.objects.create(first_name='Ann')
+        self.artwork = Artwork.objects.create(artist=artist, title='Work', price=100, medium='Oil', year=2000,
+                                              created_by=owner)
+
+    def cache_control(self, response):
+        return {directive.strip() for directive in response['Cache-Control'].split(',')}
+
+    def test_anonymous_catalogue_page_is_public(self):
+        response = Client().get(reverse('artworks'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.cookies)
+        self.assertEqual(self.cache_control(response), {'public', 'max-age=300'})
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_session_or_new_cookie_makes_it_private(self):
+        client = Client()
+        client.post(reverse('add_to_cart', args=[self.artwork.id]), {'action': 'add_to_cart'})
+        self.assertIn(settings.SESSION_COOKIE_NAME, client.cookies)
+        response = client.get(reverse('artworks'))
+        self.assertEqual(self.cache_control(response), {'private', 'no-cache'})
+
+        # The contact form sets the CSRF cookie.
+        response = Client().get(reverse('contact'))
+        self.assertTrue(response.cookies)
+        self.assertEqual(self.cache_control(response), {'private', 'no-cache'})
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_cart_and_checkout_are_not_stored(self):
+        for name in ('cart', 'checkout'):
+            response = Client().get(reverse(name))
+            self.assertIn('no-store', self.cache_control(response), name)
+            self.assertIn('Cookie', response['Vary'], name)
+
+
+class MediaServeTests(SimpleTestCase):
+    """media.serve(): ranges, validators and proxy hand-off"""
+
+    DATA = bytes(range(256)) * 4
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MEDIA_ROOT=self.root, GALLERY_MEDIA={})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(self.root, 'artworks'))
+        with open(os.path.join(self.root, 'artworks', 'a b.jpg'), 'wb') as handle:
+            handle.write(self.DATA)
+
+    def get(self, **headers):
+        response = media.serve(RequestFactory().get('/media/artworks/a%20b.jpg', **headers), 'artworks/a b.jpg')
+        self.addCleanup(response.close)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_and_ranged_responses(self):
+        response = self.get()
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/jpeg'))
+        self.assertEqual(self.body(response), self.DATA)
+
+        response = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(self.body(response), self.DATA[10:20])
+
+        response = self.get(HTTP_RANGE='bytes=-100')
+        self.assertEqual((response.status_code, response['Content-Length']), (206, '100'))
+        self.assertEqual(response['Content-Range'], 'bytes 924-1023/1024')
+        self.assertEqual(self.body(response), self.DATA[-100:])
+
+        response = self.get(HTTP_RANGE='bytes=1000-')
+        self.assertEqual(self.body(response), self.DATA[1000:])
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=1024-', 'bytes=-0'):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416, header)
+            self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+        response = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.DATA)
+
+    def test_conditional_requests(self):
+        first = self.get()
+        response = self.get(HTTP_IF_NONE_MATCH=f'"other", W/{first["ETag"]}')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+    def test_proxy_hand_off(self):
+        with override_settings(GALLERY_MEDIA={'ACCEL': media.X_ACCEL_REDIRECT}):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], '/_media/artworks/a%20b.jpg')
+        self.assertFalse(response.has_header('Content-Type'))
+        self.assertEqual(response.content, b'')
+
+        with override_settings(GALLERY_MEDIA={'ACCEL': media.X_SENDFILE}):
+            response = self.get()
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.root, 'artworks', 'a b.jpg'))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_missing_or_escaping_paths(self):
+        request = RequestFactory().get('/media/')
+        self.assertEqual(media.serve(request, 'artworks/missing.jpg').status_code, 404)
+        self.assertEqual(media.serve(request, '../secret').status_code, 404)
+        self.assertEqual(media.serve(request, 'artworks').status_code, 404)
+        self.assertEqual(media.serve(RequestFactory().post('/media/'), 'artworks/a b.jpg').status_code, 405)
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Identical uploads share one blob, counted per referencing field"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MEDIA_ROOT=self.root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.owner = User.objects.create_user(email='owner@example.com', password='pw', role='owner')
+        self.artist = Artist.objects.create(first_name='Ann')
+        self.photo = _image_bytes((20, 10))
+
+    def artwork(self, data, filename='photo.jpg'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Artwork.objects.create(artist=self.artist, title=filename, price=100, medium='Oil', year=2000,
+                                          created_by=self.owner, image=SimpleUploadedFile(filename, data))
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def refcount(self, name):
+        return MediaBlob.objects.get(name=name).refcount
+
+    def test_identical_uploads_share_one_file(self):
+        first, second = self.artwork(self.photo, 'a.JPG'), self.artwork(self.photo, 'b.jpg')
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(self.refcount(first.image.name), 2)
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).size, len(self.photo))
+        self.assertEqual(os.listdir(os.path.join(self.root, storage.UPLOAD_DIR)), [])
+
+        # field.delete() cannot remove a file another artwork still uses.
+        storage.media_storage().delete(first.image.name)
+        self.assertTrue(self.exists(first.image.name))
+
+    def test_references_are_released_on_replace_and_delete(self):
+        first, second = self.artwork(self.photo), self.artwork(self.photo)
+        name = first.image.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.image = SimpleUploadedFile('other.jpg', _image_bytes((30, 10)))
+            first.save()
+        self.assertEqual(self.refcount(name), 1)
+        self.assertEqual(self.refcount(first.image.name), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(self.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+        counts = storage.rebuild_refcounts()
+        self.assertEqual(dict(counts), {first.image.name: 1})
+
+    def test_upload_reusing_a_released_blob_keeps_it(self):
+        artwork = self.artwork(self.photo)
+        name = artwork.image.name
+        self.assertIsNone(MediaBlob.objects.get(name=name).reserved_until)
+        Artwork.objects.filter(pk=artwork.pk).update(image='')
+        MediaBlob.objects.filter(name=name).update(refcount=0)      # released, cleanup not run yet
+
+        # An upload of the same bytes is stored, then the release's cleanup runs
+        # before the upload's row is saved.
+        self.assertEqual(storage.media_storage().save('again.jpg', SimpleUploadedFile('again.jpg', self.photo)), name)
+        self.assertEqual(storage.delete_unreferenced([name]), 0)
+        self.assertTrue(self.exists(name))
+        storage.acquire([name])
+        self.assertEqual(self.refcount(name), 1)
+
+        # Once nothing references it and the reservation has run out, it goes.
+        storage.release([name])
+        MediaBlob.objects.filter(name=name).update(reserved_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(storage.delete_unreferenced([name]), 1)
+        self.assertFalse(self.exists(name))
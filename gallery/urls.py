@@ -1,5 +1,6 @@
 from django.urls import path, include
 from . import views
+from .cache_policy import NO_STORE, PRIVATE, PUBLIC
 from django.contrib.auth import views as auth_views
 
 urlpatterns = [
@@ -62,8 +63,63 @@ urlpatterns = [
     path('dashboard/manage-artworks/', views.manage_artworks_view, name='manage_artworks'),
     path('dashboard/analytics/', views.analytics_view, name='analytics'),
     path('orders/', views.view_orders_view, name='view_orders'),
+    path('metrics/', views.metrics_view, name='metrics'),
     
     # Social Auth URLs
     path('accounts/', include('allauth.urls')),
 ]
 
+
+# Query budgets for the public views, keyed by URL name. gallery/tests.py
+# renders each view with 1, 10 and 100 artworks / artists / cart items and
+# fails if the number of queries grows with the data or exceeds the budget.
+QUERY_BUDGETS = {
+    'home': 8,
+    'about': 6,
+    'contact': 6,
+    'artists': 7,
+    'artist_detail': 8,
+    'artworks': 9,
+    'artwork_detail': 9,
+    'cart': 7,
+    'checkout': 7,
+}
+
+
+# HTTP cache policy per URL name (see gallery/cache_policy.py). Views not
+# listed here, or decorated with @cache_policy, are PRIVATE.
+CACHE_POLICIES = {
+    # Public catalogue: shared caches may keep it for anonymous visitors
+    'home': PUBLIC,
+    'about': PUBLIC,
+    'contact': PUBLIC,
+    'artists': PUBLIC,
+    'artist_detail': PUBLIC,
+    'artworks': PUBLIC,
+    'artwork_detail': PUBLIC,
+    # Account pages and the owner dashboard
+    'profile': PRIVATE,
+    'view_orders': PRIVATE,
+    'admin_dashboard': PRIVATE,
+    'analytics': PRIVATE,
+    # Carts, orders, auth flows and forms that carry one-off state
+    'cart': NO_STORE,
+    'checkout': NO_STORE,
+    'add_to_cart': NO_STORE,
+    'update_cart_item': NO_STORE,
+    'remove_from_cart': NO_STORE,
+    'process_checkout': NO_STORE,
+    'order_confirmation': NO_STORE,
+    'artwork_purchase': NO_STORE,
+    'artwork_inquire': NO_STORE,
+    'schedule_viewing': NO_STORE,
+    'login': NO_STORE,
+    'signup': NO_STORE,
+    'logout': NO_STORE,
+    'verify_email': NO_STORE,
+    'forgot_password': NO_STORE,
+    'reset_password_verify': NO_STORE,
+    'reset_password': NO_STORE,
+    'resend_otp': NO_STORE,
+    'metrics': NO_STORE,
+}
@@ -6,7 +6,7 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden, Http404
 from django.conf import settings
 from django.urls import reverse
 from django.views.decorators.http import require_POST
@@ -21,14 +21,54 @@ from .forms import (
     CustomForgotPasswordForm, CustomResetPasswordForm, 
     UserProfileForm, ArtworkForm, CheckoutForm, ContactForm
 )
-from .models import User, OTP, UserProfile, Artist, Artwork
+from .models import User, OTP, UserProfile, Artist, Artwork, Order, OrderItem
 from django.contrib.auth.decorators import user_passes_test
 from django.db.models import Q
 from django.core.paginator import Paginator
 from .forms import ArtistForm
-# Add this import at the top of views.py with other imports
-import random
+from .order_reference import generate_order_reference
+from .analytics import dashboard_summary, record_order
+from .events import track
+from .recommendations import related_for
+from . import facets, metrics
+from django.db import transaction
+from decimal import Decimal
+import logging
 
+checkout_logger = logging.getLogger('gallery.checkout')
+email_logger = logging.getLogger('gallery.email')
+auth_logger = logging.getLogger('gallery.auth')
+cart_logger = logging.getLogger('gallery.cart')
+
+
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def artwork_card(artwork):
+    """Artwork as the dict expected by includes/_artwork_card.html (artist must be loaded)"""
+    return {
+        'id': artwork.id,
+        'title': artwork.title,
+        'artist': artwork.artist.full_name,
+        'artist_id': artwork.artist_id,
+        'image': artwork.primary_image,
+        'year': artwork.year,
+        'medium': artwork.medium,
+        'availability': artwork.availability,
+        'sold': artwork.sold,
+        'show_price': artwork.show_price,
+        'price': float(artwork.price) if artwork.price else None,
+        'discounted_price': float(artwork.discounted_price) if artwork.discounted_price else None,
+        'dimensions': artwork.dimensions,
+        'allow_purchase': artwork.allow_purchase,
+        'allow_inquiry': artwork.allow_inquiry,
+        'allow_schedule_viewing': artwork.allow_schedule_viewing,
+        # Fragment cache key parts (see gallery/fragments.py)
+        'updated_at': artwork.updated_at,
+        'artist_updated_at': artwork.artist.updated_at,
+    }
 
 
 # ============================================================================
@@ -43,24 +83,7 @@ def home(request):
     # Format featured artworks as dictionaries (consistent with artworks page)
     featured_artworks = []
     for artwork in featured_artworks_db:
-        featured_artworks.append({
-            'id': artwork.id,
-            'title': artwork.title,
-            'artist': artwork.artist.full_name,
-            'artist_id': artwork.artist.id,
-            'image': artwork.primary_image,  # This now uses the fixed property
-            'year': artwork.year,
-            'medium': artwork.medium,
-            'availability': artwork.availability,
-            'sold': artwork.sold,
-            'show_price': artwork.show_price,
-            'price': float(artwork.price) if artwork.price else None,
-            'discounted_price': float(artwork.discounted_price) if artwork.discounted_price else None,
-            'dimensions': artwork.dimensions,
-            'allow_purchase': artwork.allow_purchase,
-            'allow_inquiry': artwork.allow_inquiry,
-            'allow_schedule_viewing': artwork.allow_schedule_viewing
-        })
+        featured_artworks.append(artwork_card(artwork))
     
     # Get active artists for carousel
     artists = Artist.objects.filter(is_active=True).order_by('first_name', 'last_name')[:10]
@@ -145,7 +168,7 @@ def contact(request):
                     fail_silently=False,
                 )
                 
-                print(f"✅ Contact email sent to gallery from {email}")
+                email_logger.info('Contact email sent to gallery', extra={'flow': 'contact', 'sender': email})
                 
                 # 2. SEND CONFIRMATION EMAIL TO CUSTOMER
                 customer_subject = 'Thank You for Contacting Camps Bay Gallery'
@@ -199,7 +222,7 @@ def contact(request):
                     fail_silently=False,
                 )
                 
-                print(f"✅ Confirmation email sent to {email}")
+                email_logger.info('Contact confirmation email sent', extra={'flow': 'contact', 'recipient': email})
                 
                 messages.success(request, 'Your message has been sent! We\'ll get back to you within 24 hours. A confirmation email has been sent.')
                 
@@ -212,13 +235,13 @@ def contact(request):
                             profile.newsletter_subscription = True
                             profile.save()
                     except Exception as e:
-                        print(f"Note: Could not update newsletter subscription: {e}")
+                        email_logger.warning('Could not update newsletter subscription', exc_info=True, extra={'user_id': request.user.id})
                 
                 # Clear form after successful submission
                 form = ContactForm(user=request.user)
                 
             except Exception as e:
-                print(f"❌ Error sending contact emails: {str(e)}")
+                email_logger.exception('Error sending contact emails', extra={'flow': 'contact', 'sender': email})
                 messages.error(request, f'There was an error sending your message. Please try again. Error: {str(e)}')
         else:
             messages.error(request, 'Please correct the errors below.')
@@ -249,29 +272,12 @@ def artist_detail(request, artist_id):
     artist = get_object_or_404(Artist, id=artist_id, is_active=True)
     
     # Get artist's artworks from database
-    artist_artworks_db = Artwork.objects.filter(artist=artist, is_active=True)
+    artist_artworks_db = Artwork.objects.filter(artist=artist, is_active=True).select_related('artist')
     
     # Format for template
     artist_artworks = []
     for artwork in artist_artworks_db:
-        artist_artworks.append({
-            'id': artwork.id,
-            'title': artwork.title,
-            'artist': artwork.artist.full_name,
-            'artist_id': artwork.artist.id,
-            'image': artwork.primary_image,
-            'year': artwork.year,
-            'medium': artwork.medium,
-            'availability': artwork.availability,
-            'sold': artwork.sold,
-            'show_price': artwork.show_price,
-            'price': float(artwork.price) if artwork.price else None,
-            'discounted_price': float(artwork.discounted_price) if artwork.discounted_price else None,
-            'dimensions': artwork.dimensions,
-            'allow_purchase': artwork.allow_purchase,
-            'allow_inquiry': artwork.allow_inquiry,
-            'allow_schedule_viewing': artwork.allow_schedule_viewing
-        })
+        artist_artworks.append(artwork_card(artwork))
     
     context = {
         'artist': artist,
@@ -285,8 +291,8 @@ def artworks(request):
     # Get filter and sort parameters
     search_query = request.GET.get('q', '')
     artist_filter = request.GET.get('artist', '')
-    medium_filter = request.GET.get('medium', '')
     sort_by = request.GET.get('sort', 'newest')
+    filters = facets.parse_filters(request.GET)
     
     # Start with all active artworks
     artworks_list = Artwork.objects.filter(is_active=True).select_related('artist')
@@ -301,13 +307,9 @@ def artworks(request):
             Q(medium__icontains=search_query)
         )
     
-    # Apply artist filter
-    if artist_filter and artist_filter != 'all':
-        artworks_list = artworks_list.filter(artist__id=artist_filter)
-    
-    # Apply medium filter
-    if medium_filter:
-        artworks_list = artworks_list.filter(medium__icontains=medium_filter)
+    # Apply facet filters (artist, medium, availability, price, decade, ...)
+    # and the min_price/max_price range
+    artworks_list = facets.apply_filters(artworks_list, filters)
     
     # Apply sorting
     if sort_by == 'newest':
@@ -318,10 +320,18 @@ def artworks(request):
         artworks_list = artworks_list.order_by('title')
     elif sort_by == 'title_desc':
         artworks_list = artworks_list.order_by('-title')
-    elif sort_by == 'price_low':
-        artworks_list = artworks_list.order_by('price')
-    elif sort_by == 'price_high':
-        artworks_list = artworks_list.order_by('-price')
+    elif sort_by in ('price_low', 'price_high'):
+        # Artworks without a price ("on request") have no place in a price
+        # order; leaving them out lets artwork_active_price_idx give the order.
+        artworks_list = artworks_list.filter(effective_price__isnull=False)
+        if sort_by == 'price_low':
+            artworks_list = artworks_list.order_by('effective_price', '-created_at')
+        else:
+            artworks_list = artworks_list.order_by('-effective_price', 'created_at')
+    elif sort_by == 'popular':
+        artworks_list = artworks_list.order_by('-popular_score', '-created_at')
+    elif sort_by == 'trending':
+        artworks_list = artworks_list.order_by('-trending_score', '-created_at')
     else:
         artworks_list = artworks_list.order_by('-created_at')
     
@@ -336,27 +346,20 @@ def artworks(request):
     # Get all artists for filter dropdown
     artists = Artist.objects.filter(is_active=True).order_by('first_name', 'last_name')
     
+    # Facet counts for the filter sidebar (served from the cached facet index)
+    facet_groups = facets.facet_counts(filters, artists)
+    artist_counts = {option['value']: option['count'] for option in facet_groups['artist']['options']}
+    for artist in artists:
+        artist.artwork_count = artist_counts.get(str(artist.id), 0)
+    
+    # Query string without the page number, for pagination links
+    filter_params = request.GET.copy()
+    filter_params.pop('page', None)
+    
     # Prepare artworks data for template
     artworks_data = []
     for artwork in page_obj:
-        artworks_data.append({
-            'id': artwork.id,
-            'title': artwork.title,
-            'artist': artwork.artist.full_name,
-            'artist_id': artwork.artist.id,
-            'image': artwork.primary_image,  # This now uses the fixed property
-            'year': artwork.year,
-            'medium': artwork.medium,
-            'availability': artwork.availability,
-            'sold': artwork.sold,
-            'show_price': artwork.show_price,
-            'price': float(artwork.price) if artwork.price else None,
-            'discounted_price': float(artwork.discounted_price) if artwork.discounted_price else None,
-            'dimensions': artwork.dimensions,
-            'allow_purchase': artwork.allow_purchase,
-            'allow_inquiry': artwork.allow_inquiry,
-            'allow_schedule_viewing': artwork.allow_schedule_viewing
-        })
+        artworks_data.append(artwork_card(artwork))
     
     context = {
         'artworks': artworks_data,
@@ -365,7 +368,15 @@ def artworks(request):
         'search_query': search_query,
         'current_artist': artist_filter,
         'current_sort': sort_by,
+        'min_price': request.GET.get('min_price', ''),
+        'max_price': request.GET.get('max_price', ''),
         'artists': artists,
+        'facets': [
+            dict(name=name, **facet_groups[name])
+            for name in facets.FACETS if name != 'artist' and facet_groups[name]['options']
+        ],
+        'active_filters': filters,
+        'filter_query': filter_params.urlencode(),
         'is_paginated': paginator.num_pages > 1,
         'page_title': 'Artworks',
         'page_subtitle': 'Browse our collection of exceptional artworks'
@@ -388,6 +399,7 @@ def artwork_detail(request, artwork_id):
     try:
         # Get artwork from database
         artwork = Artwork.objects.get(id=artwork_id, is_active=True)
+        track(request, 'view', artwork.id)
         
         context = {
             'artwork': {
@@ -409,6 +421,7 @@ def artwork_detail(request, artwork_id):
                 'allow_inquiry': artwork.allow_inquiry,
                 'allow_schedule_viewing': artwork.allow_schedule_viewing
             },
+            'related_artworks': [artwork_card(related) for related in related_for(artwork.id)],
             'show_inquiry_modal': (artwork.availability == 'on_request'),
             'user': request.user,
         }
@@ -457,6 +470,8 @@ def artwork_inquire(request, artwork_id):
             messages.error(request, 'Please enter a valid email address.')
             return redirect('artwork_detail', artwork_id=artwork_id)
         
+        track(request, 'inquiry', artwork.id)
+        
         try:
             # Build URLs
             site_url = request.build_absolute_uri('/')[:-1]  # Remove trailing slash
@@ -505,7 +520,7 @@ def artwork_inquire(request, artwork_id):
                 fail_silently=False,
             )
             
-            print(f"✅ Inquiry email sent to gallery from {email}")
+            email_logger.info('Inquiry email sent to gallery', extra={'flow': 'inquiry', 'sender': email})
             
             # 2. SEND CONFIRMATION EMAIL TO CUSTOMER
             customer_subject = f'Inquiry Confirmation: {artwork.title}'
@@ -564,13 +579,13 @@ def artwork_inquire(request, artwork_id):
                 fail_silently=False,
             )
             
-            print(f"✅ Confirmation email sent to {email}")
+            email_logger.info('Inquiry confirmation email sent', extra={'flow': 'inquiry', 'recipient': email})
             
             messages.success(request, 'Your inquiry has been sent! We\'ll get back to you within 24 hours. A confirmation email has been sent to your inbox.')
             return redirect('artwork_detail', artwork_id=artwork_id)
             
         except Exception as e:
-            print(f"❌ Error sending inquiry emails: {str(e)}")
+            email_logger.exception('Error sending inquiry emails', extra={'flow': 'inquiry', 'sender': email})
             messages.error(request, f'There was an error sending your inquiry. Please try again. Error: {str(e)}')
             return redirect('artwork_detail', artwork_id=artwork_id)
     
@@ -614,6 +629,8 @@ def schedule_viewing(request, artwork_id):
             messages.error(request, 'Please enter a valid email address.')
             return redirect('artwork_detail', artwork_id=artwork_id)
         
+        track(request, 'schedule_viewing', artwork.id)
+        
         try:
             # Format the date nicely
             from datetime import datetime
@@ -681,7 +698,7 @@ def schedule_viewing(request, artwork_id):
                 fail_silently=False,
             )
             
-            print(f"✅ Schedule email sent to gallery from {email}")
+            email_logger.info('Schedule email sent to gallery', extra={'flow': 'schedule', 'sender': email})
             
             # 2. SEND CONFIRMATION EMAIL TO CUSTOMER
             customer_subject = f'Viewing Request Confirmation: {artwork.title}'
@@ -754,13 +771,13 @@ def schedule_viewing(request, artwork_id):
                 fail_silently=False,
             )
             
-            print(f"✅ Confirmation email sent to {email}")
+            email_logger.info('Schedule confirmation email sent', extra={'flow': 'schedule', 'recipient': email})
             
             messages.success(request, 'Your viewing request has been sent! We\'ll confirm your appointment within 24 hours. A confirmation email has been sent to your inbox.')
             return redirect('artwork_detail', artwork_id=artwork_id)
             
         except Exception as e:
-            print(f"❌ Error sending schedule emails: {str(e)}")
+            email_logger.exception('Error sending schedule emails', extra={'flow': 'schedule', 'sender': email})
             messages.error(request, f'There was an error sending your request. Please try again. Error: {str(e)}')
             return redirect('artwork_detail', artwork_id=artwork_id)
     
@@ -860,14 +877,13 @@ def signup_view(request):
                     fail_silently=False,
                 )
                 
-                print(f"✅ Verification email sent to {user.email}")
-                print(f"   OTP: {otp_code}")
+                auth_logger.info('Verification email sent', extra={'user_id': user.id})
                 
                 messages.success(request, 'Verification email sent! Please check your inbox.')
                 return redirect('verify_email')
                 
             except Exception as e:
-                print(f"❌ Signup error: {e}")
+                auth_logger.exception('Signup failed')
                 messages.error(request, 'Registration failed. Please try again.')
         else:
             for field, errors in form.errors.items():
@@ -972,8 +988,7 @@ def forgot_password_view(request):
                     fail_silently=False,
                 )
                 
-                print(f"✅ Password reset email sent to {user.email}")
-                print(f"   OTP: {otp_code}")
+                auth_logger.info('Password reset email sent', extra={'user_id': user.id})
                 
                 messages.success(request, 'Password reset email sent! Please check your inbox.')
                 return redirect('reset_password_verify')
@@ -981,7 +996,7 @@ def forgot_password_view(request):
             except User.DoesNotExist:
                 messages.error(request, 'No account found with this email address.')
             except Exception as e:
-                print(f"❌ Forgot password error: {e}")
+                auth_logger.exception('Forgot password failed')
                 messages.error(request, 'Failed to send reset email. Please try again.')
     else:
         form = CustomForgotPasswordForm()
@@ -1138,11 +1153,11 @@ def resend_otp_view(request):
             fail_silently=False,
         )
         
-        print(f"✅ {otp_type} email resent to {user.email}")
+        auth_logger.info('OTP email resent', extra={'user_id': user.id, 'otp_type': otp_type})
         
         return JsonResponse({'success': True, 'message': 'New code sent to your email.'})
     except Exception as e:
-        print(f"❌ Resend OTP error: {e}")
+        auth_logger.exception('Resend OTP failed')
         return JsonResponse({'success': False, 'error': 'Failed to resend code.'})
 
 # ============================================================================
@@ -1438,13 +1453,31 @@ def manage_artworks_view(request):
 
 @login_required
 def analytics_view(request):
-    """Placeholder view for analytics dashboard - FUTURE FEATURE"""
+    """Analytics dashboard - reads the pre-aggregated rollup tables"""
     if not request.user.is_owner:
         messages.error(request, 'Access denied. Admin features are for owners only.')
         return redirect('home')
     
-    messages.info(request, 'Analytics Dashboard is coming soon!')
-    return redirect('admin_dashboard')
+    try:
+        months = min(max(int(request.GET.get('months', 12)), 1), 36)
+    except ValueError:
+        months = 12
+    
+    context = dashboard_summary(months=months)
+    context.update({
+        'months': months,
+        'page_title': 'Analytics',
+        'page_subtitle': 'Sales, inventory and pricing at a glance'
+    })
+    return render(request, 'gallery/analytics.html', context)
+
+def metrics_view(request):
+    """Prometheus scrape endpoint - owners, or scrapers with the metrics token"""
+    if not metrics.get_config()['ENABLED']:
+        raise Http404
+    if not metrics.authorized(request):
+        return HttpResponseForbidden('Metrics are only available to owners.')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @login_required
 def view_orders_view(request):
@@ -1484,6 +1517,7 @@ def add_to_cart(request, artwork_id):
             
             # Check if it's a quick purchase
             action = request.POST.get('action', 'add_to_cart')
+            track(request, 'quick_purchase' if action == 'quick_purchase' else 'add_to_cart', artwork.id)
             
             if action == 'quick_purchase':
                 # Set quick purchase in session
@@ -1496,7 +1530,7 @@ def add_to_cart(request, artwork_id):
                         'id': artwork.id,
                         'title': artwork.title,
                         'artist': artwork.artist.full_name,
-                        'price': float(artwork.price) if artwork.price else 0,
+                        'price': float(artwork.display_price) if artwork.display_price else 0,
                         'image': artwork.primary_image,
                         'medium': artwork.medium,
                         'dimensions': artwork.dimensions
@@ -1513,11 +1547,12 @@ def add_to_cart(request, artwork_id):
                         'added_at': timezone.now().isoformat(),
                         'title': artwork.title,
                         'artist': artwork.artist.full_name,
-                        'price': float(artwork.price) if artwork.price else 0,
+                        'price': float(artwork.display_price) if artwork.display_price else 0,
                         'image': artwork.primary_image
                     }
                     request.session['cart'] = cart
                     messages.success(request, f'"{artwork.title}" added to cart.')
+                    cart_logger.info('Added to cart', extra={'artwork_id': artwork.id, 'cart_size': len(cart)})
                     
                     # Update cart count (only for normal add to cart)
                     cart_count = len(cart)
@@ -1540,7 +1575,7 @@ def add_to_cart(request, artwork_id):
             messages.error(request, 'Artwork not found.')
             return redirect('artworks')
         except Exception as e:
-            print(f"❌ Error adding to cart: {e}")
+            cart_logger.exception('Error adding to cart', extra={'artwork_id': artwork_id})
             messages.error(request, 'An error occurred. Please try again.')
             return redirect('artwork_detail', artwork_id=artwork_id)
     
@@ -1567,7 +1602,7 @@ def cart_view(request):
                     request.session['cart'] = cart
                 continue
                 
-            item_total = float(artwork.price) if artwork.price else 0
+            item_total = float(artwork.display_price) if artwork.display_price else 0
             subtotal += item_total
             
             cart_items.append({
@@ -1576,7 +1611,7 @@ def cart_view(request):
                     'title': artwork.title,
                     'artist': artwork.artist.full_name,
                     'image': artwork.primary_image,
-                    'price': float(artwork.price) if artwork.price else 0,
+                    'price': float(artwork.display_price) if artwork.display_price else 0,
                     'medium': artwork.medium,
                     'dimensions': artwork.dimensions,
                     'sold': artwork.sold  # Add sold status
@@ -1621,10 +1656,13 @@ def cart_view(request):
     cart_items = []
     subtotal = 0
     
-    for artwork_id, item_data in cart.items():
+    cart_artworks = Artwork.objects.in_cart(cart)
+    for artwork_id, item_data in list(cart.items()):
         try:
             # Get artwork even if it's sold (but still active)
-            artwork = Artwork.objects.get(id=artwork_id, is_active=True)
+            artwork = cart_artworks.get(str(artwork_id))
+            if artwork is None:
+                raise Artwork.DoesNotExist
             quantity = item_data.get('quantity', 1)
             
             # Check if artwork is sold - if so, don't include it in cart
@@ -1635,7 +1673,7 @@ def cart_view(request):
                     request.session['cart'] = cart
                 continue
                 
-            item_total = float(artwork.price) if artwork.price else 0
+            item_total = float(artwork.display_price) if artwork.display_price else 0
             subtotal += item_total
             
             cart_items.append({
@@ -1644,7 +1682,7 @@ def cart_view(request):
                     'title': artwork.title,
                     'artist': artwork.artist.full_name,
                     'image': artwork.primary_image,
-                    'price': float(artwork.price) if artwork.price else 0,
+                    'price': float(artwork.display_price) if artwork.display_price else 0,
                     'medium': artwork.medium,
                     'dimensions': artwork.dimensions,
                     'sold': artwork.sold  # Add sold status
@@ -1709,7 +1747,7 @@ def checkout_view(request):
                     'id': artwork.id,
                     'title': artwork.title,
                     'artist': artwork.artist.full_name,
-                    'price': float(artwork.price) if artwork.price else 0,
+                    'price': float(artwork.display_price) if artwork.display_price else 0,
                     'image': artwork.primary_image,
                     'medium': artwork.medium,
                     'dimensions': artwork.dimensions
@@ -1739,10 +1777,13 @@ def checkout_view(request):
             return redirect('cart')
         
         # Get cart items from cart session data
-        for artwork_id, item_data in cart.items():
+        cart_artworks = Artwork.objects.in_cart(cart)
+        for artwork_id, item_data in list(cart.items()):
             try:
                 # Get artwork even if it's sold
-                artwork = Artwork.objects.get(id=artwork_id, is_active=True)
+                artwork = cart_artworks.get(str(artwork_id))
+                if artwork is None:
+                    raise Artwork.DoesNotExist
                 
                 # Check if artwork is sold
                 if artwork.sold:
@@ -1753,7 +1794,7 @@ def checkout_view(request):
                     messages.warning(request, f'"{artwork.title}" has been sold and was removed from your cart.')
                     continue
                     
-                item_total = float(artwork.price) if artwork.price else 0
+                item_total = float(artwork.display_price) if artwork.display_price else 0
                 subtotal += item_total
                 
                 cart_items.append({
@@ -1762,7 +1803,7 @@ def checkout_view(request):
                         'title': artwork.title,
                         'artist': artwork.artist.full_name,
                         'image': artwork.primary_image,
-                        'price': float(artwork.price) if artwork.price else 0,
+                        'price': float(artwork.display_price) if artwork.display_price else 0,
                     },
                     'quantity': item_data.get('quantity', 1),
                     'item_total': item_total
@@ -1783,16 +1824,12 @@ def checkout_view(request):
     tax = subtotal * 0.15
     total = subtotal + shipping + tax
     
-    # Generate order reference
-    order_reference = f"ORD-{timezone.now().strftime('%Y%m%d')}-{random.randint(1000, 9999)}"
-    
     context = {
         'cart_items': cart_items,
         'subtotal': subtotal,
         'shipping': shipping,
         'tax': tax,
         'total': total,
-        'order_reference': order_reference,
         'item_count': len(cart_items),
         'user': request.user,
         'is_quick_purchase': bool(quick_purchase_id or guest_checkout_item)
@@ -1800,6 +1837,33 @@ def checkout_view(request):
     
     return render(request, 'gallery/checkout.html', context)
 
+def save_order(reference, artworks, subtotal, shipping, tax, total, **details):
+    """Store a completed checkout as an Order and add it to the sales rollups"""
+    with transaction.atomic():
+        order = Order.objects.create(
+            reference=reference,
+            subtotal=Decimal(str(subtotal)),
+            shipping=Decimal(str(shipping)),
+            tax=Decimal(str(tax)).quantize(Decimal('0.01')),
+            total=Decimal(str(total)).quantize(Decimal('0.01')),
+            **details
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                artwork=artwork,
+                artist=artwork.artist,
+                title=artwork.title,
+                artist_name=artwork.artist.full_name,
+                medium=artwork.medium,
+                list_price=artwork.price or 0,
+                sale_price=artwork.display_price or 0,
+            )
+            for artwork in artworks
+        ])
+        record_order(order)
+    return order
+
 # FILE: gallery/views.py - Update process_checkout function
 # FILE: gallery/views.py - COMPLETE process_checkout function
 @require_POST
@@ -1824,12 +1888,12 @@ def process_checkout(request):
     # Validate required fields
     required_fields = [first_name, last_name, email, phone, address, city, country, province, postal_code]
     if not all(required_fields):
+        metrics.CHECKOUTS.inc(result='invalid')
         messages.error(request, 'Please fill in all required fields.')
         return redirect('checkout')
     
     # Get cart items for processing
     cart_items = []
-    subtotal = 0
     artwork_ids = []  # Store artwork IDs to mark as sold
     
     # Handle quick purchase or guest checkout
@@ -1841,6 +1905,7 @@ def process_checkout(request):
                 
                 # Check if artwork is already sold
                 if artwork.sold:
+                    metrics.CHECKOUTS.inc(result='unavailable')
                     messages.error(request, f'Sorry, "{artwork.title}" has already been sold.')
                     request.session.pop('quick_purchase', None)
                     return redirect('artworks')
@@ -1849,7 +1914,7 @@ def process_checkout(request):
                     'id': artwork.id,
                     'title': artwork.title,
                     'artist': artwork.artist.full_name,
-                    'price': float(artwork.price) if artwork.price else 0,
+                    'price': float(artwork.display_price) if artwork.display_price else 0,
                     'image': artwork.primary_image,
                     'medium': artwork.medium,
                     'dimensions': artwork.dimensions
@@ -1864,18 +1929,20 @@ def process_checkout(request):
                 'artwork': artwork_data,
                 'quantity': 1
             })
-            subtotal = float(artwork_data['price']) if artwork_data['price'] else 0
-            
         except Artwork.DoesNotExist:
+            metrics.CHECKOUTS.inc(result='unavailable')
             messages.error(request, 'The selected artwork is no longer available.')
             request.session.pop('quick_purchase', None)
             return redirect('artworks')
     else:
         # Process cart items
-        for artwork_id, item_data in cart.items():
+        cart_artworks = Artwork.objects.in_cart(cart)
+        for artwork_id, item_data in list(cart.items()):
             try:
                 # Get artwork
-                artwork = Artwork.objects.get(id=artwork_id, is_active=True)
+                artwork = cart_artworks.get(str(artwork_id))
+                if artwork is None:
+                    raise Artwork.DoesNotExist
                 
                 # Check if artwork is already sold
                 if artwork.sold:
@@ -1890,7 +1957,7 @@ def process_checkout(request):
                     'id': artwork.id,
                     'title': artwork.title,
                     'artist': artwork.artist.full_name,
-                    'price': float(artwork.price) if artwork.price else 0,
+                    'price': float(artwork.display_price) if artwork.display_price else 0,
                     'image': artwork.primary_image,
                     'medium': artwork.medium,
                     'dimensions': artwork.dimensions
@@ -1900,38 +1967,64 @@ def process_checkout(request):
                     'artwork': artwork_data,
                     'quantity': quantity
                 })
-                subtotal += float(artwork.price) if artwork.price else 0
                 artwork_ids.append(artwork.id)
             except Artwork.DoesNotExist:
                 continue
     
     # Check if there are items to process
     if not cart_items:
+        metrics.CHECKOUTS.inc(result='empty')
         messages.error(request, 'No items to checkout.')
         return redirect('cart')
     
     try:
-        # MARK ARTWORKS AS SOLD (but keep them visible)
-        for artwork_id in artwork_ids:
-            try:
-                artwork = Artwork.objects.get(id=artwork_id)
-                # Only mark as sold if not already sold
-                if not artwork.sold:
-                    artwork.mark_as_sold()
-                    print(f"✅ Marked artwork {artwork_id} ({artwork.title}) as sold")
-                else:
-                    print(f"⚠️ Artwork {artwork_id} was already sold")
-            except Artwork.DoesNotExist:
-                print(f"❌ Artwork {artwork_id} not found when marking as sold")
+        # Generate order reference (always server-side, never from the client).
+        # Outside the transaction: a rollback must not hand a reserved block back.
+        order_reference = generate_order_reference()
         
-        # Calculate totals
-        shipping = 500
-        tax = subtotal * 0.15
-        total = subtotal + shipping + tax
-        
-        # Generate order reference
-        order_reference = request.POST.get('order_reference', 
-                                         f"ORD-{timezone.now().strftime('%Y%m%d')}-{random.randint(1000, 9999)}")
+        # MARK ARTWORKS AS SOLD (but keep them visible) and record the order
+        # in one transaction: the rows stay locked until the order exists, so
+        # a concurrent checkout cannot sell (and roll up) the same artwork.
+        with transaction.atomic():
+            locked = (
+                Artwork.objects.select_for_update(of=('self',)).select_related('artist')
+                .filter(id__in=artwork_ids).order_by('id')
+            )
+            artworks_by_id = {artwork.id: artwork for artwork in locked}
+            sold_artworks = []
+            for artwork_id in artwork_ids:
+                artwork = artworks_by_id.get(artwork_id)
+                if artwork is None:
+                    checkout_logger.warning('Artwork not found when marking as sold', extra={'artwork_id': artwork_id})
+                elif artwork.sold:
+                    checkout_logger.warning('Artwork was already sold', extra={'artwork_id': artwork_id})
+                else:
+                    artwork.mark_as_sold()
+                    sold_artworks.append(artwork)
+                    checkout_logger.info('Marked artwork as sold', extra={'artwork_id': artwork.id})
+            
+            if not sold_artworks:
+                metrics.CHECKOUTS.inc(result='unavailable')
+                messages.error(request, 'The selected artworks are no longer available.')
+                return redirect('cart')
+            
+            # Calculate totals from what is actually being sold (and at the price charged)
+            sold_ids = {artwork.id for artwork in sold_artworks}
+            cart_items = [item for item in cart_items if item['artwork']['id'] in sold_ids]
+            subtotal = sum(float(artwork.display_price or 0) for artwork in sold_artworks)
+            shipping = 500
+            tax = subtotal * 0.15
+            total = subtotal + shipping + tax
+            
+            # Persist the order and feed the analytics rollups
+            save_order(
+                order_reference, sold_artworks,
+                user=request.user if request.user.is_authenticated else None,
+                first_name=first_name, last_name=last_name, email=email, phone=phone,
+                address=address, city=city, province=province, postal_code=postal_code,
+                country=country, payment_method=payment_method,
+                subtotal=subtotal, shipping=shipping, tax=tax, total=total,
+            )
         
         # Create order data (serializable)
         order_data = {
@@ -2031,19 +2124,25 @@ def process_checkout(request):
                     html_message=html_message,
                     fail_silently=False,
                 )
-                print(f"✅ Order confirmation email sent to {email}")
+                email_logger.info('Order confirmation email sent', extra={'flow': 'order', 'order_reference': order_reference})
                 
             except Exception as e:
-                print(f"❌ Email error details: {str(e)}")
-                # Log the error but don't crash the checkout
+                email_logger.exception('Order confirmation email failed', extra={'flow': 'order', 'order_reference': order_reference})
                 messages.warning(request, 'Order placed successfully, but there was an issue sending the confirmation email.')
         
+        metrics.CHECKOUTS.inc(result='success')
+        metrics.CHECKOUT_CART_SIZE.observe(len(cart_items))
+        checkout_logger.info('Order placed', extra={
+            'order_reference': order_reference, 'items': len(cart_items), 'total': total,
+        })
+        
         # Success message and redirect
         messages.success(request, f'Order #{order_reference} placed successfully! The artworks have been marked as SOLD and will remain visible on the website.')
         return redirect('order_confirmation', order_ref=order_reference)
         
     except Exception as e:
-        print(f"❌ Checkout error: {str(e)}")
+        metrics.CHECKOUTS.inc(result='error')
+        checkout_logger.exception('Checkout failed')
         messages.error(request, 'There was an error processing your order. Please try again.')
         return redirect('checkout')
 
@@ -0,0 +1,66 @@
+"""
+Worker boot warm-up.
+
+Templates are loaded through Django's cached loader (settings.TEMPLATES), so
+each process parses a template once and keeps it. Without a warm-up that
+parse cost lands on the first visitors after every deploy: base.html and its
+~20 includes are parsed inside the first request, which also imports the
+URLconf and the views. ``warm_templates()`` parses every template in
+gallery/templates/gallery up front and ``warm_urls()`` loads the URLconf;
+wsgi.py and asgi.py call ``warm_on_boot()``, which runs both when
+``settings.GALLERY_PREWARM_TEMPLATES`` is on (the default outside DEBUG).
+``manage.py benchmark_startup`` measures the difference.
+"""
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.template import engines
+from django.urls import get_resolver
+
+from . import fragments
+
+logger = logging.getLogger(__name__)
+
+
+def template_names():
+    """Names of every template under gallery/templates/gallery"""
+    root = os.path.join(apps.get_app_config('gallery').path, 'templates')
+    names = []
+    for directory, _, files in os.walk(os.path.join(root, 'gallery')):
+        for filename in files:
+            if filename.endswith(('.html', '.txt')):
+                names.append(os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def warm_templates():
+    """Parse every gallery template into the cached loader; returns (count, ms)"""
+    start = time.perf_counter()
+    names = template_names()
+    for engine in engines.all():
+        for name in names:
+            engine.get_template(name)
+    for template_name in fragments.CARDS.values():
+        fragments.template_version(template_name)
+    return len(names), (time.perf_counter() - start) * 1000
+
+
+def warm_urls():
+    """Import the URLconf, and with it every view module, and build the reverse map"""
+    start = time.perf_counter()
+    resolver = get_resolver()
+    resolver.reverse_dict  # populates the resolver
+    return len(resolver.url_patterns), (time.perf_counter() - start) * 1000
+
+
+def warm_on_boot():
+    if not getattr(settings, 'GALLERY_PREWARM_TEMPLATES', not settings.DEBUG):
+        return
+    patterns, urls_ms = warm_urls()
+    templates, templates_ms = warm_templates()
+    logger.info('Pre-warmed URLs and templates', extra={
+        'templates': templates, 'templates_ms': round(templates_ms, 1), 'urls_ms': round(urls_ms, 1),
+    })